@@ -11,8 +11,8 @@ if config.config_file_name is not None:
 from app.shared.database import Base
 from app.shared.models import (  # noqa: F401
     User, Business, UserBusinessMembership, IntegrationAccount,
-    StripeEvent, FinancialMetricSnapshot, ReadinessScore,
-    Recommendation, AgentConversation, AgentMessage,
+    StripeEvent, LedgerEntry, QuickBooksNotification, FinancialMetricSnapshot, ReadinessScore,
+    Recommendation, AgentConversation, AgentMessage, AgentContext,
 )
 
 target_metadata = Base.metadata
@@ -0,0 +1,34 @@
+"""keyset pagination indexes for agent conversations and messages
+
+Revision ID: 3f9a0d2c6e18
+Revises: b7e2c91f4a06
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = '3f9a0d2c6e18'
+down_revision: Union[str, None] = 'b7e2c91f4a06'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Seek on (created_at, id) within a conversation, in either direction;
+    # the leading conversation_id column also serves plain conversation lookups
+    op.create_index('ix_agent_messages_conversation_created_id',
+                    'agent_messages', ['conversation_id', 'created_at', 'id'])
+    op.drop_index('ix_agent_messages_conversation_id', table_name='agent_messages')
+
+    # Index-only scan for GET /agent/conversations?business_id=...
+    op.create_index('ix_agent_conversations_business_user_created',
+                    'agent_conversations', ['business_id', 'user_id', 'created_at', 'id'],
+                    postgresql_include=['updated_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_agent_conversations_business_user_created', table_name='agent_conversations')
+    op.create_index('ix_agent_messages_conversation_id',
+                    'agent_messages', ['conversation_id'])
+    op.drop_index('ix_agent_messages_conversation_created_id', table_name='agent_messages')
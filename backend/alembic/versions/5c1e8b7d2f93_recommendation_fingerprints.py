@@ -0,0 +1,32 @@
+"""recommendation fingerprints for idempotent upserts
+
+Revision ID: 5c1e8b7d2f93
+Revises: 3f9a0d2c6e18
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = '5c1e8b7d2f93'
+down_revision: Union[str, None] = '3f9a0d2c6e18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('recommendations', sa.Column('rule_key', sa.String(length=50), nullable=True))
+    op.add_column('recommendations', sa.Column('fingerprint', sa.String(length=64), nullable=True))
+    op.create_unique_constraint('uq_recommendations_fingerprint', 'recommendations', ['fingerprint'])
+
+    # Pre-fingerprint nightly duplicates can never be matched by the upsert; retire them and
+    # let the next generation run recreate one fingerprinted row per live condition
+    op.execute("UPDATE recommendations SET status = 'expired', updated_at = now() "
+               "WHERE fingerprint IS NULL AND status = 'pending'")
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_recommendations_fingerprint', 'recommendations', type_='unique')
+    op.drop_column('recommendations', 'fingerprint')
+    op.drop_column('recommendations', 'rule_key')
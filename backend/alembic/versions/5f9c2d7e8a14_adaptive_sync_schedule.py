@@ -0,0 +1,34 @@
+"""adaptive sync schedule and business activity
+
+Revision ID: 5f9c2d7e8a14
+Revises: c81f5e3a9d62
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = '5f9c2d7e8a14'
+down_revision: Union[str, None] = 'c81f5e3a9d62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('integration_accounts', sa.Column('next_sync_due_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('integration_accounts', sa.Column('change_rate', sa.Float(), nullable=True))
+    op.add_column('businesses', sa.Column('last_active_at', sa.DateTime(timezone=True), nullable=True))
+
+    # The sync scheduler claims active integrations in due order; NULL means due now
+    op.create_index('ix_integration_accounts_next_sync_due_at',
+                    'integration_accounts',
+                    ['next_sync_due_at'],
+                    postgresql_where=sa.text("status = 'active'"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_integration_accounts_next_sync_due_at', table_name='integration_accounts')
+    op.drop_column('businesses', 'last_active_at')
+    op.drop_column('integration_accounts', 'change_rate')
+    op.drop_column('integration_accounts', 'next_sync_due_at')
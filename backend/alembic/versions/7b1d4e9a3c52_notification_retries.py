@@ -0,0 +1,28 @@
+"""quickbooks notification claim lease and retry attempts
+
+Revision ID: 7b1d4e9a3c52
+Revises: d3b8e6f1c725
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = '7b1d4e9a3c52'
+down_revision: Union[str, None] = 'd3b8e6f1c725'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Rows are marked processed only after their sync succeeds; until then a claim or a retry backoff holds them
+    op.add_column('quickbooks_notifications',
+                  sa.Column('attempts', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('quickbooks_notifications',
+                  sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('quickbooks_notifications', 'next_attempt_at')
+    op.drop_column('quickbooks_notifications', 'attempts')
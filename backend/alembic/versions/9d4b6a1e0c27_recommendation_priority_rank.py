@@ -0,0 +1,36 @@
+"""numeric recommendation priority rank with top-N index
+
+Revision ID: 9d4b6a1e0c27
+Revises: 5c1e8b7d2f93
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = '9d4b6a1e0c27'
+down_revision: Union[str, None] = '5c1e8b7d2f93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('recommendations', sa.Column('priority_rank', sa.SmallInteger(), server_default='2', nullable=False))
+    op.execute("UPDATE recommendations SET priority_rank = CASE priority "
+               "WHEN 'high' THEN 3 WHEN 'low' THEN 1 ELSE 2 END")
+    op.alter_column('recommendations', 'priority_rank', server_default=None)
+
+    # Top-N per (business, status) in priority order without a sort; the INCLUDE columns make
+    # the agent's top-recommendations lookup index-only. Supersedes the business_id-only index.
+    op.create_index('ix_recommendations_business_status_rank',
+                    'recommendations',
+                    ['business_id', 'status', sa.text('priority_rank DESC'), sa.text('created_at DESC')],
+                    postgresql_include=['title', 'priority', 'estimated_impact'])
+    op.drop_index('ix_recommendations_business_id', table_name='recommendations')
+
+
+def downgrade() -> None:
+    op.create_index('ix_recommendations_business_id', 'recommendations', ['business_id'])
+    op.drop_index('ix_recommendations_business_status_rank', table_name='recommendations')
+    op.drop_column('recommendations', 'priority_rank')
@@ -0,0 +1,39 @@
+"""quickbooks webhook notification queue
+
+Revision ID: a6f3d8b2c490
+Revises: e2a7c4f91b35
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision: str = 'a6f3d8b2c490'
+down_revision: Union[str, None] = 'e2a7c4f91b35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Raw webhook notifications, appended by the receiver and drained in batches by the worker
+    op.create_table('quickbooks_notifications',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('realm_id', sa.String(length=255), nullable=False),
+    sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('processed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # The drain only ever reads unprocessed rows in arrival order
+    op.create_index('ix_quickbooks_notifications_pending',
+                    'quickbooks_notifications',
+                    ['created_at'],
+                    postgresql_where=sa.text('processed_at IS NULL'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_quickbooks_notifications_pending', table_name='quickbooks_notifications')
+    op.drop_table('quickbooks_notifications')
@@ -0,0 +1,31 @@
+"""add agent_contexts
+
+Revision ID: b7e2c91f4a06
+Revises: 8c53653b7341
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision: str = 'b7e2c91f4a06'
+down_revision: Union[str, None] = '8c53653b7341'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # One pre-rendered context blob per business, rewritten by the worker and read once per chat turn
+    op.create_table('agent_contexts',
+    sa.Column('business_id', sa.UUID(), nullable=False),
+    sa.Column('context', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['business_id'], ['businesses.id'], ),
+    sa.PrimaryKeyConstraint('business_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('agent_contexts')
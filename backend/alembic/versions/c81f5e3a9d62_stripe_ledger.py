@@ -0,0 +1,53 @@
+"""stripe event queue index and ledger entries
+
+Revision ID: c81f5e3a9d62
+Revises: a6f3d8b2c490
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'c81f5e3a9d62'
+down_revision: Union[str, None] = 'a6f3d8b2c490'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Event processors claim unprocessed rows in arrival order
+    op.create_index('ix_stripe_events_pending',
+                    'stripe_events',
+                    ['created_at'],
+                    postgresql_where=sa.text('processed_at IS NULL'))
+
+    # One row per provider object (charge, refund, dispute, payout), upserted as its events arrive
+    op.create_table('ledger_entries',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('business_id', sa.UUID(), nullable=False),
+    sa.Column('integration_id', sa.UUID(), nullable=True),
+    sa.Column('source', sa.String(length=20), nullable=False),
+    sa.Column('external_id', sa.String(length=255), nullable=False),
+    sa.Column('entry_type', sa.String(length=20), nullable=False),
+    sa.Column('status', sa.String(length=30), nullable=True),
+    sa.Column('amount', sa.Numeric(precision=15, scale=2), nullable=False),
+    sa.Column('currency', sa.String(length=3), nullable=True),
+    sa.Column('occurred_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('due_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('settled_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('source_updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['business_id'], ['businesses.id'], ),
+    sa.ForeignKeyConstraint(['integration_id'], ['integration_accounts.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('source', 'external_id', name='uq_ledger_source_external')
+    )
+    op.create_index('ix_ledger_business_type_occurred', 'ledger_entries', ['business_id', 'entry_type', 'occurred_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_ledger_business_type_occurred', table_name='ledger_entries')
+    op.drop_table('ledger_entries')
+    op.drop_index('ix_stripe_events_pending', table_name='stripe_events')
@@ -0,0 +1,49 @@
+"""snapshot granularity for multi-granularity rollups
+
+Revision ID: d3b8e6f1c725
+Revises: 5f9c2d7e8a14
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'd3b8e6f1c725'
+down_revision: Union[str, None] = '5f9c2d7e8a14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('financial_metric_snapshots',
+                  sa.Column('granularity', sa.String(length=10), server_default='trailing', nullable=False))
+    # Only the QuickBooks backfill writes calendar-month rows, and it tags them; everything else is a trailing window
+    op.execute("UPDATE financial_metric_snapshots SET granularity = 'monthly' "
+               "WHERE metrics_json->>'source' = 'quickbooks'")
+
+    # The same dates can now exist once per granularity
+    op.drop_constraint('uq_metrics_period', 'financial_metric_snapshots', type_='unique')
+    op.create_unique_constraint('uq_metrics_period', 'financial_metric_snapshots',
+                                ['business_id', 'granularity', 'period_start', 'period_end'])
+
+    # Latest-snapshot and history reads filter on one granularity per business
+    op.drop_index('ix_metric_snapshots_business_period_end', table_name='financial_metric_snapshots')
+    op.create_index('ix_metric_snapshots_business_granularity_period_end',
+                    'financial_metric_snapshots',
+                    ['business_id', 'granularity', 'period_end'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_metric_snapshots_business_granularity_period_end', table_name='financial_metric_snapshots')
+    op.execute("DELETE FROM financial_metric_snapshots WHERE granularity NOT IN ('trailing', 'monthly')")
+    op.execute("DELETE FROM financial_metric_snapshots m USING financial_metric_snapshots t "
+               "WHERE m.granularity = 'monthly' AND t.granularity = 'trailing' AND m.business_id = t.business_id "
+               "AND m.period_start = t.period_start AND m.period_end = t.period_end")
+    op.create_index('ix_metric_snapshots_business_period_end',
+                    'financial_metric_snapshots',
+                    ['business_id', 'period_end'])
+    op.drop_constraint('uq_metrics_period', 'financial_metric_snapshots', type_='unique')
+    op.create_unique_constraint('uq_metrics_period', 'financial_metric_snapshots',
+                                ['business_id', 'period_start', 'period_end'])
+    op.drop_column('financial_metric_snapshots', 'granularity')
@@ -0,0 +1,34 @@
+"""absolute OAuth token expiry on integration accounts
+
+Revision ID: e2a7c4f91b35
+Revises: 9d4b6a1e0c27
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'e2a7c4f91b35'
+down_revision: Union[str, None] = '9d4b6a1e0c27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('integration_accounts', sa.Column('token_expires_at', sa.DateTime(timezone=True), nullable=True))
+    # Tokens were last written at updated_at; that is the best anchor for the stored relative expiry
+    op.execute("UPDATE integration_accounts "
+               "SET token_expires_at = updated_at + make_interval(secs => (metadata->>'expires_in')::int) "
+               "WHERE metadata ? 'expires_in'")
+
+    # The token refresher scans active integrations by expiry
+    op.create_index('ix_integration_accounts_token_expires_at',
+                    'integration_accounts',
+                    ['token_expires_at'],
+                    postgresql_where=sa.text("status = 'active'"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_integration_accounts_token_expires_at', table_name='integration_accounts')
+    op.drop_column('integration_accounts', 'token_expires_at')
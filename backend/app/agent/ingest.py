@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+from dataclasses import dataclass, asdict
+from typing import Iterator
+import numpy as np
+from app.agent.knowledge import KnowledgeChunk, KnowledgeIndex, get_knowledge_index
+from app.agent.providers import registry, primary_provider
+from app.config import settings
+
+INGEST_EXTENSIONS = (".md", ".txt")
+# Bumped when chunk ids change meaning; files ingested under an older version are re-chunked
+STATE_VERSION = 2
+HEADING = re.compile(r"^#{1,6}\s")
+
+
+@dataclass
+class IngestReport:
+    files_seen: int = 0
+    files_unchanged: int = 0
+    files_removed: int = 0
+    chunks_embedded: int = 0
+    chunks_reused: int = 0
+    chunks_removed: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def iter_files(roots: list[str]) -> Iterator[tuple[str, str]]:
+    """Yield (absolute path, source label) for every ingestible file under the given roots."""
+    for root in roots:
+        root = os.path.abspath(root)
+        base = os.path.dirname(root)
+        if os.path.isfile(root):
+            yield root, os.path.relpath(root, base)
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith(INGEST_EXTENSIONS):
+                    path = os.path.join(dirpath, filename)
+                    yield path, os.path.relpath(path, base)
+
+
+def chunk_text(text: str, max_chars: int | None = None) -> list[str]:
+    """Split on blank lines, packing paragraphs up to max_chars and starting a new chunk at each heading."""
+    max_chars = max_chars or settings.KNOWLEDGE_CHUNK_CHARS
+    chunks: list[str] = []
+    current: list[str] = []
+    size = 0
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if current and (HEADING.match(paragraph) or size + len(paragraph) > max_chars):
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        while len(paragraph) > max_chars:
+            chunks.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        current.append(paragraph)
+        size += len(paragraph) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(" ".join(text.split()).encode()).hexdigest()
+
+
+def chunk_id(source: str, text: str) -> str:
+    """Stable per file and passage; the same passage in two files is two chunks, each with its own source."""
+    return hashlib.sha256(f"{source}\0{' '.join(text.split())}".encode()).hexdigest()
+
+
+class KnowledgeIngestor:
+    """Incrementally loads documents into the knowledge index.
+
+    State (per-file stat, file hash and chunk ids) lives next to the index, so
+    unchanged files are skipped on a stat() call and unchanged chunks are never re-embedded.
+    """
+
+    def __init__(self, index: KnowledgeIndex | None = None, state_path: str | None = None):
+        self.index = index if index is not None else get_knowledge_index()
+        self.state_path = state_path or os.path.join(settings.KNOWLEDGE_INDEX_PATH, "ingest_state.json")
+        self.batch_size = settings.KNOWLEDGE_EMBED_BATCH_SIZE
+        self.concurrency = settings.KNOWLEDGE_EMBED_CONCURRENCY
+
+    def _load_state(self) -> dict:
+        if not os.path.exists(self.state_path):
+            return {"version": STATE_VERSION, "files": {}}
+        with open(self.state_path) as f:
+            state = json.load(f)
+        if state.get("version") != STATE_VERSION:
+            # Keep each file's old chunk ids so they are deleted once the file is re-chunked
+            for entry in state["files"].values():
+                entry.update(mtime_ns=None, sha256=None)
+            state["version"] = STATE_VERSION
+        return state
+
+    def _save_state(self, state: dict) -> None:
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_path)
+
+    async def ingest(self, roots: list[str]) -> IngestReport:
+        report = IngestReport()
+        state = self._load_state()
+        files: dict[str, dict] = state["files"]
+        known = {h for entry in files.values() for h in entry["chunks"]}
+        pending: dict[str, KnowledgeChunk] = {}
+        seen: set[str] = set()
+
+        for path, source in iter_files(roots):
+            report.files_seen += 1
+            seen.add(path)
+            stat = os.stat(path)
+            entry = files.get(path)
+            if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+                report.files_unchanged += 1
+                continue
+
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+            file_hash = content_hash(text)
+            if entry and entry["sha256"] == file_hash:
+                entry.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+                report.files_unchanged += 1
+                continue
+
+            ids = []
+            for position, chunk in enumerate(chunk_text(text)):
+                i = chunk_id(source, chunk)
+                ids.append(i)
+                if i in known or i in pending:
+                    report.chunks_reused += 1
+                    continue
+                pending[i] = KnowledgeChunk(id=i, text=chunk, source=source, metadata={"position": position})
+            files[path] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": file_hash, "chunks": ids}
+
+            # Flush in large groups so memory stays bounded on big corpora
+            if len(pending) >= self.batch_size * self.concurrency:
+                report.chunks_embedded += await self._embed_and_add(list(pending.values()))
+                known.update(pending)
+                pending.clear()
+
+        if pending:
+            report.chunks_embedded += await self._embed_and_add(list(pending.values()))
+            known.update(pending)
+
+        abs_roots = [os.path.abspath(root) for root in roots]
+        for path in list(files):
+            if path not in seen and any(os.path.commonpath([path, root]) == root for root in abs_roots):
+                del files[path]
+                report.files_removed += 1
+
+        live = {h for entry in files.values() for h in entry["chunks"]}
+        stale = known - live
+        if stale:
+            await self.index.delete(stale)
+            report.chunks_removed = len(stale)
+
+        self._save_state(state)
+        return report
+
+    async def _embed_and_add(self, chunks: list[KnowledgeChunk]) -> int:
+        provider = registry.get(primary_provider())
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def embed_batch(batch: list[KnowledgeChunk]) -> list[list[float]]:
+            async with semaphore:
+                return await provider.embed([chunk.text for chunk in batch])
+
+        batches = [chunks[i:i + self.batch_size] for i in range(0, len(chunks), self.batch_size)]
+        embedded = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+        await self.index.add(chunks, np.asarray([vector for batch in embedded for vector in batch], dtype=np.float32))
+        return len(chunks)
@@ -0,0 +1,351 @@
+import asyncio
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+import numpy as np
+from app.config import settings
+
+
+@dataclass
+class KnowledgeChunk:
+    id: str
+    text: str
+    source: str
+    metadata: dict = field(default_factory=dict)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class KnowledgeIndex(ABC):
+    """Vector store behind AgentService.search_knowledge; local and Pinecone backends share this interface."""
+
+    @abstractmethod
+    async def add(self, chunks: list[KnowledgeChunk], embeddings: np.ndarray) -> None:
+        ...
+
+    @abstractmethod
+    async def query(self, embedding, top_k: int = 5, filters: dict | None = None) -> list[dict]:
+        ...
+
+    @abstractmethod
+    async def delete(self, ids: set[str]) -> None:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Live vectors in the index; may be a blocking network call."""
+
+
+class LocalVectorIndex(KnowledgeIndex):
+    """Embedded index: normalized float32 rows in a memory-mapped file, with an IVF layer once it grows.
+
+    Files under `path`:
+      manifest.json  dim, row count and IVF training size (written last, so it is the commit point)
+      vectors.f32    row-major (count, dim) float32 matrix
+      chunks.jsonl   one chunk record per row
+      centroids.npy  IVF centroids, present once count >= KNOWLEDGE_IVF_MIN_ROWS
+      lists.i32      IVF list id per row
+      tombstones.json  deleted row numbers, masked out of every search
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dim = 0
+        self.count = 0
+        self.trained_on = 0
+        self.vectors: np.ndarray | None = None
+        self.centroids: np.ndarray | None = None
+        self.lists: np.ndarray | None = None
+        self.chunks: list[dict] = []
+        self.deleted_rows: set[int] = set()
+        self._row_by_id: dict[str, int] = {}
+        self._alive: np.ndarray | None = None
+        self._postings: list[np.ndarray] | None = None
+        self._filter_masks: dict[tuple, np.ndarray] = {}
+        self._version = self._disk_version()
+        self._load()
+
+    def __len__(self) -> int:
+        return self.count - len(self.deleted_rows)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _disk_version(self) -> tuple[int, int]:
+        # Every append, retrain and delete ends by replacing the manifest or the tombstones
+        return tuple(
+            os.stat(self._file(name)).st_mtime_ns if os.path.exists(self._file(name)) else 0
+            for name in ("manifest.json", "tombstones.json")
+        )
+
+    def is_stale(self) -> bool:
+        """True once another process (the ingestion script) has changed the files since they were read."""
+        return self._disk_version() != self._version
+
+    def _load(self) -> None:
+        if not os.path.exists(self._file("manifest.json")):
+            return
+        with open(self._file("manifest.json")) as f:
+            manifest = json.load(f)
+        self.dim = manifest["dim"]
+        self.count = manifest["count"]
+        self.trained_on = manifest.get("trained_on", 0)
+        with open(self._file("chunks.jsonl")) as f:
+            self.chunks = [json.loads(line) for _, line in zip(range(self.count), f)]
+        if os.path.exists(self._file("tombstones.json")):
+            with open(self._file("tombstones.json")) as f:
+                self.deleted_rows = {row for row in json.load(f) if row < self.count}
+        self._row_by_id = {chunk["id"]: row for row, chunk in enumerate(self.chunks) if row not in self.deleted_rows}
+        self._map()
+
+    def _map(self) -> None:
+        self.vectors = None
+        self.centroids = None
+        self.lists = None
+        self._postings = None
+        self._filter_masks = {}
+        self._alive = None
+        if self.deleted_rows:
+            self._alive = np.ones(self.count, dtype=bool)
+            self._alive[list(self.deleted_rows)] = False
+        if self.count:
+            self.vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        if self.trained_on:
+            self.centroids = np.load(self._file("centroids.npy"))
+            self.lists = np.fromfile(self._file("lists.i32"), dtype=np.int32, count=self.count)
+
+    def _write_manifest(self) -> None:
+        tmp = self._file("manifest.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"dim": self.dim, "count": self.count, "trained_on": self.trained_on}, f)
+        os.replace(tmp, self._file("manifest.json"))
+        self._version = self._disk_version()
+
+    def _truncate_to_manifest(self) -> None:
+        # Drop rows from an append that crashed before the manifest was rewritten
+        for name, row_bytes in (("vectors.f32", self.dim * 4), ("lists.i32", 4)):
+            if os.path.exists(self._file(name)):
+                os.truncate(self._file(name), self.count * row_bytes)
+        if os.path.exists(self._file("chunks.jsonl")):
+            with open(self._file("chunks.jsonl"), "w") as f:
+                f.writelines(json.dumps(chunk) + "\n" for chunk in self.chunks)
+
+    async def add(self, chunks: list[KnowledgeChunk], embeddings: np.ndarray) -> None:
+        await asyncio.to_thread(self.append, chunks, embeddings)
+
+    def append(self, chunks: list[KnowledgeChunk], embeddings: np.ndarray) -> None:
+        # Re-adding a live id is a no-op, so replaying an interrupted ingestion never duplicates rows
+        keep = [i for i, chunk in enumerate(chunks) if chunk.id not in self._row_by_id]
+        if not keep:
+            return
+        chunks = [chunks[i] for i in keep]
+        vectors = _normalize(np.asarray(embeddings)[keep])
+        if self.dim and vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self.dim}")
+        os.makedirs(self.path, exist_ok=True)
+        self.dim = vectors.shape[1]
+        if self.count and os.path.getsize(self._file("vectors.f32")) != self.count * self.dim * 4:
+            self._truncate_to_manifest()
+
+        records = [{"id": c.id, "text": c.text, "source": c.source, "metadata": c.metadata} for c in chunks]
+        with open(self._file("vectors.f32"), "ab") as f:
+            vectors.tofile(f)
+        with open(self._file("chunks.jsonl"), "a") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+        if self.centroids is not None:
+            with open(self._file("lists.i32"), "ab") as f:
+                np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32).tofile(f)
+
+        for row, record in enumerate(records, start=self.count):
+            self._row_by_id[record["id"]] = row
+        self.chunks.extend(records)
+        self.count += len(records)
+        self._write_manifest()
+        self._map()
+
+        # Train once the index is big enough, and retrain after it quadruples so lists stay balanced
+        if self.count >= settings.KNOWLEDGE_IVF_MIN_ROWS and self.count >= self.trained_on * 4:
+            self.train()
+
+    async def delete(self, ids: set[str]) -> None:
+        await asyncio.to_thread(self.remove, ids)
+
+    def remove(self, ids: set[str]) -> None:
+        rows = {self._row_by_id.pop(i) for i in ids if i in self._row_by_id}
+        if not rows:
+            return
+        self.deleted_rows |= rows
+        tmp = self._file("tombstones.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(sorted(self.deleted_rows), f)
+        os.replace(tmp, self._file("tombstones.json"))
+        self._version = self._disk_version()
+        self._map()
+
+    def train(self, iterations: int = 10) -> None:
+        nlist = max(1, int(np.sqrt(self.count)))
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(self.count, size=min(self.count, nlist * 64), replace=False))
+        sample = np.asarray(self.vectors[sample_rows])
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            filled = np.bincount(assign, minlength=nlist) > 0
+            centroids[filled] = _normalize(sums[filled])
+
+        lists = np.empty(self.count, dtype=np.int32)
+        for start in range(0, self.count, 8192):
+            block = np.asarray(self.vectors[start:start + 8192])
+            lists[start:start + 8192] = np.argmax(block @ centroids.T, axis=1)
+        np.save(self._file("centroids.npy"), centroids)
+        lists.tofile(self._file("lists.i32"))
+        self.trained_on = self.count
+        self._write_manifest()
+        self._map()
+
+    def _get_postings(self) -> list[np.ndarray]:
+        if self._postings is None:
+            order = np.argsort(self.lists, kind="stable")
+            bounds = np.searchsorted(self.lists[order], np.arange(len(self.centroids) + 1))
+            self._postings = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+        return self._postings
+
+    def _filter_mask(self, filters: dict | None) -> np.ndarray | None:
+        if not filters:
+            return self._alive
+        mask = np.ones(self.count, dtype=bool) if self._alive is None else self._alive.copy()
+        for key, wanted in filters.items():
+            values = tuple(wanted) if isinstance(wanted, (list, tuple, set)) else (wanted,)
+            cache_key = (key, values)
+            if cache_key not in self._filter_masks:
+                self._filter_masks[cache_key] = np.fromiter(
+                    ((chunk["source"] if key == "source" else chunk["metadata"].get(key)) in values for chunk in self.chunks),
+                    dtype=bool,
+                    count=self.count,
+                )
+            mask &= self._filter_masks[cache_key]
+        return mask
+
+    def _top(self, scores: np.ndarray, rows: np.ndarray, top_k: int) -> list[dict]:
+        k = min(top_k, len(rows))
+        if k == 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [{**self.chunks[rows[i]], "score": float(scores[i])} for i in best]
+
+    def search(self, queries, top_k: int = 5, filters: dict | None = None) -> list[list[dict]]:
+        """Batched top-k search; one result list per query row."""
+        if not self.count:
+            return [[] for _ in np.atleast_2d(queries)]
+        q = _normalize(np.atleast_2d(queries))
+        if q.shape[1] != self.dim:
+            raise ValueError(f"Query dimension {q.shape[1]} does not match index dimension {self.dim}")
+        mask = self._filter_mask(filters)
+
+        if self.centroids is None:
+            scores = q @ self.vectors.T
+            rows = np.arange(self.count) if mask is None else np.flatnonzero(mask)
+            if mask is not None:
+                scores = scores[:, rows]
+            return [self._top(row_scores, rows, top_k) for row_scores in scores]
+
+        postings = self._get_postings()
+        nprobe = min(settings.KNOWLEDGE_NPROBE, len(self.centroids))
+        probes = np.argpartition(-(q @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        results = []
+        for query, probe in zip(q, probes):
+            rows = np.concatenate([postings[c] for c in probe])
+            if mask is not None:
+                rows = rows[mask[rows]]
+                if len(rows) < top_k:
+                    # Selective filters can empty the probed lists; the filtered set is small enough to scan
+                    rows = np.flatnonzero(mask)
+            rows.sort()
+            results.append(self._top(self.vectors[rows] @ query, rows, top_k))
+        return results
+
+    async def query(self, embedding, top_k: int = 5, filters: dict | None = None) -> list[dict]:
+        # The scan, IVF probe and first use of a filter all touch every row; keep them off the event loop
+        return (await asyncio.to_thread(self.search, embedding, top_k, filters))[0]
+
+
+class PineconeIndex(KnowledgeIndex):
+    def __init__(self):
+        from pinecone import Pinecone
+        self.index = Pinecone(api_key=settings.PINECONE_API_KEY).Index(settings.PINECONE_INDEX)
+        self._count: int | None = None
+
+    def __len__(self) -> int:
+        if self._count is None:
+            self._count = self.index.describe_index_stats().total_vector_count
+        return self._count
+
+    async def add(self, chunks: list[KnowledgeChunk], embeddings: np.ndarray) -> None:
+        vectors = [
+            {"id": chunk.id, "values": vector.tolist(), "metadata": {**chunk.metadata, "text": chunk.text, "source": chunk.source}}
+            for chunk, vector in zip(chunks, _normalize(embeddings))
+        ]
+        for start in range(0, len(vectors), 100):
+            await asyncio.to_thread(self.index.upsert, vectors=vectors[start:start + 100])
+        self._count = None
+
+    async def delete(self, ids: set[str]) -> None:
+        ids = list(ids)
+        for start in range(0, len(ids), 1000):
+            await asyncio.to_thread(self.index.delete, ids=ids[start:start + 1000])
+        self._count = None
+
+    async def query(self, embedding, top_k: int = 5, filters: dict | None = None) -> list[dict]:
+        pinecone_filter = None
+        if filters:
+            pinecone_filter = {
+                key: {"$in": list(value)} if isinstance(value, (list, tuple, set)) else {"$eq": value}
+                for key, value in filters.items()
+            }
+        response = await asyncio.to_thread(
+            self.index.query,
+            vector=_normalize(embedding).ravel().tolist(),
+            top_k=top_k,
+            filter=pinecone_filter,
+            include_metadata=True,
+        )
+        results = []
+        for match in response.matches:
+            metadata = dict(match.metadata or {})
+            text = metadata.pop("text", "")
+            source = metadata.pop("source", "")
+            results.append({"id": match.id, "text": text, "source": source, "metadata": metadata, "score": match.score})
+        return results
+
+
+_index: KnowledgeIndex | None = None
+# Callers open the index from worker threads; only one may build it
+_index_lock = threading.Lock()
+
+
+def get_knowledge_index() -> KnowledgeIndex:
+    """The process-wide index, reopened when ingestion has changed the local files.
+
+    A reload builds a new index and swaps it in, so searches already holding the old one
+    finish against a consistent snapshot.
+    """
+    global _index
+    with _index_lock:
+        if isinstance(_index, LocalVectorIndex) and _index.is_stale():
+            _index = None
+        if _index is None:
+            if settings.KNOWLEDGE_BACKEND == "pinecone":
+                _index = PineconeIndex()
+            else:
+                _index = LocalVectorIndex(settings.KNOWLEDGE_INDEX_PATH)
+        return _index
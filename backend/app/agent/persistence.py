@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from uuid import UUID
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.shared.database import AsyncSessionLocal
+from app.shared.models import AgentMessage
+from app.jobs.batch import is_transient
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+async def insert_messages(db: AsyncSession, rows: list[dict]) -> list[UUID]:
+    """Insert message rows (ids generated by the caller) in one multi-row INSERT ... RETURNING."""
+    result = await db.execute(insert(AgentMessage).values(rows).returning(AgentMessage.id))
+    return list(result.scalars().all())
+
+
+class MessageWriter:
+    """Write-behind buffer for agent messages.
+
+    Rows from every conversation are batched and flushed in INSERTs of at most
+    AGENT_WRITE_BATCH_SIZE rows every AGENT_WRITE_FLUSH_SECONDS, or sooner once a batch is waiting.
+    A batch that fails on a lost connection stays buffered for the next tick. One that fails
+    on its data is retried row by row, and rows that still fail are logged and dropped, so a
+    single bad row (say, for a deleted conversation) never blocks everyone else's.
+    The buffer holds at most AGENT_WRITE_MAX_BUFFER rows; when full, enqueue() refuses and
+    the caller writes inline. stop() drains the buffer batch by batch.
+    """
+
+    def __init__(self):
+        self._buffer: list[dict] = []
+        self._inflight: list[dict] = []
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        self.dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._closing
+
+    async def start(self) -> None:
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._closing = True
+        self._wakeup.set()
+        if self._task:
+            await self._task
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Database unavailable at shutdown; %d agent messages were not saved", len(self._buffer))
+            self.dropped += len(self._buffer)
+            self._buffer = []
+
+    def enqueue(self, rows: list[dict]) -> bool:
+        """Buffer rows for the next flush; False when the buffer is full and the caller must write them itself."""
+        if len(self._buffer) + len(rows) > settings.AGENT_WRITE_MAX_BUFFER:
+            return False
+        self._buffer.extend(rows)
+        if len(self._buffer) >= settings.AGENT_WRITE_BATCH_SIZE:
+            self._wakeup.set()
+        return True
+
+    def pending_for(self, conversation_id: UUID) -> list[dict]:
+        return [row for row in (*self._inflight, *self._buffer) if row["conversation_id"] == conversation_id]
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.AGENT_WRITE_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.warning("Agent message flush failed; %d rows stay buffered", len(self._buffer), exc_info=True)
+
+    async def flush(self) -> None:
+        """Write the buffer a batch at a time; on a transient failure the unwritten rows stay buffered and it raises."""
+        while self._buffer:
+            size = settings.AGENT_WRITE_BATCH_SIZE
+            self._inflight, self._buffer = self._buffer[:size], self._buffer[size:]
+            try:
+                await self._write(self._inflight)
+            except Exception:
+                self._buffer[:0] = self._inflight
+                raise
+            finally:
+                self._inflight = []
+
+    async def _write(self, rows: list[dict]) -> None:
+        try:
+            async with AsyncSessionLocal() as db:
+                await insert_messages(db, rows)
+                await db.commit()
+            return
+        except Exception as exc:
+            if is_transient(exc):
+                raise
+        # The batch was rejected for its data: isolate the offending rows behind savepoints
+        async with AsyncSessionLocal() as db:
+            for row in rows:
+                try:
+                    async with db.begin_nested():
+                        await insert_messages(db, [row])
+                except Exception as exc:
+                    if is_transient(exc):
+                        raise
+                    self.dropped += 1
+                    logger.error(
+                        "Dropping agent message %s for conversation %s: %s", row["id"], row["conversation_id"], exc
+                    )
+            await db.commit()
+
+
+message_writer = MessageWriter()
@@ -0,0 +1,185 @@
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+import httpx
+from app.shared.serialization import loads
+from app.config import settings
+
+
+@dataclass
+class LLMResponse:
+    content: str
+    provider: str
+    latency_ms: float
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+@dataclass
+class ProviderStats:
+    calls: int = 0
+    errors: int = 0
+    total_latency_ms: float = 0.0
+    last_latency_ms: float | None = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "avg_latency_ms": self.total_latency_ms / self.calls if self.calls else None,
+            "last_latency_ms": self.last_latency_ms,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+        }
+
+
+class LLMProvider(ABC):
+    """Long-lived provider client backed by a pooled httpx.AsyncClient."""
+
+    name = ""
+
+    def __init__(self, timeout: float, max_connections: int, base_url: str = ""):
+        self.timeout = timeout
+        self.stats = ProviderStats()
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(timeout, connect=settings.LLM_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=settings.LLM_KEEPALIVE_SECONDS,
+            ),
+        )
+
+    async def generate(self, messages: list[dict]) -> LLMResponse:
+        start = time.perf_counter()
+        try:
+            content, prompt_tokens, completion_tokens = await self._generate(messages)
+        except Exception:
+            self.stats.errors += 1
+            raise
+        finally:
+            latency_ms = (time.perf_counter() - start) * 1000
+            self.stats.calls += 1
+            self.stats.total_latency_ms += latency_ms
+            self.stats.last_latency_ms = latency_ms
+        self.stats.prompt_tokens += prompt_tokens
+        self.stats.completion_tokens += completion_tokens
+        return LLMResponse(content, self.name, latency_ms, prompt_tokens, completion_tokens)
+
+    @abstractmethod
+    async def _generate(self, messages: list[dict]) -> tuple[str, int, int]:
+        """Content, prompt tokens and completion tokens for one chat completion."""
+
+    @abstractmethod
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        """One embedding per text, in order."""
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+
+    def __init__(self):
+        super().__init__(settings.OPENAI_TIMEOUT_SECONDS, settings.OPENAI_MAX_CONNECTIONS)
+        self._client = None
+
+    @property
+    def client(self):
+        # Built on first use so a missing API key surfaces per call instead of failing startup
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                http_client=self.http,
+                timeout=self.timeout,
+                max_retries=0,
+            )
+        return self._client
+
+    async def _generate(self, messages: list[dict]) -> tuple[str, int, int]:
+        response = await self.client.chat.completions.create(
+            model=settings.OPENAI_MODEL,
+            messages=messages,
+            max_tokens=1024,
+        )
+        usage = response.usage
+        return (
+            response.choices[0].message.content,
+            usage.prompt_tokens if usage else 0,
+            usage.completion_tokens if usage else 0,
+        )
+
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        response = await self.client.embeddings.create(model=settings.OPENAI_EMBEDDING_MODEL, input=texts)
+        if response.usage:
+            self.stats.prompt_tokens += response.usage.prompt_tokens
+        return [item.embedding for item in response.data]
+
+
+class OllamaProvider(LLMProvider):
+    name = "ollama"
+
+    def __init__(self):
+        super().__init__(settings.OLLAMA_TIMEOUT_SECONDS, settings.OLLAMA_MAX_CONNECTIONS, settings.OLLAMA_BASE_URL)
+
+    async def _generate(self, messages: list[dict]) -> tuple[str, int, int]:
+        response = await self.http.post(
+            "/api/chat",
+            json={"model": settings.OLLAMA_MODEL, "messages": messages, "stream": False},
+        )
+        response.raise_for_status()
+        data = loads(response.content)
+        return data["message"]["content"], data.get("prompt_eval_count", 0), data.get("eval_count", 0)
+
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        response = await self.http.post("/api/embed", json={"model": settings.OLLAMA_EMBEDDING_MODEL, "input": texts})
+        response.raise_for_status()
+        data = loads(response.content)
+        self.stats.prompt_tokens += data.get("prompt_eval_count", 0)
+        return data["embeddings"]
+
+
+PROVIDERS: dict[str, type[LLMProvider]] = {
+    OpenAIProvider.name: OpenAIProvider,
+    OllamaProvider.name: OllamaProvider,
+}
+
+
+def primary_provider() -> str:
+    return settings.LLM_PROVIDER if settings.LLM_PROVIDER in PROVIDERS else OpenAIProvider.name
+
+
+class ProviderRegistry:
+    """Process-wide set of provider clients, opened once and reused by every chat turn."""
+
+    def __init__(self):
+        self._providers: dict[str, LLMProvider] = {}
+
+    async def startup(self) -> None:
+        self.get(primary_provider())
+
+    async def shutdown(self) -> None:
+        for provider in self._providers.values():
+            await provider.aclose()
+        self._providers.clear()
+
+    def get(self, name: str) -> LLMProvider:
+        # Workers and scripts never run the FastAPI lifespan, so providers are created on first use
+        provider = self._providers.get(name)
+        if provider is None:
+            if name not in PROVIDERS:
+                raise ValueError(f"Unknown LLM provider: {name}")
+            provider = PROVIDERS[name]()
+            self._providers[name] = provider
+        return provider
+
+    def stats(self) -> dict:
+        return {name: provider.stats.as_dict() for name, provider in self._providers.items()}
+
+
+registry = ProviderRegistry()
@@ -1,13 +1,18 @@
 from uuid import UUID
-from fastapi import APIRouter, Depends
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.shared.serialization import FastJSONRoute
 from app.shared.database import get_db
 from app.shared.deps import get_current_user
 from app.shared.models import User
-from app.agent.schemas import ChatRequest, ChatResponse, ConversationResponse
+from app.agent.schemas import ChatRequest, ChatResponse, ConversationResponse, ConversationListResponse
 from app.agent.service import AgentService
+from app.agent.providers import registry
+from app.agent.scheduler import scheduler
+from app.users.service import UsersService
 
-router = APIRouter(prefix="/agent", tags=["agent"])
+router = APIRouter(prefix="/agent", tags=["agent"], route_class=FastJSONRoute)
 
 
 @router.post("/chat", response_model=ChatResponse)
@@ -19,10 +24,30 @@ async def chat(
     return await AgentService(db).chat(data.business_id, current_user.id, data.message, data.conversation_id)
 
 
+@router.get("/conversations", response_model=ConversationListResponse)
+async def list_conversations(
+    business_id: UUID,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    await UsersService(db).assert_business_member(business_id, current_user.id)
+    return await AgentService(db).list_conversations(business_id, current_user.id, limit, cursor)
+
+
 @router.get("/conversations/{conversation_id}", response_model=ConversationResponse)
 async def get_conversation(
     conversation_id: UUID,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    order: str = Query("asc", pattern="^(asc|desc)$"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    return await AgentService(db).get_conversation(conversation_id, current_user.id)
+    return await AgentService(db).get_conversation(conversation_id, current_user.id, limit, cursor, order)
+
+
+@router.get("/llm/stats")
+async def get_llm_stats(current_user: User = Depends(get_current_user)):
+    return {"providers": registry.stats(), "scheduler": scheduler.stats()}
@@ -0,0 +1,169 @@
+import asyncio
+import time
+from bisect import bisect_left
+from app.agent.providers import LLMResponse, registry, primary_provider, PROVIDERS
+from app.config import settings
+
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000)
+
+
+class LLMOverloadedError(Exception):
+    pass
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+
+    def observe(self, value_ms: float) -> None:
+        self.counts[bisect_left(BUCKETS_MS, value_ms)] += 1
+        self.count += 1
+        self.sum_ms += value_ms
+
+    def as_dict(self) -> dict:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip([*BUCKETS_MS, "+Inf"], self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {"count": self.count, "sum_ms": self.sum_ms, "buckets": buckets}
+
+
+def _remaining(deadline: float) -> float:
+    return deadline - time.monotonic()
+
+
+class ProviderLane:
+    """Bounded concurrency queue in front of a single provider."""
+
+    def __init__(self, provider_name: str, concurrency: int, max_queue: int):
+        self.provider_name = provider_name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.waiting = 0
+        self.in_flight = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.queue_wait = Histogram()
+        self.service_time = Histogram()
+
+    async def run(self, messages: list[dict], deadline: float) -> LLMResponse:
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise LLMOverloadedError(f"{self.provider_name} queue is full")
+
+        enqueued = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=max(_remaining(deadline), 0))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.waiting -= 1
+
+        started = time.monotonic()
+        self.queue_wait.observe((started - enqueued) * 1000)
+        self.in_flight += 1
+        try:
+            provider = registry.get(self.provider_name)
+            return await asyncio.wait_for(provider.generate(messages), timeout=max(_remaining(deadline), 0))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.service_time.observe((time.monotonic() - started) * 1000)
+            self.semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "queue_wait_ms": self.queue_wait.as_dict(),
+            "service_time_ms": self.service_time.as_dict(),
+        }
+
+
+LANE_CONCURRENCY = {
+    "openai": lambda: settings.OPENAI_MAX_CONCURRENCY,
+    "ollama": lambda: settings.OLLAMA_MAX_CONCURRENCY,
+}
+
+
+class LLMScheduler:
+    """Routes chat completions through per-provider lanes with hedging and fallback."""
+
+    def __init__(self):
+        self._lanes: dict[str, ProviderLane] = {}
+        self.hedged = 0
+        self.fallbacks = 0
+
+    def lane(self, name: str) -> ProviderLane:
+        lane = self._lanes.get(name)
+        if lane is None:
+            lane = ProviderLane(name, LANE_CONCURRENCY[name](), settings.LLM_MAX_QUEUE)
+            self._lanes[name] = lane
+        return lane
+
+    def fallback_provider(self, primary: str) -> str | None:
+        fallback = settings.LLM_FALLBACK_PROVIDER
+        if fallback in PROVIDERS and fallback != primary:
+            return fallback
+        return None
+
+    async def generate(self, messages: list[dict], timeout: float | None = None) -> LLMResponse:
+        deadline = time.monotonic() + (timeout or settings.LLM_REQUEST_DEADLINE_SECONDS)
+        primary = primary_provider()
+        try:
+            return await self._hedged(primary, messages, deadline)
+        except Exception:
+            fallback = self.fallback_provider(primary)
+            if fallback is None or _remaining(deadline) <= 0:
+                raise
+            self.fallbacks += 1
+            return await self.lane(fallback).run(messages, deadline)
+
+    async def _hedged(self, name: str, messages: list[dict], deadline: float) -> LLMResponse:
+        lane = self.lane(name)
+        hedge_after = settings.LLM_HEDGE_AFTER_SECONDS
+        if hedge_after <= 0 or hedge_after >= _remaining(deadline):
+            return await lane.run(messages, deadline)
+
+        # Cancelled callers must not orphan an attempt, which would hold a lane slot until its deadline
+        pending = {asyncio.create_task(lane.run(messages, deadline))}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=hedge_after)
+            if done:
+                return done.pop().result()
+
+            # The first attempt is slower than expected; race a duplicate and keep whichever finishes first
+            self.hedged += 1
+            pending.add(asyncio.create_task(lane.run(messages, deadline)))
+            error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "hedged": self.hedged,
+            "fallbacks": self.fallbacks,
+            "lanes": {name: lane.stats() for name, lane in self._lanes.items()},
+        }
+
+
+scheduler = LLMScheduler()
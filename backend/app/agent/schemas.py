@@ -18,6 +18,7 @@ class ChatResponse(BaseModel):
 
 
 class MessageResponse(BaseModel):
+    id: UUID
     role: str
     content: str
     created_at: datetime
@@ -30,6 +31,18 @@ class ConversationResponse(BaseModel):
     id: UUID
     business_id: UUID
     messages: list[MessageResponse]
+    next_cursor: Optional[str] = None
 
     class Config:
         from_attributes = True
+
+
+class ConversationSummary(BaseModel):
+    id: UUID
+    created_at: datetime
+    updated_at: datetime
+
+
+class ConversationListResponse(BaseModel):
+    conversations: list[ConversationSummary]
+    next_cursor: Optional[str] = None
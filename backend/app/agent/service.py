@@ -1,16 +1,51 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone
 from uuid import UUID
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, delete, func, tuple_
+from sqlalchemy.dialects.postgresql import insert
 from fastapi import HTTPException
-from app.shared.models import AgentConversation, AgentMessage
+from redis.exceptions import RedisError
+from app.shared.models import AgentConversation, AgentMessage, AgentContext, Business
+from app.agent.providers import registry, primary_provider
+from app.agent.knowledge import get_knowledge_index
+from app.agent.scheduler import scheduler
+from app.agent.persistence import insert_messages, message_writer
+from app.jobs.pipeline import enqueue_stage, get_job_pool
+from app.shared.pagination import encode_cursor, decode_cursor
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
+
+def _keyset_page(query, model, limit: int, cursor: str | None, order: str):
+    """Order by (created_at, id) and seek past the cursor; fetches one extra row to detect a next page."""
+    key = tuple_(model.created_at, model.id)
+    if cursor:
+        after = tuple_(*decode_cursor(cursor))
+        query = query.where(key < after if order == "desc" else key > after)
+    if order == "desc":
+        query = query.order_by(model.created_at.desc(), model.id.desc())
+    else:
+        query = query.order_by(model.created_at.asc(), model.id.asc())
+    return query.limit(limit + 1)
+
+
+def _split_page(rows, limit: int) -> tuple[list, str | None]:
+    if len(rows) <= limit:
+        return list(rows), None
+    page = list(rows[:limit])
+    return page, encode_cursor(page[-1]["created_at"], page[-1]["id"])
+
 
 class AgentService:
     def __init__(self, db: AsyncSession):
         self.db = db
 
     async def chat(self, business_id: UUID, user_id: UUID, message: str, conversation_id: UUID | None = None) -> dict:
+        received_at = datetime.now(timezone.utc)
         if conversation_id:
             result = await self.db.execute(
                 select(AgentConversation).where(AgentConversation.id == conversation_id)
@@ -19,27 +54,27 @@ class AgentService:
             if not conversation:
                 raise HTTPException(status_code=404, detail={"error": {"code": "NOT_FOUND", "message": "Conversation not found"}})
         else:
-            conversation = AgentConversation(business_id=business_id, user_id=user_id)
+            # Committed up front so write-behind message rows never race the conversation's FK
+            conversation = AgentConversation(id=uuid.uuid4(), business_id=business_id, user_id=user_id)
             self.db.add(conversation)
-            await self.db.flush()
+            await self.db.commit()
 
+        context = await self.get_context(business_id)
         tool_results = {}
         msg_lower = message.lower()
         if any(kw in msg_lower for kw in ["readiness", "score", "ready", "funding"]):
-            tool_results["readiness"] = await self.get_readiness_breakdown(business_id)
+            tool_results["readiness"] = context.get("readiness", {})
         if any(kw in msg_lower for kw in ["recommend", "improve", "fix", "action"]):
-            tool_results["recommendations"] = await self.get_top_recommendations(business_id)
+            tool_results["recommendations"] = context.get("recommendations", [])
         if any(kw in msg_lower for kw in ["metric", "revenue", "chargeback", "payout"]):
-            tool_results["metrics"] = await self.get_metric_summary(business_id)
+            tool_results["metrics"] = context.get("metrics", {})
 
-        tool_results["business"] = await self.get_business_context(business_id)
+        tool_results["business"] = context.get("business", {})
+        knowledge = await self.search_knowledge(message)
+        if knowledge:
+            tool_results["knowledge"] = knowledge
 
-        history_result = await self.db.execute(
-            select(AgentMessage)
-            .where(AgentMessage.conversation_id == conversation.id)
-            .order_by(AgentMessage.created_at.asc())
-        )
-        history = history_result.scalars().all()
+        history = await self._load_messages(conversation.id)
 
         messages = [
             {
@@ -53,45 +88,127 @@ class AgentService:
             }
         ]
         for msg in history:
-            messages.append({"role": msg.role, "content": msg.content})
+            messages.append({"role": msg["role"], "content": msg["content"]})
         messages.append({"role": "user", "content": message})
 
         llm_response = await self._call_llm(messages)
 
-        user_msg = AgentMessage(conversation_id=conversation.id, role="user", content=message)
-        assistant_msg = AgentMessage(conversation_id=conversation.id, role="assistant", content=llm_response)
-        self.db.add(user_msg)
-        self.db.add(assistant_msg)
-        await self.db.commit()
-        await self.db.refresh(assistant_msg)
+        rows = [
+            {"id": uuid.uuid4(), "conversation_id": conversation.id, "role": "user", "content": message, "created_at": received_at},
+            {"id": uuid.uuid4(), "conversation_id": conversation.id, "role": "assistant", "content": llm_response, "created_at": datetime.now(timezone.utc)},
+        ]
+        if not (settings.AGENT_WRITE_BEHIND and message_writer.running and message_writer.enqueue(rows)):
+            await insert_messages(self.db, rows)
+            await self.db.commit()
 
         return {
             "conversation_id": conversation.id,
-            "message_id": assistant_msg.id,
+            "message_id": rows[1]["id"],
             "response": llm_response,
             "tool_calls": list(tool_results.keys()),
         }
 
-    async def get_conversation(self, conversation_id: UUID, user_id: UUID) -> dict:
+    async def get_conversation(
+        self, conversation_id: UUID, user_id: UUID, limit: int = 50, cursor: str | None = None, order: str = "asc"
+    ) -> dict:
         result = await self.db.execute(
-            select(AgentConversation).where(AgentConversation.id == conversation_id)
+            select(AgentConversation.id, AgentConversation.business_id, AgentConversation.user_id)
+            .where(AgentConversation.id == conversation_id)
         )
-        conversation = result.scalar_one_or_none()
+        conversation = result.mappings().one_or_none()
         if not conversation:
             raise HTTPException(status_code=404, detail={"error": {"code": "NOT_FOUND", "message": "Conversation not found"}})
-        if conversation.user_id != user_id:
+        if conversation["user_id"] != user_id:
             raise HTTPException(status_code=403, detail={"error": {"code": "FORBIDDEN", "message": "Access denied"}})
-        messages_result = await self.db.execute(
-            select(AgentMessage)
+
+        query = _keyset_page(
+            select(AgentMessage.id, AgentMessage.role, AgentMessage.content, AgentMessage.created_at)
+            .where(AgentMessage.conversation_id == conversation_id),
+            AgentMessage, limit, cursor, order,
+        )
+        rows = list((await self.db.execute(query)).mappings().all())
+        pending = message_writer.pending_for(conversation_id)
+        if pending:
+            # Write-behind rows are not in the table yet; apply the same cursor and ordering to them
+            after = decode_cursor(cursor) if cursor else None
+            descending = order == "desc"
+            rows += [
+                row for row in pending
+                if after is None or ((row["created_at"], row["id"]) < after if descending else (row["created_at"], row["id"]) > after)
+            ]
+            rows = sorted(rows, key=lambda row: (row["created_at"], row["id"]), reverse=descending)[:limit + 1]
+        messages, next_cursor = _split_page(rows, limit)
+        return {
+            "id": conversation["id"],
+            "business_id": conversation["business_id"],
+            "messages": messages,
+            "next_cursor": next_cursor,
+        }
+
+    async def list_conversations(self, business_id: UUID, user_id: UUID, limit: int = 20, cursor: str | None = None) -> dict:
+        query = _keyset_page(
+            select(AgentConversation.id, AgentConversation.created_at, AgentConversation.updated_at)
+            .where(AgentConversation.business_id == business_id, AgentConversation.user_id == user_id),
+            AgentConversation, limit, cursor, "desc",
+        )
+        rows = (await self.db.execute(query)).mappings().all()
+        conversations, next_cursor = _split_page(rows, limit)
+        return {"conversations": conversations, "next_cursor": next_cursor}
+
+    async def _load_messages(self, conversation_id: UUID) -> list[dict]:
+        result = await self.db.execute(
+            select(AgentMessage.role, AgentMessage.content, AgentMessage.created_at)
             .where(AgentMessage.conversation_id == conversation_id)
-            .order_by(AgentMessage.created_at.asc())
+            .order_by(AgentMessage.created_at.asc(), AgentMessage.id.asc())
         )
+        return [*result.mappings().all(), *message_writer.pending_for(conversation_id)]
+
+    async def get_context(self, business_id: UUID) -> dict:
+        """Load the precomputed context blob.
+
+        On a miss the worker is asked to build it, and this turn answers from the business
+        profile alone; the full rebuild never runs on the chat path.
+        """
+        result = await self.db.execute(select(AgentContext.context).where(AgentContext.business_id == business_id))
+        context = result.scalar_one_or_none()
+        if context is None:
+            await self._enqueue_context(business_id)
+            context = {"business": await self.get_business_context(business_id)}
+        return context
+
+    async def _enqueue_context(self, *business_ids: UUID) -> None:
+        try:
+            for business_id in business_ids:
+                await enqueue_stage(get_job_pool(), "context", business_id)
+        except RedisError:
+            pass  # the next recommendations run, or the next chat miss, rebuilds it
+
+    async def build_context(self, business_id: UUID) -> dict:
         return {
-            "id": conversation.id,
-            "business_id": conversation.business_id,
-            "messages": messages_result.scalars().all(),
+            "readiness": await self.get_readiness_breakdown(business_id),
+            "recommendations": await self.get_top_recommendations(business_id),
+            "metrics": await self.get_metric_summary(business_id),
+            "business": await self.get_business_context(business_id),
         }
 
+    async def refresh_context(self, business_id: UUID) -> dict:
+        context = await self.build_context(business_id)
+        stmt = insert(AgentContext).values(business_id=business_id, context=context)
+        await self.db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[AgentContext.business_id],
+                set_={"context": stmt.excluded.context, "updated_at": func.now()},
+            )
+        )
+        await self.db.commit()
+        return context
+
+    async def invalidate_context(self, *business_ids: UUID) -> None:
+        """Drop stale contexts and have the worker rebuild them before the next chat needs them."""
+        await self.db.execute(delete(AgentContext).where(AgentContext.business_id.in_(business_ids)))
+        await self.db.commit()
+        await self._enqueue_context(*business_ids)
+
     async def get_readiness_breakdown(self, business_id: UUID) -> dict:
         from app.metrics.service import MetricsService
         try:
@@ -102,8 +219,7 @@ class AgentService:
 
     async def get_top_recommendations(self, business_id: UUID, limit: int = 5) -> list:
         from app.recommendations.service import RecommendationsService
-        recs = await RecommendationsService(self.db).get_recommendations(business_id, status="pending")
-        return [{"title": r.title, "priority": r.priority, "estimated_impact": r.estimated_impact} for r in recs[:limit]]
+        return await RecommendationsService(self.db).get_top_recommendations(business_id, limit)
 
     async def get_metric_summary(self, business_id: UUID) -> dict:
         from app.metrics.service import MetricsService
@@ -119,46 +235,29 @@ class AgentService:
             return {}
 
     async def get_business_context(self, business_id: UUID) -> dict:
-        from app.shared.models import Business
-        result = await self.db.execute(select(Business).where(Business.id == business_id))  # type: ignore
-        # avoid circular import — Business is in shared models
-        from app.shared.models import Business as B
-        result = await self.db.execute(select(B).where(B.id == business_id))
+        result = await self.db.execute(select(Business).where(Business.id == business_id))
         business = result.scalar_one_or_none()
         if not business:
             return {}
         return {"name": business.name, "industry": business.industry, "revenue_estimate": float(business.revenue_estimate) if business.revenue_estimate else None}
 
-    async def search_knowledge(self, query: str, top_k: int = 5) -> list[dict]:
-        return []
-
-    async def _call_llm(self, messages: list[dict]) -> str:
-        if settings.LLM_PROVIDER == "ollama":
-            return await self._call_ollama(messages)
-        return await self._call_openai(messages)
-
-    async def _call_openai(self, messages: list[dict]) -> str:
+    async def search_knowledge(self, query: str, top_k: int = 5, filters: dict | None = None) -> list[dict]:
+        # Search is best-effort context for the chat turn: failures are logged, never raised
         try:
-            from openai import AsyncOpenAI
-            client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-            response = await client.chat.completions.create(
-                model=settings.OPENAI_MODEL,
-                messages=messages,
-                max_tokens=1024,
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            return f"I'm unable to respond at the moment. Please check your OpenAI configuration. ({e})"
+            # Opening the index reads files or calls Pinecone, and Pinecone's count is a blocking request
+            index = await asyncio.to_thread(get_knowledge_index)
+            if not await asyncio.to_thread(len, index):
+                return []
+            embedding = (await registry.get(primary_provider()).embed([query]))[0]
+            matches = await index.query(embedding, top_k, filters)
+        except Exception:
+            logger.exception("Knowledge search failed")
+            return []
+        return [{"text": m["text"], "source": m["source"], "score": m["score"]} for m in matches]
 
-    async def _call_ollama(self, messages: list[dict]) -> str:
+    async def _call_llm(self, messages: list[dict]) -> str:
         try:
-            import httpx
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{settings.OLLAMA_BASE_URL}/api/chat",
-                    json={"model": settings.OLLAMA_MODEL, "messages": messages, "stream": False},
-                    timeout=60,
-                )
-                return response.json()["message"]["content"]
+            response = await scheduler.generate(messages)
+            return response.content
         except Exception as e:
-            return f"I'm unable to respond at the moment. Please check your Ollama configuration. ({e})"
+            return f"I'm unable to respond at the moment. Please check your {primary_provider()} configuration. ({e!r})"
@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.shared.serialization import FastJSONRoute
 from app.shared.database import get_db
 from app.shared.deps import get_current_user
 from app.shared.models import User
 from app.auth.schemas import SignupRequest, LoginRequest, TokenResponse
 
-router = APIRouter(prefix="/auth", tags=["auth"])
+router = APIRouter(prefix="/auth", tags=["auth"], route_class=FastJSONRoute)
 
 
 @router.post("/signup", response_model=TokenResponse, status_code=201)
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterable, TypeVar
+import httpx
+from fastapi import HTTPException
+from redis.exceptions import RedisError
+from sqlalchemy.exc import DBAPIError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.shared.database import AsyncSessionLocal
+from app.shared.locks import LeaseNotAcquired
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Error codes that mean "try again later", after the QuickBooks client's own retries ran out
+TRANSIENT_CODES = {"QUICKBOOKS_UNAVAILABLE", "QUICKBOOKS_RATE_LIMITED"}
+# Another worker holds the account; nothing failed
+SKIP_CODES = {"SYNC_IN_PROGRESS"}
+
+
+def _error_code(exc: HTTPException) -> str | None:
+    detail = exc.detail if isinstance(exc.detail, dict) else {}
+    return detail.get("error", {}).get("code")
+
+
+def is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, HTTPException):
+        return _error_code(exc) in TRANSIENT_CODES
+    if isinstance(exc, DBAPIError):
+        return isinstance(exc, OperationalError) or exc.connection_invalidated
+    return isinstance(exc, (httpx.TransportError, RedisError, OSError, asyncio.TimeoutError))
+
+
+def _is_skip(exc: BaseException) -> bool:
+    return isinstance(exc, LeaseNotAcquired) or (isinstance(exc, HTTPException) and _error_code(exc) in SKIP_CODES)
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter, as in the QuickBooks client
+    return random.uniform(0, min(settings.WORKER_RETRY_MAX_SECONDS, settings.WORKER_RETRY_BASE_SECONDS * 2 ** attempt))
+
+
+@dataclass
+class AccountOutcome:
+    key: str
+    status: str  # "ok", "skipped" or "failed"
+    attempts: int
+    duration: float
+    error: str | None = None
+
+
+@dataclass
+class BatchReport:
+    job: str
+    outcomes: list[AccountOutcome] = field(default_factory=list)
+
+    @property
+    def failed(self) -> list[AccountOutcome]:
+        return [outcome for outcome in self.outcomes if outcome.status == "failed"]
+
+    def summary(self) -> dict:
+        """Compact enough to be the arq job result."""
+        counts = {"ok": 0, "skipped": 0, "failed": 0}
+        for outcome in self.outcomes:
+            counts[outcome.status] += 1
+        durations = sorted(outcome.duration for outcome in self.outcomes)
+        return {
+            "job": self.job,
+            **counts,
+            "slowest_seconds": round(durations[-1], 3) if durations else 0.0,
+            "failed_accounts": {outcome.key: outcome.error for outcome in self.failed},
+        }
+
+
+async def run_batch(
+    job: str,
+    items: Iterable[T],
+    handler: Callable[[AsyncSession, T], Awaitable[Any]],
+    concurrency: int | None = None,
+) -> BatchReport:
+    """Run handler once per item, each in its own session and transaction.
+
+    A failing item is rolled back and closed on its own; it never poisons the session of
+    the items after it. Transient errors (lost DB connections, Redis, QuickBooks
+    unavailability) are retried with backoff up to WORKER_MAX_ATTEMPTS. Items run
+    WORKER_BATCH_CONCURRENCY at a time so one slow tenant doesn't hold up the rest.
+    """
+    report = BatchReport(job)
+    semaphore = asyncio.Semaphore(concurrency or settings.WORKER_BATCH_CONCURRENCY)
+
+    async def run_one(item: T) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            for attempt in range(1, settings.WORKER_MAX_ATTEMPTS + 1):
+                try:
+                    async with AsyncSessionLocal() as db:
+                        await handler(db, item)
+                    status, error = "ok", None
+                    break
+                except Exception as e:
+                    if _is_skip(e):
+                        status, error = "skipped", None
+                        break
+                    status, error = "failed", f"{type(e).__name__}: {e}"
+                    if not is_transient(e) or attempt == settings.WORKER_MAX_ATTEMPTS:
+                        break
+                    await asyncio.sleep(_backoff(attempt - 1))
+            report.outcomes.append(AccountOutcome(str(item), status, attempt, time.perf_counter() - started, error))
+
+    await asyncio.gather(*(run_one(item) for item in items))
+    if report.failed:
+        logger.warning("%s: %d of %d accounts failed: %s", job, len(report.failed), len(report.outcomes), report.summary()["failed_accounts"])
+    return report
@@ -0,0 +1,73 @@
+from uuid import UUID
+from arq.connections import ArqRedis
+from app.shared.redis import get_redis
+
+# Per-business stages in order; each enqueues the next only when it changed something
+STAGES = {
+    "sync": "sync_business",
+    "metrics": "compute_business_metrics",
+    "readiness": "compute_business_readiness",
+    "recommendations": "generate_business_recommendations",
+    "backfill": "backfill_quickbooks_history",  # once per connection, outside the chain
+    "context": "refresh_business_context",  # after an edit or a chat that found no context
+    "activity": "record_business_activity",  # a member viewed the business
+}
+# Coalesces bursts (a webhook batch, a Stripe drain) into one run per business and stage
+STAGE_DEFER_SECONDS = 1
+# A dirty flag outlives any run; an abandoned one only causes one extra run
+DIRTY_TTL_SECONDS = 24 * 3600
+
+_pool: ArqRedis | None = None
+
+
+def job_id(stage: str, business_id: UUID) -> str:
+    return f"{stage}:{business_id}"
+
+
+def dirty_key(stage: str, business_id: UUID) -> str:
+    return f"pipeline:dirty:{stage}:{business_id}"
+
+
+def get_job_pool() -> ArqRedis:
+    """Enqueueing client for the API process, sharing the process-wide Redis connections."""
+    global _pool
+    if _pool is None:
+        _pool = ArqRedis(connection_pool=get_redis().connection_pool)
+    return _pool
+
+
+async def _enqueue(redis: ArqRedis, stage: str, business_id: UUID, _job_id: str) -> bool:
+    job = await redis.enqueue_job(STAGES[stage], str(business_id), _job_id=_job_id, _defer_by=STAGE_DEFER_SECONDS)
+    return job is not None
+
+
+async def enqueue_stage(redis: ArqRedis, stage: str, business_id: UUID, rerun_if_running: bool = True) -> bool:
+    """Queue a stage for a business; False if that stage is already queued or running for it.
+
+    arq refuses a job ID until the running job finishes, so a refused enqueue also marks the
+    stage dirty: a run that started before this change queues a follow-up when it ends.
+    Stages whose result cannot go stale mid-run pass rerun_if_running=False.
+    """
+    if await _enqueue(redis, stage, business_id, job_id(stage, business_id)):
+        return True
+    if rerun_if_running:
+        await redis.set(dirty_key(stage, business_id), 1, ex=DIRTY_TTL_SECONDS)
+    return False
+
+
+async def begin_stage(redis: ArqRedis, stage: str, business_id: UUID) -> None:
+    """Everything flagged so far is visible to the run that is starting."""
+    await redis.delete(dirty_key(stage, business_id))
+
+
+async def finish_stage(redis: ArqRedis, stage: str, business_id: UUID, current_job_id: str | None) -> None:
+    """Queue a follow-up if the stage was marked dirty while this run was in progress.
+
+    The running job still holds its own ID, so the follow-up alternates between the stage's
+    ID and a second one; if that is taken too, the job holding it has not started yet
+    and will see the change.
+    """
+    if not await redis.delete(dirty_key(stage, business_id)):
+        return
+    base = job_id(stage, business_id)
+    await _enqueue(redis, stage, business_id, f"{base}:again" if current_job_id == base else base)
@@ -1,68 +1,338 @@
-from arq import cron
+from functools import wraps
+from uuid import UUID
+from arq import cron, func
+from arq.connections import RedisSettings
+from arq.worker import Retry
 from app.shared.database import AsyncSessionLocal
+from app.shared.locks import Lease, LeaseNotAcquired
+from app.jobs.pipeline import enqueue_stage, begin_stage, finish_stage
+from app.jobs.batch import run_batch
+from app.config import settings
 
 
+def singleton(job):
+    """Skip a cron tick while the previous run, on any replica, still holds the job's lease."""
+    @wraps(job)
+    async def run(ctx):
+        try:
+            async with Lease(f"cron:{job.__name__}", redis=ctx["redis"]):
+                return await job(ctx)
+        except LeaseNotAcquired:
+            return None
+    return run
+
+
+def per_account(stage: str):
+    """Hold a stage's lease for the business; if another worker has it, retry once it should be done.
+
+    Changes flagged while the run was in progress queue a follow-up run when it ends.
+    """
+    def decorate(job):
+        @wraps(job)
+        async def run(ctx, business_id: str):
+            try:
+                async with Lease(f"{stage}:{business_id}", redis=ctx["redis"]):
+                    await begin_stage(ctx["redis"], stage, business_id)
+                    result = await job(ctx, business_id)
+                    await finish_stage(ctx["redis"], stage, business_id, ctx.get("job_id"))
+                    return result
+            except LeaseNotAcquired:
+                raise Retry(defer=settings.WORKER_LEASE_SECONDS / 3)
+        return run
+    return decorate
+
+
+@singleton
 async def quickbooks_sync(ctx):
+    """Enqueue syncs for integrations whose adaptive schedule says they are due."""
+    from app.shared.models import IntegrationAccount
+    from app.quickbooks.schedule import min_sync_interval
+    from app.config import settings
+    from sqlalchemy import select, update, func, or_
+    async with AsyncSessionLocal() as db:
+        due = (
+            select(IntegrationAccount.id)
+            .where(
+                IntegrationAccount.provider == "quickbooks",
+                IntegrationAccount.status == "active",
+                or_(IntegrationAccount.next_sync_due_at.is_(None), IntegrationAccount.next_sync_due_at <= func.now()),
+            )
+            .order_by(IntegrationAccount.next_sync_due_at.asc().nulls_first())
+            .limit(settings.QUICKBOOKS_SYNC_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+        # Push claimed rows out by one min interval: a sync that fails is retried then, not every tick
+        result = await db.execute(
+            update(IntegrationAccount)
+            .where(IntegrationAccount.id.in_(due.scalar_subquery()))
+            .values(next_sync_due_at=func.now() + min_sync_interval())
+            .returning(IntegrationAccount.business_id)
+        )
+        business_ids = result.scalars().all()
+        await db.commit()
+    for business_id in business_ids:
+        await enqueue_stage(ctx["redis"], "sync", business_id)
+
+
+async def sync_business(ctx, business_id: str):
+    await begin_stage(ctx["redis"], "sync", business_id)
+    async with AsyncSessionLocal() as db:
+        from app.quickbooks.service import QuickBooksService
+        from fastapi import HTTPException
+        # QuickBooksService.sync holds the company's sync lease itself
+        try:
+            _, changed = await QuickBooksService(db).sync(UUID(business_id))
+        except HTTPException as e:
+            if e.status_code == 409:
+                # The sync holding the company may have started before the change that queued this one
+                raise Retry(defer=settings.WORKER_LEASE_SECONDS / 3)
+            raise
+        if changed:
+            await enqueue_stage(ctx["redis"], "metrics", business_id)
+    await finish_stage(ctx["redis"], "sync", business_id, ctx.get("job_id"))
+
+
+@singleton
+async def process_quickbooks_notifications(ctx):
+    """Queue the sync stage for each company whose notifications touch what a sync reads.
+
+    The stage dedupes and leases the sync like every other one, and its dirty flag reruns a sync
+    that was already running when the change arrived. A sync that then fails is left to the
+    adaptive schedule.
+    """
+    from app.quickbooks.webhooks import QuickBooksWebhookService, SYNC_ENTITIES
+    from redis.exceptions import RedisError
+    async with AsyncSessionLocal() as db:
+        webhooks = QuickBooksWebhookService(db)
+        realms = await webhooks.claim_batch()
+        if not realms:
+            return None
+        businesses = await webhooks.businesses_for_realms(list(realms))
+        done, failed = [], []
+        queued = 0
+        for realm_id, (entities, notification_ids) in realms.items():
+            # Unknown realms and changes no sync reads are done as soon as they are claimed
+            if realm_id in businesses and entities & SYNC_ENTITIES:
+                try:
+                    await enqueue_stage(ctx["redis"], "sync", businesses[realm_id])
+                except (RedisError, OSError):
+                    failed.extend(notification_ids)
+                    continue
+                queued += 1
+            done.extend(notification_ids)
+        await webhooks.complete(done)
+        await webhooks.release(failed)
+    return {"job": "process_quickbooks_notifications", "realms": len(realms), "syncs_queued": queued, "failed": len(failed)}
+
+
+async def record_business_activity(ctx, business_id: str):
+    async with AsyncSessionLocal() as db:
+        from app.users.service import UsersService
+        from app.quickbooks.service import QuickBooksService
+        await UsersService(db).mark_active(UUID(business_id))
+        await QuickBooksService(db).expedite_sync(UUID(business_id))
+
+
+async def process_stripe_events(ctx):
+    """Drain queued Stripe events until a short batch.
+
+    No lease: process_batch claims with SKIP LOCKED, so overlapping runs take disjoint rows.
+    A full first batch means a burst, so up to STRIPE_EVENT_DRAINERS runs are queued to drain it side by side.
+    """
+    async with AsyncSessionLocal() as db:
+        from app.stripe.service import StripeEventService
+        from app.config import settings
+        service = StripeEventService(db)
+        changed = set()
+        helpers_queued = False
+        while True:
+            claimed, business_ids = await service.process_batch()
+            changed |= business_ids
+            if claimed < settings.STRIPE_EVENT_BATCH_SIZE:
+                break
+            if not helpers_queued:
+                # Fixed job IDs: arq refuses a helper that is already queued or running
+                for i in range(1, settings.STRIPE_EVENT_DRAINERS):
+                    await ctx["redis"].enqueue_job("process_stripe_events", _job_id=f"process_stripe_events:{i}")
+                helpers_queued = True
+        for business_id in changed:
+            await enqueue_stage(ctx["redis"], "metrics", business_id)
+
+
+@singleton
+async def refresh_quickbooks_tokens(ctx):
+    from app.shared.models import IntegrationAccount
+    from app.quickbooks.tokens import token_manager, refresh_horizon
+    from sqlalchemy import select, or_
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(IntegrationAccount.id).where(
+                IntegrationAccount.provider == "quickbooks",
+                IntegrationAccount.status == "active",
+                or_(IntegrationAccount.token_expires_at.is_(None), IntegrationAccount.token_expires_at <= refresh_horizon()),
+            )
+        )
+        integration_ids = result.scalars().all()
+
+    async def refresh(db, integration_id):
+        await token_manager.refresh(integration_id)  # opens its own session for the row lock
+
+    return (await run_batch("refresh_quickbooks_tokens", integration_ids, refresh)).summary()
+
+
+@per_account("metrics")
+async def compute_business_metrics(ctx, business_id: str):
+    async with AsyncSessionLocal() as db:
+        from app.metrics.service import MetricsService
+        from datetime import date, timedelta
+        end = date.today()
+        start = end - timedelta(days=30)
+        if await MetricsService(db).compute_metrics(UUID(business_id), start, end) is not None:
+            await enqueue_stage(ctx["redis"], "readiness", business_id)
+
+
+@per_account("readiness")
+async def compute_business_readiness(ctx, business_id: str):
+    async with AsyncSessionLocal() as db:
+        from app.metrics.service import MetricsService
+        await MetricsService(db).refresh_readiness(UUID(business_id))
+        # Metrics moved even if the score didn't; recommendation rules read both
+        await enqueue_stage(ctx["redis"], "recommendations", business_id)
+
+
+@per_account("recommendations")
+async def generate_business_recommendations(ctx, business_id: str):
+    async with AsyncSessionLocal() as db:
+        from app.recommendations.service import RecommendationsService
+        from app.agent.service import AgentService
+        await RecommendationsService(db).generate_recommendations(UUID(business_id))
+        await AgentService(db).refresh_context(UUID(business_id))
+
+
+@per_account("context")
+async def refresh_business_context(ctx, business_id: str):
+    async with AsyncSessionLocal() as db:
+        from app.agent.service import AgentService
+        await AgentService(db).refresh_context(UUID(business_id))
+
+
+@per_account("backfill")
+async def backfill_quickbooks_history(ctx, business_id: str):
+    async with AsyncSessionLocal() as db:
+        from app.quickbooks.backfill import QuickBooksBackfillService
+        return await QuickBooksBackfillService(db).run(UUID(business_id))
+
+
+@singleton
+async def reconcile_pipeline(ctx):
+    """Daily: roll every business's metrics window forward, and recover any stage enqueue or backfill that was lost."""
     async with AsyncSessionLocal() as db:
         from app.shared.models import IntegrationAccount
         from sqlalchemy import select
-        result = await db.execute(select(IntegrationAccount).where(IntegrationAccount.provider == "quickbooks", IntegrationAccount.status == "active"))
-        accounts = result.scalars().all()
-        for account in accounts:
-            from app.quickbooks.service import QuickBooksService
-            try:
-                await QuickBooksService(db).sync_financial_data(account.business_id)
-            except Exception:
-                pass
+        result = await db.execute(select(IntegrationAccount.business_id).where(IntegrationAccount.status == "active").distinct())
+        for business_id in result.scalars().all():
+            await enqueue_stage(ctx["redis"], "metrics", business_id)
+        # Backfills whose enqueue was lost, or whose last run failed part-way, resume from their saved chunks
+        result = await db.execute(
+            select(IntegrationAccount.business_id).where(
+                IntegrationAccount.provider == "quickbooks",
+                IntegrationAccount.status == "active",
+                IntegrationAccount.metadata_["backfill"]["status"].astext.is_distinct_from("complete"),
+            )
+        )
+        for business_id in result.scalars().all():
+            await enqueue_stage(ctx["redis"], "backfill", business_id)
 
 
+@singleton
 async def compute_metrics(ctx):
+    from app.shared.models import IntegrationAccount
+    from app.metrics.service import MetricsService
+    from app.agent.service import AgentService
+    from sqlalchemy import select
+    from datetime import date, timedelta
     async with AsyncSessionLocal() as db:
-        from app.shared.models import IntegrationAccount
-        from sqlalchemy import select
-        from datetime import date, timedelta
-        result = await db.execute(select(IntegrationAccount).where(IntegrationAccount.provider == "quickbooks", IntegrationAccount.status == "active"))
-        accounts = result.scalars().all()
-        for account in accounts:
-            from app.metrics.service import MetricsService
-            end = date.today()
-            start = end - timedelta(days=30)
-            await MetricsService(db).compute_metrics(account.business_id, start, end)
+        # Any connected provider feeds metrics: QuickBooks syncs and the Stripe ledger
+        result = await db.execute(select(IntegrationAccount.business_id).where(IntegrationAccount.status == "active").distinct())
+        business_ids = result.scalars().all()
+    end = date.today()
+    start = end - timedelta(days=30)
 
+    async def compute(db, business_id):
+        # Skipped, not failed, when its pipeline stage is computing it right now
+        async with Lease(f"metrics:{business_id}", redis=ctx["redis"]):
+            await MetricsService(db).compute_metrics(business_id, start, end)
+        await AgentService(db).refresh_context(business_id)
 
+    return (await run_batch("compute_metrics", business_ids, compute)).summary()
+
+
+@singleton
 async def compute_readiness(ctx):
+    from app.shared.models import IntegrationAccount
+    from app.metrics.service import MetricsService
+    from app.agent.service import AgentService
+    from sqlalchemy import select
     async with AsyncSessionLocal() as db:
-        from app.shared.models import IntegrationAccount, FinancialMetricSnapshot
-        from sqlalchemy import select
-        result = await db.execute(select(IntegrationAccount).where(IntegrationAccount.provider == "quickbooks", IntegrationAccount.status == "active"))
-        accounts = result.scalars().all()
-        for account in accounts:
-            from app.metrics.service import MetricsService
-            svc = MetricsService(db)
-            try:
-                snapshot = await svc.get_latest_metrics(account.business_id)
-                await svc.compute_readiness_score(account.business_id, snapshot)
-            except Exception:
-                pass
+        result = await db.execute(
+            select(IntegrationAccount.business_id).where(IntegrationAccount.provider == "quickbooks", IntegrationAccount.status == "active")
+        )
+        business_ids = result.scalars().all()
 
+    async def compute(db, business_id):
+        svc = MetricsService(db)
+        async with Lease(f"readiness:{business_id}", redis=ctx["redis"]):
+            snapshot = await svc.get_latest_metrics(business_id)
+            await svc.compute_readiness_score(business_id, snapshot)
+        await AgentService(db).refresh_context(business_id)
 
+    return (await run_batch("compute_readiness", business_ids, compute)).summary()
+
+
+@singleton
 async def generate_recommendations(ctx):
+    from app.recommendations.service import RecommendationsService
+    from app.agent.service import AgentService
     async with AsyncSessionLocal() as db:
-        from app.shared.models import IntegrationAccount
-        from sqlalchemy import select
-        result = await db.execute(select(IntegrationAccount).where(IntegrationAccount.provider == "quickbooks", IntegrationAccount.status == "active"))
-        accounts = result.scalars().all()
-        for account in accounts:
-            from app.recommendations.service import RecommendationsService
-            await RecommendationsService(db).generate_recommendations(account.business_id)
+        changed = await RecommendationsService(db).generate_all_recommendations()
+
+    async def refresh(db, business_id):
+        await AgentService(db).refresh_context(business_id)
+
+    return (await run_batch("generate_recommendations", changed, refresh)).summary()
+
+
+async def shutdown(ctx):
+    from app.quickbooks.client import close_quickbooks_client
+    await close_quickbooks_client()
+
+
+# Stage jobs keep no result: the job ID must free up as soon as a run finishes so the next change can queue it
+PIPELINE_FUNCTIONS = [
+    func(sync_business, keep_result=0),
+    func(compute_business_metrics, keep_result=0),
+    func(compute_business_readiness, keep_result=0),
+    func(generate_business_recommendations, keep_result=0),
+    func(backfill_quickbooks_history, keep_result=0),
+    func(refresh_business_context, keep_result=0),
+    func(record_business_activity, keep_result=0),
+    # Burst helpers reuse fixed job IDs, which must free up when a run ends
+    func(process_stripe_events, keep_result=0),
+]
 
 
 class WorkerSettings:
-    functions = [quickbooks_sync, compute_metrics, compute_readiness, generate_recommendations]
+    # The full sweeps stay enqueueable by hand, e.g. after a scoring formula change
+    functions = [
+        quickbooks_sync, process_quickbooks_notifications, refresh_quickbooks_tokens, reconcile_pipeline,
+        compute_metrics, compute_readiness, generate_recommendations, *PIPELINE_FUNCTIONS,
+    ]
     cron_jobs = [
-        cron(quickbooks_sync, minute={0, 15, 30, 45}),
-        cron(compute_metrics, minute=0),
-        cron(compute_readiness, minute=5),
-        cron(generate_recommendations, hour=2, minute=0),
+        cron(quickbooks_sync),
+        cron(process_quickbooks_notifications),
+        cron(process_stripe_events),
+        cron(refresh_quickbooks_tokens, minute=set(range(0, 60, 5))),
+        cron(reconcile_pipeline, hour=2, minute=0),
     ]
-    redis_settings = None
+    on_shutdown = shutdown
+    redis_settings = RedisSettings.from_dsn(settings.REDIS_URL)
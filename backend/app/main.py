@@ -1,16 +1,32 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from app.auth.router import router as auth_router
 from app.users.router import router as users_router
 from app.quickbooks.router import router as quickbooks_router
+from app.stripe.router import router as stripe_router
 from app.metrics.router import router as metrics_router
 from app.recommendations.router import router as recommendations_router
 from app.agent.router import router as agent_router
+from app.agent.providers import registry as llm_registry
+from app.agent.persistence import message_writer
+from app.quickbooks.client import close_quickbooks_client
+from app.shared.serialization import FastJSONResponse
 
-app = FastAPI(title="Vaultra API", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await llm_registry.startup()
+    await message_writer.start()
+    yield
+    await message_writer.stop()
+    await llm_registry.shutdown()
+    await close_quickbooks_client()
+
+
+app = FastAPI(title="Vaultra API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,12 +40,12 @@ app.add_middleware(
 @app.exception_handler(StarletteHTTPException)
 async def http_exception_handler(request: Request, exc: StarletteHTTPException):
     detail = exc.detail if isinstance(exc.detail, dict) else {"error": {"code": "ERROR", "message": str(exc.detail)}}
-    return JSONResponse(status_code=exc.status_code, content=detail)
+    return FastJSONResponse(status_code=exc.status_code, content=detail)
 
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
-    return JSONResponse(
+    return FastJSONResponse(
         status_code=422,
         content={"error": {"code": "VALIDATION_ERROR", "message": "Validation failed", "details": exc.errors()}},
     )
@@ -37,13 +53,14 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 
 @app.exception_handler(Exception)
 async def generic_exception_handler(request: Request, exc: Exception):
-    return JSONResponse(status_code=500, content={"error": {"code": "INTERNAL_ERROR", "message": "An unexpected error occurred"}})
+    return FastJSONResponse(status_code=500, content={"error": {"code": "INTERNAL_ERROR", "message": "An unexpected error occurred"}})
 
 
 PREFIX = "/api/v1"
 app.include_router(auth_router, prefix=PREFIX)
 app.include_router(users_router, prefix=PREFIX)
 app.include_router(quickbooks_router, prefix=PREFIX)
+app.include_router(stripe_router, prefix=PREFIX)
 app.include_router(metrics_router, prefix=PREFIX)
 app.include_router(recommendations_router, prefix=PREFIX)
 app.include_router(agent_router, prefix=PREFIX)
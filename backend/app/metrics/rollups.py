@@ -0,0 +1,81 @@
+from dataclasses import dataclass
+from datetime import date, timedelta
+import numpy as np
+
+GRANULARITIES = ("daily", "weekly", "monthly", "quarterly")
+# Additive per-day ledger counters; ratios are derived after merging, never averaged
+COUNTERS = ("charge_count", "charge_volume", "refund_count", "dispute_count", "payouts_final", "payouts_on_time")
+
+
+def bucket_start(day: date, granularity: str) -> date:
+    if granularity == "daily":
+        return day
+    if granularity == "weekly":
+        return day - timedelta(days=day.weekday())
+    if granularity == "monthly":
+        return day.replace(day=1)
+    if granularity == "quarterly":
+        return date(day.year, (day.month - 1) // 3 * 3 + 1, 1)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def bucket_end(start: date, granularity: str) -> date:
+    if granularity == "daily":
+        return start
+    if granularity == "weekly":
+        return start + timedelta(days=6)
+    months = 3 if granularity == "quarterly" else 1
+    index = start.year * 12 + start.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1) - timedelta(days=1)
+
+
+def rollup_start(window_start: date) -> date:
+    """First day to aggregate so every bucket overlapping the window, up to its quarter, is complete."""
+    return bucket_start(bucket_start(window_start, "quarterly"), "weekly")
+
+
+def derive(counters: np.ndarray) -> dict | None:
+    """Snapshot figures from summed counters; None when the period has no charges or settled payouts."""
+    charges, volume, refunds, disputes, payouts_final, payouts_on_time = counters.tolist()
+    if not charges and not payouts_final:
+        return None
+    return {
+        "transaction_count": int(charges),
+        "average_transaction_size": volume / charges if charges else None,
+        "chargeback_count": int(disputes),
+        "chargeback_ratio": disputes / charges if charges else None,
+        "refund_count": int(refunds),
+        "refund_ratio": refunds / charges if charges else None,
+        "payout_reliability": payouts_on_time / payouts_final if payouts_final else None,
+    }
+
+
+@dataclass
+class DailyAggregates:
+    """Ledger counters per day with activity, in day order: counters[i] holds COUNTERS for days[i]."""
+
+    days: list[date]
+    counters: np.ndarray
+
+    def rollup(self, granularity: str, since: date) -> list[tuple[date, date, np.ndarray]]:
+        """Merge days into calendar buckets as (start, end, summed counters).
+
+        Days are sorted, so each bucket is a contiguous run and one reduceat sums them all.
+        Buckets starting before since were only partly aggregated and are dropped.
+        """
+        if not self.days:
+            return []
+        keys = [bucket_start(day, granularity) for day in self.days]
+        boundaries = [i for i in range(len(keys)) if i == 0 or keys[i] != keys[i - 1]]
+        sums = np.add.reduceat(self.counters, boundaries, axis=0)
+        return [
+            (keys[i], bucket_end(keys[i], granularity), sums[j])
+            for j, i in enumerate(boundaries)
+            if keys[i] >= since
+        ]
+
+    def window(self, start: date, end: date) -> np.ndarray:
+        mask = np.array([start <= day <= end for day in self.days], dtype=bool)
+        if not mask.any():
+            return np.zeros(len(COUNTERS))
+        return self.counters[mask].sum(axis=0)
@@ -1,20 +1,31 @@
 from uuid import UUID
 from datetime import date
 from typing import Optional
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.shared.serialization import FastJSONRoute, rows_response
 from app.shared.database import get_db
 from app.shared.deps import get_current_user
 from app.shared.models import User
-from app.metrics.schemas import MetricsResponse, MetricsHistoryResponse, ReadinessResponse, ReadinessHistoryResponse
+from app.metrics.schemas import (
+    MetricsResponse,
+    MetricsHistoryResponse,
+    ReadinessResponse,
+    ReadinessHistoryResponse,
+    metrics_row_adapter,
+    metrics_history_adapter,
+    readiness_history_adapter,
+)
 from app.metrics.service import MetricsService
 from app.users.service import UsersService
 
-router = APIRouter(tags=["metrics"])
+router = APIRouter(tags=["metrics"], route_class=FastJSONRoute)
 
 
 async def assert_member(business_id: UUID, current_user: User, db: AsyncSession):
-    await UsersService(db).assert_business_member(business_id, current_user.id)
+    users = UsersService(db)
+    await users.assert_business_member(business_id, current_user.id)
+    users.record_activity(business_id)
 
 
 @router.get("/metrics", response_model=MetricsResponse)
@@ -24,7 +35,7 @@ async def get_metrics(
     db: AsyncSession = Depends(get_db),
 ):
     await assert_member(business_id, current_user, db)
-    return await MetricsService(db).get_latest_metrics(business_id)
+    return rows_response(metrics_row_adapter, await MetricsService(db).get_latest_metrics_row(business_id))
 
 
 @router.get("/metrics/history", response_model=MetricsHistoryResponse)
@@ -32,12 +43,13 @@ async def get_metrics_history(
     business_id: UUID,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
+    granularity: str = Query("trailing", pattern="^(trailing|daily|weekly|monthly|quarterly)$"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
     await assert_member(business_id, current_user, db)
-    metrics = await MetricsService(db).get_metric_history(business_id, start_date, end_date)
-    return {"metrics": metrics}
+    metrics = await MetricsService(db).get_metric_history(business_id, start_date, end_date, granularity)
+    return rows_response(metrics_history_adapter, {"metrics": metrics})
 
 
 @router.get("/readiness", response_model=ReadinessResponse)
@@ -59,4 +71,4 @@ async def get_readiness_history(
 ):
     await assert_member(business_id, current_user, db)
     scores = await MetricsService(db).get_readiness_history(business_id, limit)
-    return {"scores": scores}
+    return rows_response(readiness_history_adapter, {"scores": scores})
@@ -1,7 +1,8 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 from uuid import UUID
 from datetime import date, datetime
 from typing import Optional
+from typing_extensions import TypedDict
 from decimal import Decimal
 
 
@@ -9,6 +10,7 @@ class MetricsResponse(BaseModel):
     business_id: UUID
     period_start: date
     period_end: date
+    granularity: str = "trailing"
     revenue_total: Optional[Decimal] = None
     revenue_volatility: Optional[Decimal] = None
     chargeback_count: int = 0
@@ -41,3 +43,43 @@ class ReadinessResponse(BaseModel):
 
 class ReadinessHistoryResponse(BaseModel):
     scores: list[ReadinessResponse]
+
+
+# Row shapes for the read path: selected column-for-column and serialized without validation.
+# Field names and order match the response models above, so the JSON is byte-identical.
+class MetricsRow(TypedDict):
+    business_id: UUID
+    period_start: date
+    period_end: date
+    granularity: str
+    revenue_total: Optional[Decimal]
+    revenue_volatility: Optional[Decimal]
+    chargeback_count: int
+    chargeback_ratio: Optional[Decimal]
+    refund_count: int
+    refund_ratio: Optional[Decimal]
+    payout_reliability: Optional[Decimal]
+    transaction_count: int
+    average_transaction_size: Optional[Decimal]
+    mrr: Optional[Decimal]
+
+
+class MetricsHistoryRows(TypedDict):
+    metrics: list[MetricsRow]
+
+
+class ReadinessRow(TypedDict):
+    business_id: UUID
+    score: int
+    tier: str
+    components: Optional[dict]
+    created_at: datetime
+
+
+class ReadinessHistoryRows(TypedDict):
+    scores: list[ReadinessRow]
+
+
+metrics_row_adapter = TypeAdapter(MetricsRow)
+metrics_history_adapter = TypeAdapter(MetricsHistoryRows)
+readiness_history_adapter = TypeAdapter(ReadinessHistoryRows)
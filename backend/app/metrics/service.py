@@ -1,9 +1,15 @@
+import uuid
 from uuid import UUID
-from datetime import date
+from datetime import date, datetime, time, timedelta, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, func, and_, or_, case
+from sqlalchemy.dialects.postgresql import insert
 from fastapi import HTTPException
-from app.shared.models import FinancialMetricSnapshot, ReadinessScore
+from app.shared.models import FinancialMetricSnapshot, ReadinessScore, LedgerEntry, IntegrationAccount
+import numpy as np
+from app.metrics.schemas import MetricsRow, ReadinessRow
+from app.metrics.rollups import GRANULARITIES, COUNTERS, DailyAggregates, bucket_start, derive, rollup_start
+from app.quickbooks.reports import revenue_volatility
 
 
 TIER_THRESHOLDS = [
@@ -13,6 +19,19 @@ TIER_THRESHOLDS = [
     (0, "not_ready"),
 ]
 
+# Exactly the response columns, so reads skip ORM hydration and unused JSONB (metrics_json)
+METRIC_COLUMNS = [getattr(FinancialMetricSnapshot, name) for name in MetricsRow.__annotations__]
+READINESS_COLUMNS = [getattr(ReadinessScore, name) for name in ReadinessRow.__annotations__]
+
+# Figures a QuickBooks sync contributes; the ledger's card-level counts win where both exist
+QUICKBOOKS_FIELDS = ("revenue_total", "revenue_volatility", "mrr", "transaction_count", "refund_count", "refund_ratio")
+# Ledger figures a rollup overwrites; a backfilled QuickBooks month keeps its own revenue figures
+ROLLUP_FIELDS = (
+    "transaction_count", "average_transaction_size", "chargeback_count",
+    "chargeback_ratio", "refund_count", "refund_ratio", "payout_reliability",
+)
+BOOKED_FIELDS = ("revenue_total", "revenue_volatility")
+
 
 class MetricsService:
     def __init__(self, db: AsyncSession):
@@ -21,7 +40,7 @@ class MetricsService:
     async def get_latest_metrics(self, business_id: UUID) -> FinancialMetricSnapshot:
         result = await self.db.execute(
             select(FinancialMetricSnapshot)
-            .where(FinancialMetricSnapshot.business_id == business_id)
+            .where(FinancialMetricSnapshot.business_id == business_id, FinancialMetricSnapshot.granularity == "trailing")
             .order_by(FinancialMetricSnapshot.period_end.desc())
             .limit(1)
         )
@@ -33,6 +52,7 @@ class MetricsService:
                 business_id=business_id,
                 period_start=date(2024, 1, 1),
                 period_end=date(2024, 12, 31),
+                granularity="trailing",
                 revenue_total=250000,
                 revenue_volatility=0.12,
                 chargeback_count=2,
@@ -51,14 +71,32 @@ class MetricsService:
 
         return snapshot
 
-    async def get_metric_history(self, business_id: UUID, start_date: date | None, end_date: date | None) -> list[FinancialMetricSnapshot]:
-        query = select(FinancialMetricSnapshot).where(FinancialMetricSnapshot.business_id == business_id)
+    async def get_latest_metrics_row(self, business_id: UUID) -> dict:
+        result = await self.db.execute(
+            select(*METRIC_COLUMNS)
+            .where(FinancialMetricSnapshot.business_id == business_id, FinancialMetricSnapshot.granularity == "trailing")
+            .order_by(FinancialMetricSnapshot.period_end.desc())
+            .limit(1)
+        )
+        row = result.mappings().one_or_none()
+        if row is None:
+            snapshot = await self.get_latest_metrics(business_id)  # creates the demo default
+            return {column.key: getattr(snapshot, column.key) for column in METRIC_COLUMNS}
+        return dict(row)
+
+    async def get_metric_history(
+        self, business_id: UUID, start_date: date | None, end_date: date | None, granularity: str = "trailing"
+    ) -> list[dict]:
+        # One granularity per series; mixing them would interleave overlapping periods
+        query = select(*METRIC_COLUMNS).where(
+            FinancialMetricSnapshot.business_id == business_id, FinancialMetricSnapshot.granularity == granularity
+        )
         if start_date:
             query = query.where(FinancialMetricSnapshot.period_end >= start_date)
         if end_date:
             query = query.where(FinancialMetricSnapshot.period_end <= end_date)
         result = await self.db.execute(query.order_by(FinancialMetricSnapshot.period_end.desc()))
-        return result.scalars().all()
+        return [dict(row) for row in result.mappings().all()]
 
     async def get_readiness_score(self, business_id: UUID) -> ReadinessScore:
         result = await self.db.execute(
@@ -76,16 +114,44 @@ class MetricsService:
 
         return score
 
-    async def get_readiness_history(self, business_id: UUID, limit: int = 30) -> list[ReadinessScore]:
+    async def get_readiness_history(self, business_id: UUID, limit: int = 30) -> list[dict]:
         result = await self.db.execute(
-            select(ReadinessScore)
+            select(*READINESS_COLUMNS)
             .where(ReadinessScore.business_id == business_id)
             .order_by(ReadinessScore.created_at.desc())
             .limit(limit)
         )
-        return result.scalars().all()
+        return [dict(row) for row in result.mappings().all()]
 
     async def compute_readiness_score(self, business_id: UUID, snapshot: FinancialMetricSnapshot) -> ReadinessScore:
+        score, tier, components = self.score_snapshot(snapshot)
+        readiness = ReadinessScore(
+            business_id=business_id,
+            score=score,
+            tier=tier,
+            components=components,
+        )
+        self.db.add(readiness)
+        await self.db.commit()
+        await self.db.refresh(readiness)
+        return readiness
+
+    async def refresh_readiness(self, business_id: UUID) -> ReadinessScore | None:
+        """Score the latest snapshot; returns None (and writes nothing) if the score matches the last one."""
+        snapshot = await self.get_latest_metrics(business_id)
+        score, tier, components = self.score_snapshot(snapshot)
+        result = await self.db.execute(
+            select(ReadinessScore.score, ReadinessScore.tier, ReadinessScore.components)
+            .where(ReadinessScore.business_id == business_id)
+            .order_by(ReadinessScore.created_at.desc())
+            .limit(1)
+        )
+        if tuple(result.one_or_none() or ()) == (score, tier, components):
+            return None
+        return await self.compute_readiness_score(business_id, snapshot)
+
+    def score_snapshot(self, snapshot: FinancialMetricSnapshot) -> tuple[int, str, dict]:
+        """(score, tier, components) for a snapshot, without persisting anything."""
         score = 50
         components = {}
 
@@ -119,17 +185,132 @@ class MetricsService:
             if score >= threshold:
                 tier = tier_name
                 break
+        return score, tier, components
 
-        readiness = ReadinessScore(
-            business_id=business_id,
-            score=score,
-            tier=tier,
-            components=components,
+    async def ledger_daily(self, business_id: UUID, start_date: date, end_date: date) -> DailyAggregates:
+        """Per-day ledger counters for [start_date, end_date] in one grouped scan; every rollup merges these."""
+        start = datetime.combine(start_date, time.min, tzinfo=timezone.utc)
+        end = datetime.combine(end_date + timedelta(days=1), time.min, tzinfo=timezone.utc)
+        charge = and_(LedgerEntry.entry_type == "charge", LedgerEntry.status == "succeeded")
+        payout_final = and_(LedgerEntry.entry_type == "payout", LedgerEntry.status.in_(("paid", "failed", "canceled")))
+        on_time = and_(
+            LedgerEntry.entry_type == "payout",
+            LedgerEntry.status == "paid",
+            LedgerEntry.settled_at <= LedgerEntry.due_at + timedelta(days=1),
         )
-        self.db.add(readiness)
-        await self.db.commit()
-        await self.db.refresh(readiness)
-        return readiness
+        day = func.date(func.timezone("UTC", LedgerEntry.occurred_at)).label("day")
+        result = await self.db.execute(
+            select(
+                day,
+                func.count().filter(charge),
+                func.coalesce(func.sum(LedgerEntry.amount).filter(charge), 0),
+                func.count().filter(LedgerEntry.entry_type == "refund", LedgerEntry.status == "succeeded"),
+                func.count().filter(LedgerEntry.entry_type == "dispute"),
+                func.count().filter(payout_final),
+                func.count().filter(on_time),
+            )
+            .where(
+                LedgerEntry.business_id == business_id,
+                LedgerEntry.occurred_at >= start,
+                LedgerEntry.occurred_at < end,
+            )
+            .group_by(day)
+            .order_by(day)
+        )
+        rows = result.all()
+        counters = np.array([[float(value) for value in row[1:]] for row in rows], dtype=np.float64).reshape(len(rows), len(COUNTERS))
+        return DailyAggregates([row.day for row in rows], counters)
+
+    async def upsert_rollups(self, business_id: UUID, daily: DailyAggregates, since: date) -> dict[str, int]:
+        """Merge the daily aggregates into each calendar granularity and upsert each with one statement.
+
+        Returns the number of snapshots written per granularity.
+        """
+        buckets = {granularity: daily.rollup(granularity, since) for granularity in GRANULARITIES}
+        # A quarter's volatility is the CV of its months, as for monthly revenue elsewhere
+        monthly_volume: dict[date, list[float]] = {}
+        for start, _, counters in buckets["monthly"]:
+            monthly_volume.setdefault(bucket_start(start, "quarterly"), []).append(float(counters[COUNTERS.index("charge_volume")]))
+
+        booked = FinancialMetricSnapshot.metrics_json["source"].astext == "quickbooks"
+        written = {}
+        for granularity, periods in buckets.items():
+            rows = []
+            for start, end, counters in periods:
+                values = derive(counters)
+                if values is None:
+                    continue
+                volumes = monthly_volume.get(start) if granularity == "quarterly" else None
+                rows.append({
+                    "id": uuid.uuid4(),
+                    "business_id": business_id,
+                    "granularity": granularity,
+                    "period_start": start,
+                    "period_end": end,
+                    "revenue_total": float(counters[COUNTERS.index("charge_volume")]),
+                    "revenue_volatility": revenue_volatility(np.array(volumes)) if volumes else None,
+                    "metrics_json": {"source": "ledger"},
+                    **values,
+                })
+            written[granularity] = len(rows)
+            if not rows:
+                continue
+            stmt = insert(FinancialMetricSnapshot).values(rows)
+            excluded = stmt.excluded
+            await self.db.execute(
+                stmt.on_conflict_do_update(
+                    constraint="uq_metrics_period",
+                    set_={
+                        **{field: excluded[field] for field in ROLLUP_FIELDS},
+                        # The ledger only sees card volume, not what the books recorded for the month
+                        **{
+                            field: case((booked, getattr(FinancialMetricSnapshot, field)), else_=excluded[field])
+                            for field in BOOKED_FIELDS
+                        },
+                    },
+                )
+            )
+        return written
 
-    async def compute_metrics(self, business_id: UUID, start_date: date, end_date: date) -> FinancialMetricSnapshot:
-        pass
+    async def quickbooks_financials(self, business_id: UUID) -> dict | None:
+        """The figures stored by the last QuickBooks sync, if the business has one."""
+        result = await self.db.execute(
+            select(IntegrationAccount.metadata_["financials"]).where(
+                IntegrationAccount.business_id == business_id,
+                IntegrationAccount.provider == "quickbooks",
+                IntegrationAccount.status == "active",
+            )
+        )
+        return result.scalar_one_or_none()
+
+    async def compute_metrics(self, business_id: UUID, start_date: date, end_date: date) -> FinancialMetricSnapshot | None:
+        """Upsert the trailing snapshot for the window, and the calendar rollups around it, from one ledger scan.
+
+        The trailing snapshot merges the ledger with the last QuickBooks sync. Returns None
+        when there is no source data or the stored trailing snapshot already matches, so
+        callers can stop downstream work for unchanged businesses.
+        """
+        since = rollup_start(start_date)
+        daily = await self.ledger_daily(business_id, since, end_date)
+        await self.upsert_rollups(business_id, daily, since)
+
+        financials = await self.quickbooks_financials(business_id) or {}
+        values = {field: financials[field] for field in QUICKBOOKS_FIELDS if financials.get(field) is not None}
+        values.update(derive(daily.window(start_date, end_date)) or {})
+        if not values:
+            await self.db.commit()
+            return None
+        stmt = insert(FinancialMetricSnapshot).values(
+            id=uuid.uuid4(), business_id=business_id, granularity="trailing", period_start=start_date, period_end=end_date, **values
+        )
+        result = await self.db.execute(
+            stmt.on_conflict_do_update(
+                constraint="uq_metrics_period",
+                set_=values,
+                where=or_(*(getattr(FinancialMetricSnapshot, field).is_distinct_from(stmt.excluded[field]) for field in values)),
+            )
+            .returning(FinancialMetricSnapshot)
+        )
+        snapshot = result.scalar_one_or_none()
+        await self.db.commit()
+        return snapshot
@@ -0,0 +1,184 @@
+import asyncio
+import uuid
+from datetime import date, datetime, time, timedelta, timezone
+from uuid import UUID
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import select, update, func, literal
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.types import Text
+from app.shared.models import IntegrationAccount, FinancialMetricSnapshot, ReadinessScore
+from app.quickbooks.service import QuickBooksService, merge_metadata
+from app.quickbooks.tokens import token_manager
+from app.quickbooks.reports import revenue_volatility
+from app.metrics.service import MetricsService
+from app.config import settings
+
+# Months of revenue behind each historical snapshot's volatility, as in a live sync
+VOLATILITY_MONTHS = 12
+# Fetch rounds per run; a later round only refetches months whose saved chunk went missing
+FETCH_ROUNDS = 3
+
+
+def month_chunks(first: date, count: int) -> list[tuple[date, date]]:
+    """count calendar months starting at first's month, oldest first, as (first day, last day)."""
+    chunks = []
+    start = first.replace(day=1)
+    for _ in range(count):
+        next_start = (start + timedelta(days=32)).replace(day=1)
+        chunks.append((start, next_start - timedelta(days=1)))
+        start = next_start
+    return chunks
+
+
+def backfill_start(today: date, months: int) -> date:
+    index = today.year * 12 + today.month - 1 - months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def backfill_progress(state: dict | None) -> dict | None:
+    if state is None:
+        return None
+    return {"status": state["status"], "done": len(state["chunks"]), "total": state["total"]}
+
+
+class QuickBooksBackfillService:
+    """Monthly history for a newly connected company.
+
+    Each complete month in the last QUICKBOOKS_BACKFILL_MONTHS is a chunk: that month's P&L
+    and invoice and credit memo counts. Chunks are fetched QUICKBOOKS_BACKFILL_CONCURRENCY at a
+    time; the client's realm limiter and the query batcher keep that within Intuit's limits.
+    Each finished chunk is saved on the integration straight away, so an interrupted run
+    resumes with only the missing months. Once all are in, the monthly snapshots and a
+    readiness score dated to each month end go in with one bulk insert per table.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.quickbooks = QuickBooksService(db)
+        self._write_lock = asyncio.Lock()
+
+    async def run(self, business_id: UUID) -> dict | None:
+        integration = await self._load(business_id)
+        state = integration.metadata_.get("backfill")
+        if state is None:
+            # Fix the month range on the first run, so a resume next month fetches the same chunks
+            start = backfill_start(date.today(), settings.QUICKBOOKS_BACKFILL_MONTHS)
+            state = {"status": "running", "start": start.isoformat(), "total": settings.QUICKBOOKS_BACKFILL_MONTHS, "chunks": {}}
+            await merge_metadata(self.db, integration, {"backfill": state})
+            await self.db.commit()
+        if state["status"] == "complete":
+            return backfill_progress(state)
+
+        chunks = month_chunks(date.fromisoformat(state["start"]), state["total"])
+        for _ in range(FETCH_ROUNDS):
+            pending = [(start, end) for start, end in chunks if start.isoformat()[:7] not in state["chunks"]]
+            if not pending:
+                return await self._finish(integration, chunks)
+            await self._fetch(integration, pending)
+            integration = await self._load(business_id)
+            state = integration.metadata_.get("backfill")
+            if state is None:
+                return None  # a different company was connected meanwhile, and its own backfill is queued
+        raise RuntimeError(f"Backfill months kept going missing for business {business_id}")
+
+    async def _fetch(self, integration: IntegrationAccount, pending: list[tuple[date, date]]) -> None:
+        access_token = await token_manager.get_access_token(integration)
+        semaphore = asyncio.Semaphore(settings.QUICKBOOKS_BACKFILL_CONCURRENCY)
+
+        async def fetch(start: date, end: date) -> None:
+            async with semaphore:
+                figures = await self.quickbooks.fetch_month(access_token, integration.external_id, start, end)
+            await self._set_state(integration.id, ["chunks", start.isoformat()[:7]], figures)
+
+        results = await asyncio.gather(*(fetch(start, end) for start, end in pending), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise errors[0]  # the saved chunks stay; the next run fetches the rest
+
+    async def _load(self, business_id: UUID) -> IntegrationAccount:
+        result = await self.db.execute(
+            select(IntegrationAccount)
+            .where(IntegrationAccount.business_id == business_id, IntegrationAccount.provider == "quickbooks")
+            .execution_options(populate_existing=True)
+        )
+        integration = result.scalar_one_or_none()
+        if not integration or integration.status != "active":
+            raise HTTPException(
+                status_code=400,
+                detail={"error": {"code": "NOT_CONNECTED", "message": "QuickBooks not connected"}},
+            )
+        return integration
+
+    async def _set_state(self, integration_id: UUID, path: list[str], value) -> None:
+        # jsonb_set writes just this key under metadata.backfill, so concurrent chunks and syncs never overwrite each other
+        async with self._write_lock:
+            await self.db.execute(
+                update(IntegrationAccount)
+                .where(IntegrationAccount.id == integration_id)
+                .values(
+                    metadata_=func.jsonb_set(
+                        IntegrationAccount.metadata_,
+                        literal(["backfill", *path], ARRAY(Text)),
+                        literal(value, JSONB),
+                    )
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await self.db.commit()
+
+    async def _finish(self, integration: IntegrationAccount, chunks: list[tuple[date, date]]) -> dict:
+        state = integration.metadata_["backfill"]
+        months = [(start, end, state["chunks"][start.isoformat()[:7]]) for start, end in chunks]
+        # Months before the company's books have any activity would only add zeros to the charts
+        while months and not (months[0][2]["revenue"] or months[0][2]["invoice_count"]):
+            months.pop(0)
+
+        revenues = [figures["revenue"] for _, _, figures in months]
+        rows = []
+        for i, (start, end, figures) in enumerate(months):
+            window = [revenue for revenue in revenues[max(0, i - VOLATILITY_MONTHS + 1):i + 1] if revenue is not None]
+            invoices, credit_memos = figures["invoice_count"], figures["credit_memo_count"]
+            rows.append({
+                "id": uuid.uuid4(),
+                "business_id": integration.business_id,
+                "granularity": "monthly",
+                "period_start": start,
+                "period_end": end,
+                "revenue_total": figures["revenue"],
+                "revenue_volatility": revenue_volatility(np.array(window, dtype=np.float64)),
+                "mrr": figures["revenue"],
+                "transaction_count": invoices,
+                "refund_count": credit_memos,
+                "refund_ratio": credit_memos / invoices if invoices else None,
+                "metrics_json": {"source": "quickbooks"},
+            })
+
+        if rows:
+            # Never overwrite a period a live sync already computed
+            result = await self.db.execute(
+                insert(FinancialMetricSnapshot)
+                .values(rows)
+                .on_conflict_do_nothing(constraint="uq_metrics_period")
+                .returning(FinancialMetricSnapshot)
+            )
+            inserted = result.scalars().all()
+            if inserted:
+                metrics = MetricsService(self.db)
+                scores = []
+                for snapshot in inserted:
+                    score, tier, components = metrics.score_snapshot(snapshot)
+                    scores.append({
+                        "id": uuid.uuid4(),
+                        "business_id": integration.business_id,
+                        "score": score,
+                        "tier": tier,
+                        "components": components,
+                        "created_at": datetime.combine(snapshot.period_end, time.max, tzinfo=timezone.utc),
+                    })
+                await self.db.execute(insert(ReadinessScore).values(scores))
+
+        # Commits the snapshots and the status together
+        await self._set_state(integration.id, ["status"], "complete")
+        return backfill_progress({**state, "status": "complete"})
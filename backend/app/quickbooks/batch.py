@@ -0,0 +1,103 @@
+import asyncio
+from dataclasses import dataclass, field
+from fastapi import HTTPException
+from app.quickbooks.client import QuickBooksClient, get_quickbooks_client
+from app.config import settings
+
+BATCH_MAX_ITEMS = 30  # Intuit's limit per /batch request
+
+
+def _consume_exception(future: asyncio.Future) -> None:
+    # Every caller of a query may be gone by the time its batch fails; don't warn about it
+    if not future.cancelled():
+        future.exception()
+
+
+@dataclass
+class _PendingBatch:
+    api_base: str
+    access_token: str
+    futures: dict[str, asyncio.Future] = field(default_factory=dict)
+    full: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class QuickBooksBatcher:
+    """Coalesces /query calls per realm into /batch requests.
+
+    Queries issued within QUICKBOOKS_BATCH_WINDOW_SECONDS of each other for the same realm
+    and access token share one HTTP call (identical queries share one batch item); each
+    caller gets back its own QueryResponse or an HTTPException for its item's Fault.
+    Batches are keyed by token too, so a call never goes out under another caller's token.
+    """
+
+    def __init__(self, client: QuickBooksClient | None = None):
+        self.client = client or get_quickbooks_client()
+        self._pending: dict[tuple[str, str], _PendingBatch] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def query(self, api_base: str, realm_id: str, access_token: str, query: str) -> dict:
+        key = (realm_id, access_token)
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = _PendingBatch(api_base, access_token)
+            task = asyncio.create_task(self._send(key, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        future = batch.futures.get(query)
+        if future is None:
+            future = batch.futures[query] = asyncio.get_running_loop().create_future()
+            future.add_done_callback(_consume_exception)
+            if len(batch.futures) >= BATCH_MAX_ITEMS:
+                del self._pending[key]
+                batch.full.set()
+        # Shielded: a cancelled caller must not cancel the result other callers of the same query share
+        return await asyncio.shield(future)
+
+    async def _send(self, key: tuple[str, str], batch: _PendingBatch) -> None:
+        try:
+            await asyncio.wait_for(batch.full.wait(), timeout=settings.QUICKBOOKS_BATCH_WINDOW_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        if self._pending.get(key) is batch:
+            del self._pending[key]
+        realm_id = key[0]
+
+        queries = list(batch.futures)
+        try:
+            data = await self.client.post(
+                f"{batch.api_base}/v3/company/{realm_id}/batch",
+                realm_id,
+                batch.access_token,
+                json={"BatchItemRequest": [{"bId": str(i), "Query": q} for i, q in enumerate(queries)]},
+            )
+        except Exception as e:
+            for future in batch.futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        items = {item.get("bId"): item for item in data.get("BatchItemResponse", [])}
+        for i, query in enumerate(queries):
+            future = batch.futures[query]
+            if future.done():
+                continue
+            item = items.get(str(i))
+            if item is None or "Fault" in item:
+                errors = (item or {}).get("Fault", {}).get("Error", [{}])
+                message = errors[0].get("Message") or "Missing batch item response"
+                future.set_exception(HTTPException(
+                    status_code=502,
+                    detail={"error": {"code": "QUICKBOOKS_ERROR", "message": f"{message} ({query})"}},
+                ))
+            else:
+                future.set_result(item.get("QueryResponse", {}))
+
+
+_batcher: QuickBooksBatcher | None = None
+
+
+def get_quickbooks_batcher() -> QuickBooksBatcher:
+    global _batcher
+    if _batcher is None:
+        _batcher = QuickBooksBatcher()
+    return _batcher
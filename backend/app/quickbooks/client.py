@@ -0,0 +1,96 @@
+import asyncio
+import random
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import httpx
+from fastapi import HTTPException
+from app.shared.serialization import loads
+from app.quickbooks.ratelimit import RealmRateLimiter, limiter as default_limiter
+from app.config import settings
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def _retry_after(response: httpx.Response) -> float | None:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter: uniform in [0, min(cap, base * 2^attempt)]
+    return random.uniform(0, min(settings.QUICKBOOKS_BACKOFF_MAX_SECONDS, settings.QUICKBOOKS_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+class QuickBooksClient:
+    """Realm-throttled QuickBooks API calls with retry on 429/5xx; non-2xx responses raise instead of returning defaults."""
+
+    def __init__(self, limiter: RealmRateLimiter | None = None):
+        self.limiter = limiter or default_limiter
+        self.http = httpx.AsyncClient(timeout=settings.QUICKBOOKS_TIMEOUT_SECONDS)
+
+    async def request(self, method: str, url: str, realm_id: str, access_token: str, **kwargs) -> dict:
+        headers = {"Authorization": f"Bearer {access_token}", "Accept": "application/json", **kwargs.pop("headers", {})}
+        for attempt in range(settings.QUICKBOOKS_MAX_RETRIES + 1):
+            await self.limiter.acquire(realm_id)
+            try:
+                response = await self.http.request(method, url, headers=headers, **kwargs)
+            except httpx.TransportError:
+                if attempt == settings.QUICKBOOKS_MAX_RETRIES:
+                    raise HTTPException(status_code=502, detail={"error": {"code": "QUICKBOOKS_UNAVAILABLE", "message": "QuickBooks API unreachable"}})
+                await asyncio.sleep(_backoff(attempt))
+                continue
+
+            if response.status_code < 300:
+                try:
+                    return loads(response.content)
+                except ValueError:
+                    # A proxy or maintenance page answering 200 with HTML; treat it like an outage
+                    raise HTTPException(status_code=502, detail={"error": {"code": "QUICKBOOKS_UNAVAILABLE", "message": "QuickBooks returned an unreadable response"}})
+            if response.status_code not in RETRYABLE_STATUS or attempt == settings.QUICKBOOKS_MAX_RETRIES:
+                break
+            delay = _retry_after(response)
+            await asyncio.sleep(delay if delay is not None else _backoff(attempt))
+
+        if response.status_code == 429:
+            raise HTTPException(status_code=503, detail={"error": {"code": "QUICKBOOKS_RATE_LIMITED", "message": "QuickBooks rate limit exceeded"}})
+        if response.status_code == 401:
+            raise HTTPException(status_code=401, detail={"error": {"code": "QUICKBOOKS_UNAUTHORIZED", "message": "QuickBooks access token rejected"}})
+        raise HTTPException(
+            status_code=502,
+            detail={"error": {"code": "QUICKBOOKS_ERROR", "message": f"QuickBooks API returned {response.status_code}"}},
+        )
+
+    async def get(self, url: str, realm_id: str, access_token: str, **kwargs) -> dict:
+        return await self.request("GET", url, realm_id, access_token, **kwargs)
+
+    async def post(self, url: str, realm_id: str, access_token: str, **kwargs) -> dict:
+        return await self.request("POST", url, realm_id, access_token, **kwargs)
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
+
+
+_client: QuickBooksClient | None = None
+
+
+def get_quickbooks_client() -> QuickBooksClient:
+    global _client
+    if _client is None:
+        _client = QuickBooksClient()
+    return _client
+
+
+async def close_quickbooks_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,79 @@
+import asyncio
+import time
+from redis.exceptions import RedisError
+from app.shared.redis import get_redis
+from app.config import settings
+
+# Token bucket in a Redis hash; returns the seconds to wait (0 when a token was taken).
+# Uses the server clock so every worker sees the same refill timeline.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class LocalTokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.ts = time.monotonic()
+
+    def take(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+        self.ts = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RealmRateLimiter:
+    """Per-realm token bucket shared across workers through Redis, with an in-process fallback."""
+
+    def __init__(self, requests_per_minute: int | None = None, burst: int | None = None):
+        self.rate = (requests_per_minute or settings.QUICKBOOKS_REQUESTS_PER_MINUTE) / 60
+        self.capacity = burst or settings.QUICKBOOKS_BURST
+        self._local: dict[str, LocalTokenBucket] = {}
+        self._script = None
+        self._redis_down_until = 0.0
+
+    async def _take(self, realm_id: str) -> float:
+        if time.monotonic() >= self._redis_down_until:
+            try:
+                if self._script is None:
+                    self._script = get_redis().register_script(TOKEN_BUCKET_SCRIPT)
+                return float(await self._script(keys=[f"qb:ratelimit:{realm_id}"], args=[self.rate, self.capacity]))
+            except (RedisError, OSError):
+                # Don't pay a connect timeout on every request while Redis is away
+                self._redis_down_until = time.monotonic() + 30
+        bucket = self._local.get(realm_id)
+        if bucket is None:
+            bucket = self._local[realm_id] = LocalTokenBucket(self.rate, self.capacity)
+        return bucket.take()
+
+    async def acquire(self, realm_id: str) -> None:
+        while True:
+            wait = await self._take(realm_id)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+limiter = RealmRateLimiter()
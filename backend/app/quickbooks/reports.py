@@ -0,0 +1,125 @@
+import calendar
+from dataclasses import dataclass
+from datetime import date, timedelta
+import numpy as np
+
+_MONTHS = {name: number for number, name in enumerate(calendar.month_name) if name}
+
+
+@dataclass
+class ProfitAndLossReport:
+    """A P&L report summarized by month, flattened to one row per account.
+
+    values is accounts × months; groups[i] is the top-level section (Income, Expenses, ...)
+    account i sits under. group_totals holds each section's Summary row per month.
+    """
+
+    months: list[tuple[date, date]]
+    accounts: list[str]
+    account_ids: list[str | None]
+    groups: list[str]
+    values: np.ndarray
+    group_totals: dict[str, np.ndarray]
+
+    def group_series(self, group: str) -> np.ndarray:
+        """Monthly totals for a section, falling back to summing its accounts when the report has no Summary."""
+        if group in self.group_totals:
+            return self.group_totals[group]
+        mask = np.array([g == group for g in self.groups], dtype=bool)
+        if not mask.any():
+            return np.zeros(len(self.months))
+        return self.values[mask].sum(axis=0)
+
+    @property
+    def revenue_series(self) -> np.ndarray:
+        return self.group_series("Income")
+
+
+def _money(cell: dict) -> float:
+    try:
+        return float(cell.get("value") or 0)
+    except ValueError:
+        return 0.0
+
+
+def _month_columns(columns: list[dict]) -> tuple[list[int], list[tuple[date, date]]]:
+    """Indices of the per-month money columns (skipping the label and Total columns) and their date ranges."""
+    indices, months = [], []
+    for i, column in enumerate(columns):
+        meta = {item.get("Name"): item.get("Value") for item in column.get("MetaData", [])}
+        if column.get("ColType") == "Money" and "StartDate" in meta and "EndDate" in meta:
+            indices.append(i)
+            months.append((date.fromisoformat(meta["StartDate"]), date.fromisoformat(meta["EndDate"])))
+    return indices, months
+
+
+def parse_profit_and_loss(data: dict) -> ProfitAndLossReport:
+    """Flatten a summarize_column_by=Month P&L in one iterative pass (no recursion, so nesting depth is unbounded)."""
+    indices, months = _month_columns(data.get("Columns", {}).get("Column", []))
+    accounts: list[str] = []
+    account_ids: list[str | None] = []
+    groups: list[str] = []
+    rows: list[list[float]] = []
+    group_totals: dict[str, np.ndarray] = {}
+
+    # (row, top-level group); reversed so rows come out in report order
+    stack = [(row, row.get("group", "")) for row in reversed(data.get("Rows", {}).get("Row", []))]
+    while stack:
+        row, group = stack.pop()
+        if "Rows" in row or "Summary" in row:
+            summary = row.get("Summary", {}).get("ColData")
+            if summary and row.get("group") == group and group not in group_totals:
+                # A short Summary row still yields one figure per month, like a short account row
+                group_totals[group] = np.array([_money(summary[i]) if i < len(summary) else 0.0 for i in indices], dtype=np.float64)
+            stack.extend((child, group) for child in reversed(row.get("Rows", {}).get("Row", [])))
+            continue
+        cells = row.get("ColData")
+        if not cells:
+            continue
+        accounts.append(cells[0].get("value", ""))
+        account_ids.append(cells[0].get("id"))
+        groups.append(group)
+        rows.append([_money(cells[i]) if i < len(cells) else 0.0 for i in indices])
+
+    values = np.array(rows, dtype=np.float64) if rows else np.zeros((0, len(months)))
+    return ProfitAndLossReport(months, accounts, account_ids, groups, values, group_totals)
+
+
+def revenue_volatility(series: np.ndarray) -> float | None:
+    """Coefficient of variation of monthly revenue; None with fewer than three months or no revenue."""
+    if len(series) < 3:
+        return None
+    mean = series.mean()
+    if mean <= 0:
+        return None
+    return float(series.std() / mean)
+
+
+def fiscal_year_start_month(company_info: dict) -> int | None:
+    """CompanyInfo's FiscalYearStartMonth ("January", ...) as a month number."""
+    return _MONTHS.get(company_info.get("FiscalYearStartMonth", ""))
+
+
+def fiscal_year_start(today: date, start_month: int) -> date:
+    return date(today.year if today.month >= start_month else today.year - 1, start_month, 1)
+
+
+def revenue_figures(report: ProfitAndLossReport, today: date, fiscal_month: int = 1) -> dict:
+    """Year-to-date and trailing income, volatility and MRR from a monthly P&L that runs through today.
+
+    total_income is fiscal year to date, as QuickBooks' own P&L reports it; trailing_income
+    covers every month in the report. Unless today is the last day of the month, the final
+    column is still in progress: it counts toward both totals but is kept out of volatility and MRR.
+    """
+    if not report.months:
+        return {"total_income": None, "trailing_income": None, "revenue_volatility": None, "mrr": None}
+    series = report.revenue_series
+    year_start = fiscal_year_start(today, fiscal_month)
+    in_year = np.array([start >= year_start for start, _ in report.months], dtype=bool)
+    complete = series[:-1] if (today + timedelta(days=1)).month == today.month else series
+    return {
+        "total_income": float(series[in_year].sum()),
+        "trailing_income": float(series.sum()),
+        "revenue_volatility": revenue_volatility(complete),
+        "mrr": float(complete[-1]) if len(complete) else None,
+    }
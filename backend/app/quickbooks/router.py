@@ -1,14 +1,19 @@
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header, Request
 from fastapi.responses import RedirectResponse
+from redis.exceptions import RedisError
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.shared.serialization import FastJSONRoute
 from app.shared.database import get_db
 from app.shared.deps import get_current_user
 from app.shared.models import User
 from app.config import settings
+from app.jobs.pipeline import enqueue_stage, get_job_pool
 from app.quickbooks.service import QuickBooksService
+from app.users.service import UsersService
+from app.quickbooks.webhooks import QuickBooksWebhookService, verify_signature
 
-router = APIRouter(tags=["quickbooks"])
+router = APIRouter(tags=["quickbooks"], route_class=FastJSONRoute)
 
 
 @router.get("/integrations/quickbooks/connect")
@@ -91,6 +96,26 @@ async def quickbooks_sync(
     db: AsyncSession = Depends(get_db),
 ):
     """Manually trigger sync of QuickBooks financial data."""
+    # Runs inline, ahead of anything the scheduler has queued; the sync itself sets the next due time
+    UsersService(db).record_activity(business_id)
     service = QuickBooksService(db)
-    data = await service.sync_financial_data(business_id)
+    data, changed = await service.sync(business_id, allow_unleased=True)
+    if changed:
+        try:
+            await enqueue_stage(get_job_pool(), "metrics", business_id)
+        except RedisError:
+            pass  # the sync itself succeeded; the daily reconcile_pipeline run picks the change up
     return {"status": "synced", "data": data}
+
+
+@router.post("/integrations/quickbooks/webhook")
+async def quickbooks_webhook(
+    request: Request,
+    intuit_signature: str | None = Header(None),
+    db: AsyncSession = Depends(get_db),
+):
+    """Receive QuickBooks change notifications; queued here, synced by the worker."""
+    body = await request.body()
+    verify_signature(body, intuit_signature)
+    queued = await QuickBooksWebhookService(db).enqueue(body)
+    return {"status": "accepted", "queued": queued}
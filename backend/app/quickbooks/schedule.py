@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+from app.config import settings
+
+# Weight of the latest sync in the change-rate average; roughly the last five syncs dominate
+CHANGE_RATE_WEIGHT = 0.3
+
+
+def update_change_rate(rate: float | None, changed: bool) -> float:
+    """Exponentially weighted share of syncs that found new figures; new integrations start at 1."""
+    previous = 1.0 if rate is None else rate
+    return CHANGE_RATE_WEIGHT * changed + (1 - CHANGE_RATE_WEIGHT) * previous
+
+
+def is_active(last_active_at: datetime | None, now: datetime) -> bool:
+    return last_active_at is not None and now - last_active_at < timedelta(hours=settings.QUICKBOOKS_ACTIVE_WINDOW_HOURS)
+
+
+def min_sync_interval() -> timedelta:
+    return timedelta(minutes=settings.QUICKBOOKS_SYNC_MIN_INTERVAL_MINUTES)
+
+
+def sync_interval(change_rate: float, last_active_at: datetime | None, now: datetime) -> timedelta:
+    """Time until the next scheduled sync.
+
+    Geometric between the max interval (syncs never find changes) and the min (every sync
+    does). Businesses someone has looked at recently always get the min, so adapting
+    never makes an active user's data staler than a fixed schedule would.
+    """
+    low = settings.QUICKBOOKS_SYNC_MIN_INTERVAL_MINUTES
+    if is_active(last_active_at, now):
+        return timedelta(minutes=low)
+    high = settings.QUICKBOOKS_SYNC_MAX_INTERVAL_MINUTES
+    return timedelta(minutes=high * (low / high) ** change_rate)
@@ -1,11 +1,25 @@
+import asyncio
+from contextlib import AsyncExitStack
 from uuid import UUID
 import secrets
+from datetime import date, datetime, timedelta, timezone
 import httpx
+from redis.exceptions import RedisError
 from urllib.parse import urlencode
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update, func, literal
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm.attributes import set_committed_value
 from fastapi import HTTPException
 from app.shared.models import IntegrationAccount, Business
+from app.shared.serialization import loads
+from app.shared.locks import Lease, LeaseNotAcquired
+from app.quickbooks.client import get_quickbooks_client
+from app.quickbooks.batch import get_quickbooks_batcher
+from app.quickbooks.tokens import token_manager
+from app.quickbooks.reports import parse_profit_and_loss, revenue_figures, fiscal_year_start, fiscal_year_start_month
+from app.quickbooks.schedule import update_change_rate, sync_interval, min_sync_interval
+from app.jobs.pipeline import enqueue_stage, get_job_pool
 from app.config import settings
 
 QUICKBOOKS_AUTH_URL = "https://appcenter.intuit.com/connect/oauth2"
@@ -17,9 +31,28 @@ QUICKBOOKS_API_BASE = {
 }
 
 
+async def merge_metadata(db: AsyncSession, integration: IntegrationAccount, patch: dict) -> None:
+    """Set top-level metadata keys in place, leaving every other key as stored.
+
+    The backfill writes months under metadata.backfill while syncs and token refreshes run under
+    other leases, so no writer may put back a whole copy of the document it read earlier.
+    The caller commits.
+    """
+    result = await db.execute(
+        update(IntegrationAccount)
+        .where(IntegrationAccount.id == integration.id)
+        .values(metadata_=func.coalesce(IntegrationAccount.metadata_, literal({}, JSONB)).op("||")(literal(patch, JSONB)))
+        .returning(IntegrationAccount.metadata_)
+        .execution_options(synchronize_session=False)
+    )
+    set_committed_value(integration, "metadata_", result.scalar_one())
+
+
 class QuickBooksService:
     def __init__(self, db: AsyncSession):
         self.db = db
+        self.client = get_quickbooks_client()
+        self.batcher = get_quickbooks_batcher()
 
     def _get_api_base(self) -> str:
         return QUICKBOOKS_API_BASE.get(settings.QUICKBOOKS_ENVIRONMENT, QUICKBOOKS_API_BASE["sandbox"])
@@ -105,13 +138,15 @@ class QuickBooksService:
                 },
             )
 
-        token_data = response.json()
+        token_data = loads(response.content)
         access_token = token_data.get("access_token")
         refresh_token = token_data.get("refresh_token")
-        expires_in = token_data.get("expires_in", 3600)
+        token_expires_at = datetime.now(timezone.utc) + timedelta(seconds=token_data.get("expires_in", 3600))
 
         # Get company info
-        company_name = await self._get_company_name(access_token, realm_id)
+        company_info = await self._get_company_info(access_token, realm_id)
+        company_name = company_info.get("CompanyName", "Unknown")
+        fiscal_month = fiscal_year_start_month(company_info)
 
         # Check for existing integration
         result = await self.db.execute(
@@ -123,56 +158,64 @@ class QuickBooksService:
         integration = result.scalar_one_or_none()
 
         if integration:
+            same_company = integration.external_id == realm_id and (
+                (integration.metadata_ or {}).get("environment") == settings.QUICKBOOKS_ENVIRONMENT
+            )
             integration.external_id = realm_id
             integration.access_token_encrypted = access_token  # TODO: encrypt
+            integration.token_expires_at = token_expires_at
             integration.status = "active"
-            integration.metadata_ = {
+            details = {
                 "refresh_token": refresh_token,  # TODO: encrypt
-                "expires_in": expires_in,
                 "company_name": company_name,
                 "environment": settings.QUICKBOOKS_ENVIRONMENT,
+                **({"fiscal_year_start_month": fiscal_month} if fiscal_month else {}),
             }
+            if same_company:
+                # Keeps the backfill progress, so a running backfill carries on and finished months aren't refetched
+                await merge_metadata(self.db, integration, details)
+            else:
+                integration.metadata_ = details
         else:
             integration = IntegrationAccount(
                 business_id=business_id,
                 provider="quickbooks",
                 external_id=realm_id,
                 access_token_encrypted=access_token,  # TODO: encrypt
+                token_expires_at=token_expires_at,
                 status="active",
                 metadata_={
                     "refresh_token": refresh_token,  # TODO: encrypt
-                    "expires_in": expires_in,
                     "company_name": company_name,
                     "environment": settings.QUICKBOOKS_ENVIRONMENT,
+                    **({"fiscal_year_start_month": fiscal_month} if fiscal_month else {}),
                 },
             )
             self.db.add(integration)
 
         await self.db.commit()
         await self.db.refresh(integration)
+
+        # History comes from the worker; it resumes a reconnected company's backfill, or returns at once if it is complete
+        try:
+            await enqueue_stage(get_job_pool(), "backfill", business_id)
+        except RedisError:
+            pass  # reconcile_pipeline picks up unfinished backfills daily
         return integration
 
-    async def _get_company_name(self, access_token: str, realm_id: str) -> str:
-        """Fetch company name from QuickBooks."""
+    async def _get_company_info(self, access_token: str, realm_id: str) -> dict:
+        """Fetch CompanyInfo from QuickBooks; empty if it is unavailable."""
         api_base = self._get_api_base()
         url = f"{api_base}/v3/company/{realm_id}/companyinfo/{realm_id}"
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                url,
-                headers={
-                    "Authorization": f"Bearer {access_token}",
-                    "Accept": "application/json",
-                },
-            )
-
-        if response.status_code == 200:
-            data = response.json()
-            return data.get("CompanyInfo", {}).get("CompanyName", "Unknown")
-        return "Unknown"
+        try:
+            data = await self.client.get(url, realm_id, access_token)
+        except HTTPException:
+            return {}  # Name and fiscal year are filled in later; never fail the connect flow over them
+        return data.get("CompanyInfo", {})
 
     async def refresh_access_token(self, integration: IntegrationAccount) -> str:
-        """Refresh expired access token."""
+        """Refresh the access token; callers go through token_manager so only one refresh runs per expiry."""
         refresh_token = integration.metadata_.get("refresh_token")
         if not refresh_token:
             raise HTTPException(
@@ -185,20 +228,21 @@ class QuickBooksService:
                 },
             )
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                QUICKBOOKS_TOKEN_URL,
-                data={
-                    "grant_type": "refresh_token",
-                    "refresh_token": refresh_token,
-                },
-                auth=(settings.QUICKBOOKS_CLIENT_ID, settings.QUICKBOOKS_CLIENT_SECRET),
-                headers={"Accept": "application/json"},
-            )
+        response = await self.client.http.post(
+            QUICKBOOKS_TOKEN_URL,
+            data={
+                "grant_type": "refresh_token",
+                "refresh_token": refresh_token,
+            },
+            auth=(settings.QUICKBOOKS_CLIENT_ID, settings.QUICKBOOKS_CLIENT_SECRET),
+            headers={"Accept": "application/json"},
+        )
 
         if response.status_code != 200:
-            integration.status = "expired"
-            await self.db.commit()
+            if response.status_code in (400, 401):
+                # invalid_grant: the refresh token is revoked or expired; the user must reconnect
+                integration.status = "expired"
+                await self.db.commit()
             raise HTTPException(
                 status_code=400,
                 detail={
@@ -209,16 +253,18 @@ class QuickBooksService:
                 },
             )
 
-        token_data = response.json()
+        token_data = loads(response.content)
         integration.access_token_encrypted = token_data.get("access_token")
-        integration.metadata_["refresh_token"] = token_data.get("refresh_token", refresh_token)
-        integration.metadata_["expires_in"] = token_data.get("expires_in", 3600)
+        integration.token_expires_at = datetime.now(timezone.utc) + timedelta(seconds=token_data.get("expires_in", 3600))
+        # Intuit rotates refresh tokens
+        await merge_metadata(self.db, integration, {"refresh_token": token_data.get("refresh_token", refresh_token)})
         await self.db.commit()
 
         return integration.access_token_encrypted
 
     async def get_connection_status(self, business_id: UUID) -> dict:
         """Check QuickBooks connection status for a business."""
+        from app.quickbooks.backfill import backfill_progress
         result = await self.db.execute(
             select(IntegrationAccount).where(
                 IntegrationAccount.business_id == business_id,
@@ -233,6 +279,7 @@ class QuickBooksService:
             "company_id": integration.external_id,
             "company_name": integration.metadata_.get("company_name"),
             "last_synced_at": integration.last_synced_at,
+            "backfill": backfill_progress(integration.metadata_.get("backfill")),
         }
 
     async def disconnect(self, business_id: UUID) -> None:
@@ -262,6 +309,16 @@ class QuickBooksService:
 
     async def sync_financial_data(self, business_id: UUID) -> dict:
         """Pull financial data from QuickBooks and return metrics."""
+        data, _ = await self.sync(business_id)
+        return data
+
+    async def sync(self, business_id: UUID, allow_unleased: bool = False) -> tuple[dict, bool]:
+        """Pull financial data and keep it on the integration for the metrics stage.
+
+        allow_unleased lets a caller that must not fail on Redis (the API) sync without the
+        company's lease while Redis is unreachable, as the rate limiter falls back locally.
+        Returns (metrics, whether they differ from the previous sync).
+        """
         result = await self.db.execute(
             select(IntegrationAccount).where(
                 IntegrationAccount.business_id == business_id,
@@ -280,26 +337,56 @@ class QuickBooksService:
                 },
             )
 
-        access_token = integration.access_token_encrypted
+        # One sync per company at a time across API replicas and workers, so no API call is duplicated
+        async with AsyncExitStack() as stack:
+            try:
+                await stack.enter_async_context(Lease(f"sync:{business_id}"))
+            except LeaseNotAcquired:
+                raise HTTPException(
+                    status_code=409,
+                    detail={"error": {"code": "SYNC_IN_PROGRESS", "message": "A QuickBooks sync is already running"}},
+                )
+            except (RedisError, OSError):
+                if not allow_unleased:
+                    raise
+            return await self._sync(integration)
+
+    async def expedite_sync(self, business_id: UUID) -> None:
+        """Someone is looking at the business: pull a sync scheduled far out back to one min interval after the last."""
+        await self.db.execute(
+            update(IntegrationAccount)
+            .where(IntegrationAccount.business_id == business_id, IntegrationAccount.status == "active")
+            .values(next_sync_due_at=func.least(IntegrationAccount.next_sync_due_at, IntegrationAccount.last_synced_at + min_sync_interval()))
+        )
+        await self.db.commit()
+
+    async def _sync(self, integration: IntegrationAccount) -> tuple[dict, bool]:
+        access_token = await token_manager.get_access_token(integration)
         realm_id = integration.external_id
         api_base = self._get_api_base()
+        fiscal_month = integration.metadata_.get("fiscal_year_start_month")
+        if fiscal_month is None:
+            # Connected before the fiscal year was recorded, or CompanyInfo failed then
+            fiscal_month = fiscal_year_start_month(await self._get_company_info(access_token, realm_id))
+            if fiscal_month:
+                await merge_metadata(self.db, integration, {"fiscal_year_start_month": fiscal_month})
+
+        # Both COUNT queries ride one /batch call; reports are not batchable, so the P&L runs alongside it
+        revenue_data, invoice_count, credit_memo_count = await asyncio.gather(
+            self._fetch_profit_and_loss(access_token, realm_id, api_base, fiscal_month or 1),
+            self._fetch_count("Invoice", access_token, realm_id, api_base),
+            self._fetch_count("CreditMemo", access_token, realm_id, api_base),
+        )
+        refund_data = {
+            "count": credit_memo_count,
+            "ratio": credit_memo_count / invoice_count if invoice_count > 0 else None,
+        }
 
-        # Fetch P&L report
-        revenue_data = await self._fetch_profit_and_loss(access_token, realm_id, api_base)
-
-        # Fetch invoices for transaction count
-        invoice_count = await self._fetch_invoice_count(access_token, realm_id, api_base)
-
-        # Fetch credit memos for refund data
-        refund_data = await self._fetch_refund_data(access_token, realm_id, api_base)
-
-        # Update last_synced_at
-        from datetime import datetime, timezone
-        integration.last_synced_at = datetime.now(timezone.utc)
-        await self.db.commit()
-
-        return {
+        data = {
             "revenue_total": revenue_data.get("total_income"),
+            "revenue_trailing_total": revenue_data.get("trailing_income"),
+            "revenue_volatility": revenue_data.get("revenue_volatility"),
+            "mrr": revenue_data.get("mrr"),
             "transaction_count": invoice_count,
             "refund_count": refund_data.get("count", 0),
             "refund_ratio": refund_data.get("ratio"),
@@ -308,84 +395,65 @@ class QuickBooksService:
             "payout_reliability": None,  # Not applicable
         }
 
+        changed = integration.metadata_.get("financials") != data
+        if changed:
+            await merge_metadata(self.db, integration, {"financials": data})
+        now = datetime.now(timezone.utc)
+        last_active_at = (
+            await self.db.execute(select(Business.last_active_at).where(Business.id == integration.business_id))
+        ).scalar_one_or_none()
+        integration.change_rate = update_change_rate(integration.change_rate, changed)
+        integration.next_sync_due_at = now + sync_interval(integration.change_rate, last_active_at, now)
+        integration.last_synced_at = now
+        await self.db.commit()
+        return data, changed
+
     async def _fetch_profit_and_loss(
-        self, access_token: str, realm_id: str, api_base: str
+        self, access_token: str, realm_id: str, api_base: str, fiscal_month: int = 1
     ) -> dict:
-        """Fetch P&L report from QuickBooks."""
+        """Fetch a month-by-month P&L for the trailing QUICKBOOKS_REPORT_MONTHS and the fiscal year so far, and derive revenue figures from it."""
+        today = date.today()
+        months_back = today.year * 12 + today.month - settings.QUICKBOOKS_REPORT_MONTHS
+        start = min(date(months_back // 12, months_back % 12 + 1, 1), fiscal_year_start(today, fiscal_month))
         url = f"{api_base}/v3/company/{realm_id}/reports/ProfitAndLoss"
+        data = await self.client.get(
+            url,
+            realm_id,
+            access_token,
+            params={
+                "start_date": start.isoformat(),
+                "end_date": today.isoformat(),
+                "summarize_column_by": "Month",
+            },
+        )
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                url,
-                headers={
-                    "Authorization": f"Bearer {access_token}",
-                    "Accept": "application/json",
-                },
-                params={"date_macro": "This Fiscal Year-to-date"},
-            )
-
-        if response.status_code != 200:
-            return {"total_income": None}
-
-        data = response.json()
-        # Parse P&L structure to get total income
-        rows = data.get("Rows", {}).get("Row", [])
-        for row in rows:
-            if row.get("group") == "Income":
-                summary = row.get("Summary", {})
-                col_data = summary.get("ColData", [])
-                if len(col_data) > 1:
-                    return {"total_income": float(col_data[1].get("value", 0))}
-        return {"total_income": None}
-
-    async def _fetch_invoice_count(
-        self, access_token: str, realm_id: str, api_base: str
-    ) -> int:
-        """Fetch invoice count from QuickBooks."""
-        url = f"{api_base}/v3/company/{realm_id}/query"
-        query = "SELECT COUNT(*) FROM Invoice"
-
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                url,
-                headers={
-                    "Authorization": f"Bearer {access_token}",
-                    "Accept": "application/json",
-                },
-                params={"query": query},
-            )
-
-        if response.status_code != 200:
-            return 0
-
-        data = response.json()
-        return data.get("QueryResponse", {}).get("totalCount", 0)
-
-    async def _fetch_refund_data(
-        self, access_token: str, realm_id: str, api_base: str
-    ) -> dict:
-        """Fetch refund/credit memo data from QuickBooks."""
-        url = f"{api_base}/v3/company/{realm_id}/query"
-        query = "SELECT COUNT(*) FROM CreditMemo"
-
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                url,
-                headers={
-                    "Authorization": f"Bearer {access_token}",
-                    "Accept": "application/json",
-                },
-                params={"query": query},
-            )
-
-        if response.status_code != 200:
-            return {"count": 0, "ratio": None}
-
-        data = response.json()
-        count = data.get("QueryResponse", {}).get("totalCount", 0)
+        return revenue_figures(parse_profit_and_loss(data), today, fiscal_month)
 
-        # Calculate ratio if we have invoice count
-        invoice_count = await self._fetch_invoice_count(access_token, realm_id, api_base)
-        ratio = count / invoice_count if invoice_count > 0 else None
+    async def fetch_month(self, access_token: str, realm_id: str, start: date, end: date) -> dict:
+        """Revenue and invoice/credit memo counts for one month, for historical backfill."""
+        api_base = self._get_api_base()
+        where = f"TxnDate >= '{start.isoformat()}' AND TxnDate <= '{end.isoformat()}'"
+        data, invoice_count, credit_memo_count = await asyncio.gather(
+            self.client.get(
+                f"{api_base}/v3/company/{realm_id}/reports/ProfitAndLoss",
+                realm_id,
+                access_token,
+                params={"start_date": start.isoformat(), "end_date": end.isoformat(), "summarize_column_by": "Month"},
+            ),
+            self._fetch_count("Invoice", access_token, realm_id, api_base, where),
+            self._fetch_count("CreditMemo", access_token, realm_id, api_base, where),
+        )
+        report = parse_profit_and_loss(data)
+        return {
+            "revenue": float(report.revenue_series.sum()) if report.months else None,
+            "invoice_count": invoice_count,
+            "credit_memo_count": credit_memo_count,
+        }
 
-        return {"count": count, "ratio": ratio}
+    async def _fetch_count(
+        self, entity: str, access_token: str, realm_id: str, api_base: str, where: str | None = None
+    ) -> int:
+        """Fetch an entity count from QuickBooks, batched with other queries for the realm."""
+        query = f"SELECT COUNT(*) FROM {entity}" + (f" WHERE {where}" if where else "")
+        data = await self.batcher.query(api_base, realm_id, access_token, query)
+        return data.get("totalCount", 0)
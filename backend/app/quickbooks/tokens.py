@@ -0,0 +1,99 @@
+import asyncio
+import secrets
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+from fastapi import HTTPException
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.shared.database import AsyncSessionLocal
+from app.shared.models import IntegrationAccount
+from app.shared.redis import get_redis
+from app.shared.locks import RELEASE_LOCK_SCRIPT
+from app.config import settings
+
+
+def refresh_horizon() -> datetime:
+    """Tokens expiring before this instant are due for refresh."""
+    return datetime.now(timezone.utc) + timedelta(seconds=settings.QUICKBOOKS_TOKEN_REFRESH_MARGIN_SECONDS)
+
+
+def needs_refresh(integration: IntegrationAccount) -> bool:
+    return integration.token_expires_at is None or integration.token_expires_at <= refresh_horizon()
+
+
+class TokenManager:
+    """Single-flight OAuth token refresh per integration.
+
+    An asyncio.Lock collapses concurrent callers within a process and a Redis lock does the
+    same across workers. Callers that lose either race re-read the row instead of refreshing,
+    so each expiry costs exactly one call to Intuit's token endpoint. If Redis is unreachable
+    the in-process lock still applies.
+    """
+
+    def __init__(self):
+        self._locks: dict[UUID, asyncio.Lock] = {}
+        self._release_script = None
+
+    async def get_access_token(self, integration: IntegrationAccount) -> str:
+        if not needs_refresh(integration):
+            return integration.access_token_encrypted
+        return await self.refresh(integration.id)
+
+    async def refresh(self, integration_id: UUID) -> str:
+        lock = self._locks.setdefault(integration_id, asyncio.Lock())
+        async with lock:
+            async with AsyncSessionLocal() as db:
+                while True:
+                    integration = await self._load(db, integration_id)
+                    if not needs_refresh(integration):
+                        return integration.access_token_encrypted
+
+                    owner = secrets.token_hex(16)
+                    if await self._acquire(integration_id, owner):
+                        try:
+                            # A peer may have finished between our read and taking the lock
+                            integration = await self._load(db, integration_id)
+                            if not needs_refresh(integration):
+                                return integration.access_token_encrypted
+                            from app.quickbooks.service import QuickBooksService
+                            return await QuickBooksService(db).refresh_access_token(integration)
+                        finally:
+                            await self._release(integration_id, owner)
+
+                    # Another worker is refreshing; its lock TTL bounds how long we poll
+                    await asyncio.sleep(0.25)
+
+    async def _load(self, db: AsyncSession, integration_id: UUID) -> IntegrationAccount:
+        result = await db.execute(
+            select(IntegrationAccount)
+            .where(IntegrationAccount.id == integration_id)
+            .execution_options(populate_existing=True)
+        )
+        integration = result.scalar_one_or_none()
+        if not integration or integration.status != "active":
+            raise HTTPException(
+                status_code=400,
+                detail={"error": {"code": "NOT_CONNECTED", "message": "QuickBooks not connected"}},
+            )
+        return integration
+
+    async def _acquire(self, integration_id: UUID, owner: str) -> bool:
+        try:
+            return bool(await get_redis().set(
+                f"qb:token-refresh:{integration_id}", owner,
+                nx=True, px=int(settings.QUICKBOOKS_TOKEN_LOCK_SECONDS * 1000),
+            ))
+        except (RedisError, OSError):
+            return True
+
+    async def _release(self, integration_id: UUID, owner: str) -> None:
+        try:
+            if self._release_script is None:
+                self._release_script = get_redis().register_script(RELEASE_LOCK_SCRIPT)
+            await self._release_script(keys=[f"qb:token-refresh:{integration_id}"], args=[owner])
+        except (RedisError, OSError):
+            pass  # The lock expires on its own
+
+
+token_manager = TokenManager()
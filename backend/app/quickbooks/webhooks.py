@@ -0,0 +1,164 @@
+import base64
+import hashlib
+import hmac
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+from fastapi import HTTPException
+from sqlalchemy import select, insert, update, func, or_, literal_column
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.shared.models import IntegrationAccount, QuickBooksNotification
+from app.shared.serialization import loads
+from app.config import settings
+
+# Entities whose changes move revenue, invoice or refund figures; anything else (Customer, Item, ...) needs no sync
+SYNC_ENTITIES = {
+    "Invoice", "CreditMemo", "Payment", "SalesReceipt", "RefundReceipt",
+    "Deposit", "JournalEntry", "Bill", "BillPayment", "Purchase",
+}
+_CANONICAL_NAMES = {entity.lower(): entity for entity in SYNC_ENTITIES}
+
+
+def _invalid_signature() -> HTTPException:
+    return HTTPException(
+        status_code=401,
+        detail={"error": {"code": "INVALID_SIGNATURE", "message": "Webhook signature verification failed"}},
+    )
+
+
+def verify_signature(body: bytes, signature: str | None) -> None:
+    """intuit-signature is base64(HMAC-SHA256(verifier token, raw body))."""
+    if not settings.QUICKBOOKS_WEBHOOK_VERIFIER_TOKEN or not signature:
+        raise _invalid_signature()
+    digest = hmac.new(settings.QUICKBOOKS_WEBHOOK_VERIFIER_TOKEN.encode(), body, hashlib.sha256).digest()
+    if not hmac.compare_digest(base64.b64encode(digest).decode(), signature):
+        raise _invalid_signature()
+
+
+def _invalid_body(message: str) -> HTTPException:
+    return HTTPException(status_code=400, detail={"error": {"code": "VALIDATION_ERROR", "message": message}})
+
+
+def parse_notifications(body: bytes) -> list[tuple[str, dict]]:
+    """Split a webhook body into (realm_id, notification) pairs.
+
+    Handles the legacy {"eventNotifications": [...]} envelope and the CloudEvents array format.
+    """
+    try:
+        data = loads(body)
+    except ValueError:
+        raise _invalid_body("Webhook body is not valid JSON")
+    if isinstance(data, list):
+        events, realm_key = data, "intuitaccountid"
+    elif isinstance(data, dict) and isinstance(data.get("eventNotifications", []), list):
+        events, realm_key = data.get("eventNotifications", []), "realmId"
+    else:
+        raise _invalid_body("Webhook body is neither an event array nor an eventNotifications envelope")
+    if not all(isinstance(event, dict) for event in events):
+        raise _invalid_body("Webhook notifications must be objects")
+    return [(str(event[realm_key]), event) for event in events if event.get(realm_key)]
+
+
+def changed_entities(notification: dict) -> set[str]:
+    if isinstance(notification.get("type"), str):
+        # CloudEvents: "qbo.invoice.created.v1"
+        parts = notification["type"].split(".")
+        name = parts[1] if len(parts) > 1 else ""
+        return {_CANONICAL_NAMES.get(name.lower(), name)}
+    change = notification.get("dataChangeEvent")
+    entities = change.get("entities") if isinstance(change, dict) else None
+    if not isinstance(entities, list):
+        return set()
+    return {entity.get("name", "") for entity in entities if isinstance(entity, dict)}
+
+
+class QuickBooksWebhookService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def enqueue(self, body: bytes) -> int:
+        """Append raw notifications in one INSERT; processing happens in the worker."""
+        rows = [
+            {"id": uuid.uuid4(), "realm_id": realm_id, "payload": notification}
+            for realm_id, notification in parse_notifications(body)
+        ]
+        if rows:
+            await self.db.execute(insert(QuickBooksNotification).values(rows))
+            await self.db.commit()
+        return len(rows)
+
+    async def claim_batch(self, limit: int | None = None) -> dict[str, tuple[set[str], list[UUID]]]:
+        """Claim the oldest due notifications and coalesce them per realm.
+
+        Claiming counts an attempt and leases the rows for QUICKBOOKS_WEBHOOK_CLAIM_SECONDS
+        (SKIP LOCKED keeps concurrent drains apart). The drain then marks them complete() once
+        their sync is queued, or release()s them; rows of a drain that died become due again
+        when the lease runs out.
+        Rows that failed QUICKBOOKS_WEBHOOK_MAX_ATTEMPTS times are left unprocessed and no
+        longer claimed; the adaptive sync schedule still picks up their changes.
+        Returns realm_id -> (changed entities, notification ids).
+        """
+        result = await self.db.execute(
+            select(QuickBooksNotification.id, QuickBooksNotification.realm_id, QuickBooksNotification.payload)
+            .where(
+                QuickBooksNotification.processed_at.is_(None),
+                QuickBooksNotification.attempts < settings.QUICKBOOKS_WEBHOOK_MAX_ATTEMPTS,
+                or_(QuickBooksNotification.next_attempt_at.is_(None), QuickBooksNotification.next_attempt_at <= func.now()),
+            )
+            .order_by(QuickBooksNotification.created_at)
+            .limit(limit or settings.QUICKBOOKS_WEBHOOK_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+        realms: dict[str, tuple[set[str], list[UUID]]] = defaultdict(lambda: (set(), []))
+        for row in result.all():
+            entities, ids = realms[row.realm_id]
+            entities.update(changed_entities(row.payload))
+            ids.append(row.id)
+
+        if realms:
+            await self.db.execute(
+                update(QuickBooksNotification)
+                .where(QuickBooksNotification.id.in_([i for _, ids in realms.values() for i in ids]))
+                .values(
+                    attempts=QuickBooksNotification.attempts + 1,
+                    next_attempt_at=datetime.now(timezone.utc) + timedelta(seconds=settings.QUICKBOOKS_WEBHOOK_CLAIM_SECONDS),
+                )
+            )
+        await self.db.commit()
+        return dict(realms)
+
+    async def complete(self, notification_ids: list[UUID]) -> None:
+        if not notification_ids:
+            return
+        await self.db.execute(
+            update(QuickBooksNotification)
+            .where(QuickBooksNotification.id.in_(notification_ids))
+            .values(processed_at=datetime.now(timezone.utc), next_attempt_at=None)
+        )
+        await self.db.commit()
+
+    async def release(self, notification_ids: list[UUID]) -> None:
+        """Return notifications whose sync could not be queued; they wait out an exponential backoff on the row's attempts."""
+        if not notification_ids:
+            return
+        delay = func.least(
+            settings.QUICKBOOKS_WEBHOOK_RETRY_MAX_SECONDS,
+            settings.QUICKBOOKS_WEBHOOK_RETRY_BASE_SECONDS * func.power(2, QuickBooksNotification.attempts - 1),
+        )
+        await self.db.execute(
+            update(QuickBooksNotification)
+            .where(QuickBooksNotification.id.in_(notification_ids))
+            .values(next_attempt_at=func.now() + delay * literal_column("interval '1 second'"))
+        )
+        await self.db.commit()
+
+    async def businesses_for_realms(self, realm_ids: list[str]) -> dict[str, UUID]:
+        result = await self.db.execute(
+            select(IntegrationAccount.external_id, IntegrationAccount.business_id).where(
+                IntegrationAccount.provider == "quickbooks",
+                IntegrationAccount.status == "active",
+                IntegrationAccount.external_id.in_(realm_ids),
+            )
+        )
+        return {row.external_id: row.business_id for row in result.all()}
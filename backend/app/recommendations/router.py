@@ -1,15 +1,23 @@
 from uuid import UUID
 from typing import Optional
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.shared.serialization import FastJSONRoute, rows_response
 from app.shared.database import get_db
 from app.shared.deps import get_current_user
 from app.shared.models import User
-from app.recommendations.schemas import RecommendationsListResponse, RecommendationResponse, RecommendationStatusUpdate
+from app.recommendations.schemas import (
+    RecommendationsListResponse,
+    RecommendationResponse,
+    RecommendationStatusUpdate,
+    BulkRecommendationStatusUpdate,
+    BulkRecommendationStatusResponse,
+    recommendations_list_adapter,
+)
 from app.recommendations.service import RecommendationsService
 from app.users.service import UsersService
 
-router = APIRouter(tags=["recommendations"])
+router = APIRouter(tags=["recommendations"], route_class=FastJSONRoute)
 
 
 @router.get("/recommendations", response_model=RecommendationsListResponse)
@@ -17,12 +25,24 @@ async def get_recommendations(
     business_id: UUID,
     status: Optional[str] = None,
     priority: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    await UsersService(db).assert_business_member(business_id, current_user.id)
-    recs = await RecommendationsService(db).get_recommendations(business_id, status, priority)
-    return {"recommendations": recs}
+    users = UsersService(db)
+    await users.assert_business_member(business_id, current_user.id)
+    users.record_activity(business_id)
+    recs = await RecommendationsService(db).get_recommendations(business_id, status, priority, limit)
+    return rows_response(recommendations_list_adapter, {"recommendations": recs})
+
+
+@router.patch("/recommendations", response_model=BulkRecommendationStatusResponse)
+async def bulk_update_recommendations(
+    data: BulkRecommendationStatusUpdate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    return await RecommendationsService(db).bulk_update_status(current_user.id, [item.model_dump() for item in data.updates])
 
 
 @router.patch("/recommendations/{recommendation_id}", response_model=RecommendationResponse)
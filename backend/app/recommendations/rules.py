@@ -0,0 +1,131 @@
+import hashlib
+import operator
+from dataclasses import dataclass
+from uuid import UUID
+import numpy as np
+
+COMPARATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+
+@dataclass(frozen=True)
+class RecommendationRule:
+    key: str
+    metric: str
+    comparator: str
+    threshold: float
+    title: str
+    description: str
+    priority: str
+    category: str
+    estimated_impact: str
+    cite_metric: bool = True
+    band_width: float | None = None
+
+    def fingerprint(self, business_id: UUID, value: float) -> str:
+        """Stable identity of a recommendation: same business, rule and metric band map to one row."""
+        band = int(value // self.band_width) if self.band_width else 0
+        return hashlib.sha256(f"{business_id}:{self.key}:{band}".encode()).hexdigest()
+
+    def render(self, business_id: UUID, value: float) -> dict:
+        return {
+            "business_id": business_id,
+            "rule_key": self.key,
+            "fingerprint": self.fingerprint(business_id, value),
+            "title": self.title,
+            "description": self.description.format(value=value, threshold=self.threshold),
+            "priority": self.priority,
+            "category": self.category,
+            "estimated_impact": self.estimated_impact,
+            "metric_refs": {self.metric: value} if self.cite_metric else None,
+        }
+
+
+RULES = [
+    RecommendationRule(
+        key="high_chargebacks",
+        metric="chargeback_ratio",
+        comparator=">",
+        threshold=0.02,
+        title="Reduce chargebacks",
+        description="Your chargeback ratio is above 2%. Consider improving dispute descriptors and customer communication.",
+        priority="high",
+        category="risk",
+        estimated_impact="+10-15 points",
+        band_width=0.02,
+    ),
+    RecommendationRule(
+        key="volatile_revenue",
+        metric="revenue_volatility",
+        comparator=">",
+        threshold=0.5,
+        title="Stabilize revenue streams",
+        description="High revenue volatility detected. Diversifying revenue sources can improve your score.",
+        priority="medium",
+        category="cash_flow",
+        estimated_impact="+5-10 points",
+        band_width=0.25,
+    ),
+    RecommendationRule(
+        key="late_payouts",
+        metric="payout_reliability",
+        comparator="<",
+        threshold=0.80,
+        title="Improve payout timing",
+        description="Less than 80% of payouts are completing on time. Review your payment processor settings.",
+        priority="high",
+        category="cash_flow",
+        estimated_impact="+10 points",
+        band_width=0.2,
+    ),
+    RecommendationRule(
+        key="low_readiness",
+        metric="readiness_score",
+        comparator="<",
+        threshold=50,
+        title="Focus on core metrics",
+        description="Your readiness score is below 50. Focus on reducing chargebacks and stabilizing revenue.",
+        priority="medium",
+        category="general",
+        estimated_impact="Varies",
+        cite_metric=False,
+    ),
+]
+
+RULE_METRICS = sorted({rule.metric for rule in RULES})
+
+
+class RuleEvaluator:
+    """Evaluates every rule against a column per metric, one vectorized comparison per rule.
+
+    Missing metrics are NaN, which compares False, so a rule only fires when its metric is known.
+    """
+
+    def __init__(self, rules: list[RecommendationRule]):
+        self.rules = rules
+        self._compiled = [(rule, COMPARATORS[rule.comparator], np.float64(rule.threshold)) for rule in rules]
+
+    @staticmethod
+    def columns(rows) -> tuple[list[UUID], dict[str, np.ndarray]]:
+        """Turn row mappings with business_id plus one key per metric into float64 columns."""
+        business_ids = [row["business_id"] for row in rows]
+        columns = {
+            metric: np.array([np.nan if row[metric] is None else float(row[metric]) for row in rows], dtype=np.float64)
+            for metric in RULE_METRICS
+        }
+        return business_ids, columns
+
+    def evaluate(self, business_ids: list[UUID], columns: dict[str, np.ndarray]) -> list[dict]:
+        rows = []
+        for rule, compare, threshold in self._compiled:
+            values = columns[rule.metric]
+            for i in np.flatnonzero(compare(values, threshold)):
+                rows.append(rule.render(business_ids[i], float(values[i])))
+        return rows
+
+
+evaluator = RuleEvaluator(RULES)
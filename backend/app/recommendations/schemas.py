@@ -1,7 +1,8 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, TypeAdapter
 from uuid import UUID
 from datetime import datetime
 from typing import Optional
+from typing_extensions import TypedDict
 
 
 class RecommendationResponse(BaseModel):
@@ -23,5 +24,45 @@ class RecommendationsListResponse(BaseModel):
     recommendations: list[RecommendationResponse]
 
 
+# Read-path row shape, serialized without validation; mirrors RecommendationResponse field for field
+class RecommendationRow(TypedDict):
+    id: UUID
+    business_id: UUID
+    title: str
+    description: Optional[str]
+    priority: str
+    category: Optional[str]
+    status: str
+    estimated_impact: Optional[str]
+    created_at: datetime
+
+
+class RecommendationsListRows(TypedDict):
+    recommendations: list[RecommendationRow]
+
+
+recommendations_list_adapter = TypeAdapter(RecommendationsListRows)
+
+
 class RecommendationStatusUpdate(BaseModel):
     status: str
+
+
+class RecommendationStatusItem(BaseModel):
+    id: UUID
+    status: str
+
+
+class BulkRecommendationStatusUpdate(BaseModel):
+    updates: list[RecommendationStatusItem] = Field(..., min_length=1, max_length=500)
+
+
+class BulkUpdateFailure(BaseModel):
+    id: UUID
+    code: str
+    message: str
+
+
+class BulkRecommendationStatusResponse(BaseModel):
+    updated: list[RecommendationStatusItem]
+    failed: list[BulkUpdateFailure]
@@ -1,8 +1,26 @@
+from datetime import timedelta
 from uuid import UUID
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update, func, and_, or_, any_, all_, case, bindparam, String
+from sqlalchemy.dialects.postgresql import insert, ARRAY, UUID as PG_UUID
 from fastapi import HTTPException
-from app.shared.models import Recommendation, FinancialMetricSnapshot, ReadinessScore
+from app.shared.models import PRIORITY_RANKS, Recommendation, FinancialMetricSnapshot, ReadinessScore, IntegrationAccount, Business, UserBusinessMembership
+from app.recommendations.rules import RuleEvaluator, evaluator
+from app.recommendations.schemas import RecommendationRow
+from app.config import settings
+
+
+UPDATABLE_STATUSES = ("accepted", "dismissed")
+RECOMMENDATION_COLUMNS = [getattr(Recommendation, name) for name in RecommendationRow.__annotations__]
+
+
+def _uuid_array(ids):
+    """Bind ids as a single uuid[] parameter for `= ANY(...)`."""
+    return bindparam(None, list(ids), type_=ARRAY(PG_UUID(as_uuid=True)))
+
+
+def _member_business_ids(user_id: UUID):
+    return select(UserBusinessMembership.business_id).where(UserBusinessMembership.user_id == user_id)
 
 
 class RecommendationsService:
@@ -10,94 +28,186 @@ class RecommendationsService:
         self.db = db
 
     async def get_recommendations(
-        self, business_id: UUID, status: str | None = None, priority: str | None = None
-    ) -> list[Recommendation]:
-        query = select(Recommendation).where(Recommendation.business_id == business_id)
+        self, business_id: UUID, status: str | None = None, priority: str | None = None, limit: int | None = None
+    ) -> list[dict]:
+        query = select(*RECOMMENDATION_COLUMNS).where(Recommendation.business_id == business_id)
         if status:
             query = query.where(Recommendation.status == status)
         if priority:
-            query = query.where(Recommendation.priority == priority)
+            query = query.where(Recommendation.priority_rank == PRIORITY_RANKS.get(priority, 0))
         query = query.order_by(
-            Recommendation.priority.desc(),
+            Recommendation.priority_rank.desc(),
             Recommendation.created_at.desc(),
         )
+        if limit is not None:
+            query = query.limit(limit)
         result = await self.db.execute(query)
-        return result.scalars().all()
+        return [dict(row) for row in result.mappings().all()]
+
+    async def get_top_recommendations(self, business_id: UUID, limit: int = 5) -> list[dict]:
+        """Top-N pending recommendations, answered from ix_recommendations_business_status_rank alone."""
+        result = await self.db.execute(
+            select(Recommendation.title, Recommendation.priority, Recommendation.estimated_impact)
+            .where(Recommendation.business_id == business_id, Recommendation.status == "pending")
+            .order_by(Recommendation.priority_rank.desc(), Recommendation.created_at.desc())
+            .limit(limit)
+        )
+        return [dict(row) for row in result.mappings().all()]
 
     async def update_recommendation_status(self, recommendation_id: UUID, user_id: UUID, status: str) -> Recommendation:
-        if status not in ("accepted", "dismissed"):
+        if status not in UPDATABLE_STATUSES:
             raise HTTPException(status_code=400, detail={"error": {"code": "VALIDATION_ERROR", "message": "Status must be accepted or dismissed"}})
-        result = await self.db.execute(select(Recommendation).where(Recommendation.id == recommendation_id))
+        result = await self.db.execute(
+            update(Recommendation)
+            .where(Recommendation.id == recommendation_id, Recommendation.business_id.in_(_member_business_ids(user_id)))
+            .values(status=status, updated_at=func.now())
+            .returning(Recommendation)
+        )
         rec = result.scalar_one_or_none()
         if not rec:
             raise HTTPException(status_code=404, detail={"error": {"code": "NOT_FOUND", "message": "Recommendation not found"}})
-        rec.status = status
         await self.db.commit()
-        await self.db.refresh(rec)
+        from app.agent.service import AgentService
+        await AgentService(self.db).invalidate_context(rec.business_id)
         return rec
 
-    async def generate_recommendations(self, business_id: UUID) -> list[Recommendation]:
-        result = await self.db.execute(
-            select(FinancialMetricSnapshot)
-            .where(FinancialMetricSnapshot.business_id == business_id)
-            .order_by(FinancialMetricSnapshot.period_end.desc())
-            .limit(1)
+    async def bulk_update_status(self, user_id: UUID, updates: list[dict]) -> dict:
+        """Apply many status changes in one membership-checked UPDATE; unknown or foreign ids are reported, not raised."""
+        failed = []
+        targets: dict[UUID, str] = {}
+        for item in updates:
+            if item["status"] in UPDATABLE_STATUSES:
+                targets[item["id"]] = item["status"]
+            else:
+                failed.append({"id": item["id"], "code": "VALIDATION_ERROR", "message": "Status must be accepted or dismissed"})
+
+        updated = []
+        if targets:
+            result = await self.db.execute(
+                update(Recommendation)
+                .where(
+                    Recommendation.id == any_(_uuid_array(targets)),
+                    Recommendation.business_id.in_(_member_business_ids(user_id)),
+                )
+                .values(status=case(targets, value=Recommendation.id), updated_at=func.now())
+                .returning(Recommendation.id, Recommendation.business_id, Recommendation.status)
+                .execution_options(synchronize_session=False)
+            )
+            rows = result.mappings().all()
+            await self.db.commit()
+            updated = [{"id": row["id"], "status": row["status"]} for row in rows]
+            done = {row["id"] for row in rows}
+            # Missing and not-a-member are indistinguishable on purpose
+            failed += [
+                {"id": rec_id, "code": "NOT_FOUND", "message": "Recommendation not found"}
+                for rec_id in targets if rec_id not in done
+            ]
+            if rows:
+                from app.agent.service import AgentService
+                await AgentService(self.db).invalidate_context(*{row["business_id"] for row in rows})
+        return {"updated": updated, "failed": failed}
+
+    async def latest_rule_inputs(self, business_ids: list[UUID] | None = None):
+        """One scan: latest snapshot metrics and latest readiness score per business."""
+        latest_snapshot = (
+            select(
+                FinancialMetricSnapshot.business_id,
+                FinancialMetricSnapshot.chargeback_ratio,
+                FinancialMetricSnapshot.revenue_volatility,
+                FinancialMetricSnapshot.payout_reliability,
+            )
+            .where(FinancialMetricSnapshot.granularity == "trailing")
+            .distinct(FinancialMetricSnapshot.business_id)
+            .order_by(FinancialMetricSnapshot.business_id, FinancialMetricSnapshot.period_end.desc())
+        )
+        latest_score = (
+            select(ReadinessScore.business_id, ReadinessScore.score)
+            .distinct(ReadinessScore.business_id)
+            .order_by(ReadinessScore.business_id, ReadinessScore.created_at.desc())
+        )
+        if business_ids is None:
+            businesses = (
+                select(IntegrationAccount.business_id)
+                .where(IntegrationAccount.provider == "quickbooks", IntegrationAccount.status == "active")
+                .subquery()
+            )
+        else:
+            # Push the filter into the DISTINCT ON scans so targeted runs stay index lookups
+            latest_snapshot = latest_snapshot.where(FinancialMetricSnapshot.business_id.in_(business_ids))
+            latest_score = latest_score.where(ReadinessScore.business_id.in_(business_ids))
+            businesses = select(Business.id.label("business_id")).where(Business.id.in_(business_ids)).subquery()
+        latest_snapshot = latest_snapshot.subquery()
+        latest_score = latest_score.subquery()
+        query = (
+            select(
+                businesses.c.business_id,
+                latest_snapshot.c.chargeback_ratio,
+                latest_snapshot.c.revenue_volatility,
+                latest_snapshot.c.payout_reliability,
+                latest_score.c.score.label("readiness_score"),
+            )
+            .outerjoin(latest_snapshot, latest_snapshot.c.business_id == businesses.c.business_id)
+            .outerjoin(latest_score, latest_score.c.business_id == businesses.c.business_id)
         )
-        snapshot = result.scalar_one_or_none()
+        result = await self.db.execute(query)
+        return result.mappings().all()
+
+    async def generate_recommendations(self, business_id: UUID) -> set[UUID]:
+        return await self.generate_all_recommendations([business_id])
+
+    async def generate_all_recommendations(self, business_ids: list[UUID] | None = None) -> set[UUID]:
+        """Upsert every firing rule by fingerprint and expire pending rows whose condition cleared.
 
-        score_result = await self.db.execute(
-            select(ReadinessScore)
-            .where(ReadinessScore.business_id == business_id)
-            .order_by(ReadinessScore.created_at.desc())
-            .limit(1)
+        Accepted rows keep their status. A dismissed row stays dismissed for
+        RECOMMENDATION_DISMISS_DAYS, then reopens if its condition still holds, as an
+        expired row does. Returns only the businesses whose recommendations were written.
+        """
+        inputs = await self.latest_rule_inputs(business_ids)
+        if not inputs:
+            return set()
+        recs = evaluator.evaluate(*RuleEvaluator.columns(inputs))
+        changed = set()
+        if recs:
+            stmt = insert(Recommendation)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Recommendation.fingerprint],
+                set_={
+                    "status": "pending",
+                    "description": stmt.excluded.description,
+                    "metric_refs": stmt.excluded.metric_refs,
+                    "updated_at": func.now(),
+                },
+                # Skipped rows are not returned, so an unchanged business reports no change
+                where=or_(
+                    and_(
+                        Recommendation.status == "pending",
+                        or_(
+                            Recommendation.description.is_distinct_from(stmt.excluded.description),
+                            Recommendation.metric_refs.is_distinct_from(stmt.excluded.metric_refs),
+                        ),
+                    ),
+                    Recommendation.status == "expired",
+                    and_(
+                        Recommendation.status == "dismissed",
+                        Recommendation.updated_at < func.now() - timedelta(days=settings.RECOMMENDATION_DISMISS_DAYS),
+                    ),
+                ),
+            ).returning(Recommendation.business_id)
+            result = await self.db.execute(stmt, recs)
+            changed.update(result.scalars().all())
+
+        # Any pending row whose fingerprint did not fire this run has cleared
+        fired = bindparam(None, [rec["fingerprint"] for rec in recs], type_=ARRAY(String))
+        result = await self.db.execute(
+            update(Recommendation)
+            .where(
+                Recommendation.business_id == any_(_uuid_array(row["business_id"] for row in inputs)),
+                Recommendation.status == "pending",
+                or_(Recommendation.fingerprint.is_(None), Recommendation.fingerprint != all_(fired)),
+            )
+            .values(status="expired", updated_at=func.now())
+            .returning(Recommendation.business_id)
         )
-        score = score_result.scalar_one_or_none()
-
-        new_recs = []
-
-        if snapshot:
-            if snapshot.chargeback_ratio is not None and float(snapshot.chargeback_ratio) > 0.02:
-                new_recs.append(Recommendation(
-                    business_id=business_id,
-                    title="Reduce chargebacks",
-                    description="Your chargeback ratio is above 2%. Consider improving dispute descriptors and customer communication.",
-                    priority="high",
-                    category="risk",
-                    estimated_impact="+10-15 points",
-                    metric_refs={"chargeback_ratio": float(snapshot.chargeback_ratio)},
-                ))
-            if snapshot.revenue_volatility is not None and float(snapshot.revenue_volatility) > 0.5:
-                new_recs.append(Recommendation(
-                    business_id=business_id,
-                    title="Stabilize revenue streams",
-                    description="High revenue volatility detected. Diversifying revenue sources can improve your score.",
-                    priority="medium",
-                    category="cash_flow",
-                    estimated_impact="+5-10 points",
-                    metric_refs={"revenue_volatility": float(snapshot.revenue_volatility)},
-                ))
-            if snapshot.payout_reliability is not None and float(snapshot.payout_reliability) < 0.80:
-                new_recs.append(Recommendation(
-                    business_id=business_id,
-                    title="Improve payout timing",
-                    description="Less than 80% of payouts are completing on time. Review your payment processor settings.",
-                    priority="high",
-                    category="cash_flow",
-                    estimated_impact="+10 points",
-                    metric_refs={"payout_reliability": float(snapshot.payout_reliability)},
-                ))
-
-        if score and score.score < 50:
-            new_recs.append(Recommendation(
-                business_id=business_id,
-                title="Focus on core metrics",
-                description="Your readiness score is below 50. Focus on reducing chargebacks and stabilizing revenue.",
-                priority="medium",
-                category="general",
-                estimated_impact="Varies",
-            ))
-
-        for rec in new_recs:
-            self.db.add(rec)
+        changed.update(result.scalars().all())
         await self.db.commit()
-        return new_recs
+        return changed
@@ -0,0 +1,96 @@
+import asyncio
+import secrets
+import time
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from app.shared.redis import get_redis
+from app.config import settings
+
+# Delete the lock only if we still own it, so a slow holder can't drop a successor's lock
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Extend the lock only if we still own it
+RENEW_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class LeaseNotAcquired(Exception):
+    pass
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class Lease:
+    """A Redis lock with a TTL that a background task keeps renewing while the holder runs.
+
+    If the process stalls or dies, the lease lapses after ttl seconds and another worker can
+    take over. If renewal finds the lease gone, the holder task is cancelled and the block
+    raises LeaseLost, so two workers never keep writing for the same key.
+
+        async with Lease(f"sync:{business_id}"):
+            ...
+    """
+
+    def __init__(self, name: str, ttl: float | None = None, redis: Redis | None = None):
+        self.key = f"lease:{name}"
+        self.ttl = ttl or settings.WORKER_LEASE_SECONDS
+        self.redis = redis or get_redis()
+        self.owner = secrets.token_hex(16)
+        self.lost = False
+        self._expires_at = 0.0
+        self._holder: asyncio.Task | None = None
+        self._renewer: asyncio.Task | None = None
+
+    async def acquire(self) -> bool:
+        acquired = await self.redis.set(self.key, self.owner, nx=True, px=int(self.ttl * 1000))
+        if acquired:
+            self._expires_at = time.monotonic() + self.ttl
+        return bool(acquired)
+
+    async def release(self) -> None:
+        try:
+            await self.redis.eval(RELEASE_LOCK_SCRIPT, 1, self.key, self.owner)
+        except (RedisError, OSError):
+            pass  # The lease expires on its own
+
+    async def _renew(self) -> None:
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                renewed = await self.redis.eval(RENEW_LOCK_SCRIPT, 1, self.key, self.owner, int(self.ttl * 1000))
+            except (RedisError, OSError):
+                # Keep trying until the lease would have lapsed anyway
+                renewed = time.monotonic() < self._expires_at
+            else:
+                if renewed:
+                    self._expires_at = time.monotonic() + self.ttl
+            if not renewed:
+                self.lost = True
+                self._holder.cancel()
+                return
+
+    async def __aenter__(self) -> "Lease":
+        if not await self.acquire():
+            raise LeaseNotAcquired(self.key)
+        self._holder = asyncio.current_task()
+        self._renewer = asyncio.create_task(self._renew())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self._renewer.cancel()
+        if self.lost:
+            if exc_type is asyncio.CancelledError:
+                self._holder.uncancel()
+            raise LeaseLost(self.key) from exc
+        await self.release()
@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, DateTime, Integer, Numeric, Date, ForeignKey, Text, CheckConstraint, UniqueConstraint, Index
+from sqlalchemy import Column, String, DateTime, Integer, SmallInteger, Numeric, Float, Date, ForeignKey, Text, CheckConstraint, UniqueConstraint, Index, text
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.sql import func
 from app.shared.database import Base
@@ -26,6 +26,7 @@ class Business(Base):
     industry = Column(String(100))
     revenue_estimate = Column(Numeric(15, 2))
     founded_at = Column(Date)
+    last_active_at = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
 
@@ -50,10 +51,25 @@ class IntegrationAccount(Base):
     metadata_ = Column("metadata", JSONB)
     status = Column(String(20), default="active")
     last_synced_at = Column(DateTime(timezone=True))
+    token_expires_at = Column(DateTime(timezone=True))
+    next_sync_due_at = Column(DateTime(timezone=True))
+    change_rate = Column(Float)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
 
-    __table_args__ = (UniqueConstraint("business_id", "provider", name="uq_integration_business_provider"),)
+    __table_args__ = (
+        UniqueConstraint("business_id", "provider", name="uq_integration_business_provider"),
+        Index(
+            "ix_integration_accounts_token_expires_at",
+            "token_expires_at",
+            postgresql_where=text("status = 'active'"),
+        ),
+        Index(
+            "ix_integration_accounts_next_sync_due_at",
+            "next_sync_due_at",
+            postgresql_where=text("status = 'active'"),
+        ),
+    )
 
 
 class StripeEvent(Base):
@@ -67,6 +83,59 @@ class StripeEvent(Base):
     processed_at = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
+    __table_args__ = (
+        Index(
+            "ix_stripe_events_pending",
+            "created_at",
+            postgresql_where=text("processed_at IS NULL"),
+        ),
+    )
+
+
+class LedgerEntry(Base):
+    __tablename__ = "ledger_entries"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    business_id = Column(UUID(as_uuid=True), ForeignKey("businesses.id"), nullable=False)
+    integration_id = Column(UUID(as_uuid=True), ForeignKey("integration_accounts.id"))
+    source = Column(String(20), nullable=False)
+    external_id = Column(String(255), nullable=False)
+    entry_type = Column(String(20), nullable=False)
+    status = Column(String(30))
+    amount = Column(Numeric(15, 2), nullable=False)
+    currency = Column(String(3))
+    occurred_at = Column(DateTime(timezone=True), nullable=False)
+    due_at = Column(DateTime(timezone=True))
+    settled_at = Column(DateTime(timezone=True))
+    source_updated_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("source", "external_id", name="uq_ledger_source_external"),
+        Index("ix_ledger_business_type_occurred", "business_id", "entry_type", "occurred_at"),
+    )
+
+
+class QuickBooksNotification(Base):
+    __tablename__ = "quickbooks_notifications"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    realm_id = Column(String(255), nullable=False)
+    payload = Column(JSONB, nullable=False)
+    processed_at = Column(DateTime(timezone=True))
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    next_attempt_at = Column(DateTime(timezone=True))  # claim lease, then retry backoff; NULL means now
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index(
+            "ix_quickbooks_notifications_pending",
+            "created_at",
+            postgresql_where=text("processed_at IS NULL"),
+        ),
+    )
+
 
 class FinancialMetricSnapshot(Base):
     __tablename__ = "financial_metric_snapshots"
@@ -75,6 +144,7 @@ class FinancialMetricSnapshot(Base):
     business_id = Column(UUID(as_uuid=True), ForeignKey("businesses.id"), nullable=False)
     period_start = Column(Date, nullable=False)
     period_end = Column(Date, nullable=False)
+    granularity = Column(String(10), nullable=False, default="trailing", server_default="trailing")
     revenue_total = Column(Numeric(15, 2))
     revenue_volatility = Column(Numeric(10, 4))
     chargeback_count = Column(Integer, default=0)
@@ -89,8 +159,8 @@ class FinancialMetricSnapshot(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     __table_args__ = (
-        UniqueConstraint("business_id", "period_start", "period_end", name="uq_metrics_period"),
-        Index("ix_metric_snapshots_business_period_end", "business_id", "period_end"),
+        UniqueConstraint("business_id", "granularity", "period_start", "period_end", name="uq_metrics_period"),
+        Index("ix_metric_snapshots_business_granularity_period_end", "business_id", "granularity", "period_end"),
     )
 
 
@@ -110,6 +180,13 @@ class ReadinessScore(Base):
     )
 
 
+PRIORITY_RANKS = {"low": 1, "medium": 2, "high": 3}
+
+
+def _priority_rank(context) -> int:
+    return PRIORITY_RANKS.get(context.get_current_parameters().get("priority") or "medium", PRIORITY_RANKS["medium"])
+
+
 class Recommendation(Base):
     __tablename__ = "recommendations"
 
@@ -118,14 +195,24 @@ class Recommendation(Base):
     title = Column(String(255), nullable=False)
     description = Column(Text)
     priority = Column(String(20), default="medium")
+    priority_rank = Column(SmallInteger, nullable=False, default=_priority_rank)
     category = Column(String(50))
     status = Column(String(20), default="pending")
     metric_refs = Column(JSONB)
     estimated_impact = Column(String(100))
+    rule_key = Column(String(50))
+    fingerprint = Column(String(64))
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
 
-    __table_args__ = (Index("ix_recommendations_business_id", "business_id"),)
+    __table_args__ = (
+        Index(
+            "ix_recommendations_business_status_rank",
+            "business_id", "status", priority_rank.desc(), created_at.desc(),
+            postgresql_include=["title", "priority", "estimated_impact"],
+        ),
+        UniqueConstraint("fingerprint", name="uq_recommendations_fingerprint"),
+    )
 
 
 class AgentConversation(Base):
@@ -137,7 +224,22 @@ class AgentConversation(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
 
-    __table_args__ = (Index("ix_agent_conversations_business_id", "business_id"),)
+    __table_args__ = (
+        Index("ix_agent_conversations_business_id", "business_id"),
+        Index(
+            "ix_agent_conversations_business_user_created",
+            "business_id", "user_id", "created_at", "id",
+            postgresql_include=["updated_at"],
+        ),
+    )
+
+
+class AgentContext(Base):
+    __tablename__ = "agent_contexts"
+
+    business_id = Column(UUID(as_uuid=True), ForeignKey("businesses.id"), primary_key=True)
+    context = Column(JSONB, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
 
 
 class AgentMessage(Base):
@@ -149,4 +251,4 @@ class AgentMessage(Base):
     content = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
-    __table_args__ = (Index("ix_agent_messages_conversation_id", "conversation_id"),)
+    __table_args__ = (Index("ix_agent_messages_conversation_created_id", "conversation_id", "created_at", "id"),)
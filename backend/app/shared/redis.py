@@ -0,0 +1,16 @@
+from redis.asyncio import Redis
+from app.config import settings
+
+_redis: Redis | None = None
+
+
+def get_redis() -> Redis:
+    """Process-wide Redis client; callers fall back to in-process state when it is unreachable."""
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(
+            settings.REDIS_URL,
+            socket_connect_timeout=settings.REDIS_TIMEOUT_SECONDS,
+            socket_timeout=settings.REDIS_TIMEOUT_SECONDS,
+        )
+    return _redis
@@ -0,0 +1,94 @@
+import datetime
+import decimal
+import inspect
+import json
+import uuid
+from typing import Any, Callable
+from fastapi.datastructures import Default, DefaultPlaceholder
+from fastapi.responses import JSONResponse, Response
+from fastapi.routing import APIRoute
+from pydantic import TypeAdapter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if hasattr(obj, "tolist"):  # numpy arrays and scalars
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+# Fastest available backend: orjson, then msgspec, then the stdlib
+if orjson is not None:
+    BACKEND = "orjson"
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    loads: Callable[[bytes | str], Any] = orjson.loads
+elif msgspec is not None:
+    BACKEND = "msgspec"
+    dumps = msgspec.json.Encoder(enc_hook=_default, decimal_format="number").encode
+
+    def loads(data: bytes | str) -> Any:
+        try:
+            return msgspec.json.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e  # callers catch ValueError, as with json and orjson
+else:
+    BACKEND = "json"
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False).encode()
+
+    loads = json.loads
+
+
+def dumps_str(obj: Any) -> str:
+    return dumps(obj).decode()
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def rows_response(adapter: TypeAdapter, content: Any) -> Response:
+    """Serialize trusted content (rows straight from a column select) against its schema, skipping validation."""
+    return Response(adapter.dump_json(content), media_type="application/json")
+
+
+class FastJSONRoute(APIRoute):
+    """Renders routes without a response model through FastJSONResponse.
+
+    Routes with a response model keep FastAPI's default class: that is what enables its
+    Pydantic dump_json path, which already serializes in Rust and is skipped for any
+    custom response class.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        response_model = kwargs.get("response_model", Default(None))
+        untyped = inspect.signature(endpoint).return_annotation is inspect.Signature.empty
+        if (
+            isinstance(response_model, DefaultPlaceholder)
+            and response_model.value is None
+            and untyped
+            and isinstance(kwargs.get("response_class", Default(JSONResponse)), DefaultPlaceholder)
+        ):
+            kwargs["response_class"] = Default(FastJSONResponse)
+        super().__init__(path, endpoint, **kwargs)
@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends, Header, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.shared.serialization import FastJSONRoute
+from app.shared.database import get_db
+from app.stripe.service import StripeEventService, verify_signature
+
+router = APIRouter(tags=["stripe"], route_class=FastJSONRoute)
+
+
+@router.post("/webhooks/stripe")
+async def stripe_webhook(
+    request: Request,
+    stripe_signature: str | None = Header(None),
+    db: AsyncSession = Depends(get_db),
+):
+    """Receive Stripe events; stored idempotently here, applied to the ledger by the worker."""
+    body = await request.body()
+    verify_signature(body, stripe_signature)
+    inserted = await StripeEventService(db).record(body)
+    return {"status": "accepted", "duplicate": not inserted}
@@ -0,0 +1,204 @@
+import hashlib
+import hmac
+import time
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+from uuid import UUID
+from fastapi import HTTPException
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.shared.models import IntegrationAccount, LedgerEntry, StripeEvent
+from app.shared.serialization import loads
+from app.config import settings
+
+# Stripe object type -> ledger entry type
+LEDGER_OBJECTS = {"charge": "charge", "refund": "refund", "dispute": "dispute", "payout": "payout"}
+# Only what the ledger needs; card and customer details are never stored
+OBJECT_FIELDS = ("id", "object", "amount", "currency", "status", "created", "arrival_date", "charge", "reason", "failure_code")
+ZERO_DECIMAL_CURRENCIES = {"bif", "clp", "djf", "gnf", "jpy", "kmf", "krw", "mga", "pyg", "rwf", "ugx", "vnd", "vuv", "xaf", "xof", "xpf"}
+
+
+def _invalid_signature() -> HTTPException:
+    return HTTPException(
+        status_code=401,
+        detail={"error": {"code": "INVALID_SIGNATURE", "message": "Webhook signature verification failed"}},
+    )
+
+
+def verify_signature(body: bytes, header: str | None) -> None:
+    """Check Stripe-Signature (t=...,v1=...) against HMAC-SHA256 of "{t}.{body}" within the replay tolerance."""
+    if not settings.STRIPE_WEBHOOK_SECRET or not header:
+        raise _invalid_signature()
+    timestamp, signatures = None, []
+    for part in header.split(","):
+        key, _, value = part.strip().partition("=")
+        if key == "t":
+            timestamp = value
+        elif key == "v1":
+            signatures.append(value)
+    if not timestamp or not timestamp.isdigit() or not signatures:
+        raise _invalid_signature()
+    if abs(time.time() - int(timestamp)) > settings.STRIPE_WEBHOOK_TOLERANCE_SECONDS:
+        raise _invalid_signature()
+    expected = hmac.new(settings.STRIPE_WEBHOOK_SECRET.encode(), timestamp.encode() + b"." + body, hashlib.sha256).hexdigest()
+    if not any(hmac.compare_digest(expected, signature) for signature in signatures):
+        raise _invalid_signature()
+
+
+def _timestamp(value: int | None) -> datetime | None:
+    return datetime.fromtimestamp(value, tz=timezone.utc) if value else None
+
+
+def _amount(minor_units: int | None, currency: str | None) -> Decimal:
+    if currency and currency.lower() in ZERO_DECIMAL_CURRENCIES:
+        return Decimal(minor_units or 0)
+    return Decimal(minor_units or 0) / 100
+
+
+def ledger_entry(payload: dict, integration_id: UUID, business_id: UUID) -> dict | None:
+    """Map a stored event payload to a ledger row, or None for objects the ledger doesn't track."""
+    obj = payload.get("object") or {}
+    entry_type = LEDGER_OBJECTS.get(obj.get("object"))
+    if entry_type is None or not obj.get("id"):
+        return None
+    event_time = _timestamp(payload.get("created")) or datetime.now(timezone.utc)
+    status = obj.get("status")
+    return {
+        "id": uuid.uuid4(),
+        "business_id": business_id,
+        "integration_id": integration_id,
+        "source": "stripe",
+        "external_id": obj["id"],
+        "entry_type": entry_type,
+        "status": status,
+        "amount": _amount(obj.get("amount"), obj.get("currency")),
+        "currency": obj.get("currency"),
+        "occurred_at": _timestamp(obj.get("created")) or event_time,
+        "due_at": _timestamp(obj.get("arrival_date")),
+        "settled_at": event_time if entry_type == "payout" and status == "paid" else None,
+        "source_updated_at": event_time,
+    }
+
+
+def _is_text(value, max_length: int) -> bool:
+    return isinstance(value, str) and 0 < len(value) <= max_length
+
+
+class StripeEventService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def record(self, body: bytes) -> bool:
+        """Append the raw event; redeliveries hit the unique stripe_event_id and are dropped. Returns True if new."""
+        try:
+            event = loads(body)
+        except ValueError:
+            raise HTTPException(
+                status_code=400,
+                detail={"error": {"code": "VALIDATION_ERROR", "message": "Webhook body is not valid JSON"}},
+            )
+        # Signed but malformed: a 400 stops Stripe retrying a body that can never be stored
+        if not (isinstance(event, dict) and _is_text(event.get("id"), 255) and _is_text(event.get("type"), 100)):
+            raise HTTPException(
+                status_code=400,
+                detail={"error": {"code": "VALIDATION_ERROR", "message": "Webhook event must have a string id and type"}},
+            )
+        data = event.get("data")
+        obj = data.get("object") if isinstance(data, dict) else None
+        if not isinstance(obj, dict):
+            obj = {}
+        result = await self.db.execute(
+            insert(StripeEvent)
+            .values(
+                id=uuid.uuid4(),
+                stripe_event_id=event["id"],
+                event_type=event["type"],
+                payload={
+                    "account": event.get("account"),
+                    "created": event.get("created"),
+                    "object": {key: obj[key] for key in OBJECT_FIELDS if key in obj},
+                },
+            )
+            .on_conflict_do_nothing(index_elements=[StripeEvent.stripe_event_id])
+            .returning(StripeEvent.id)
+        )
+        inserted = result.scalar_one_or_none() is not None
+        await self.db.commit()
+        return inserted
+
+    async def process_batch(self, limit: int | None = None) -> tuple[int, set[UUID]]:
+        """Claim pending events, upsert their objects into the ledger and stamp them processed.
+
+        SKIP LOCKED lets any number of workers drain the queue side by side. Events for
+        accounts we have no integration for are stamped too, so they never block the queue.
+        Returns (events claimed, businesses whose ledger changed).
+        """
+        result = await self.db.execute(
+            select(StripeEvent.id, StripeEvent.payload)
+            .where(StripeEvent.processed_at.is_(None))
+            .order_by(StripeEvent.created_at)
+            .limit(limit or settings.STRIPE_EVENT_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+        events = result.all()
+        if not events:
+            return 0, set()
+
+        accounts = {event.payload.get("account") for event in events} - {None}
+        integrations = {}
+        if accounts:
+            result = await self.db.execute(
+                select(IntegrationAccount.external_id, IntegrationAccount.id, IntegrationAccount.business_id).where(
+                    IntegrationAccount.provider == "stripe",
+                    IntegrationAccount.external_id.in_(accounts),
+                )
+            )
+            integrations = {row.external_id: (row.id, row.business_id) for row in result.all()}
+
+        # A multi-row upsert may touch each key once, so keep only the newest event per object
+        entries: dict[str, dict] = {}
+        by_integration: dict[UUID | None, list[UUID]] = {}
+        for event in events:
+            integration = integrations.get(event.payload.get("account"))
+            by_integration.setdefault(integration[0] if integration else None, []).append(event.id)
+            if integration is None:
+                continue
+            entry = ledger_entry(event.payload, *integration)
+            if entry is None:
+                continue
+            current = entries.get(entry["external_id"])
+            if current is None or entry["source_updated_at"] >= current["source_updated_at"]:
+                if current is not None:
+                    entry["settled_at"] = entry["settled_at"] or current["settled_at"]
+                entries[entry["external_id"]] = entry
+
+        if entries:
+            stmt = insert(LedgerEntry).values(list(entries.values()))
+            excluded = stmt.excluded
+            await self.db.execute(
+                stmt.on_conflict_do_update(
+                    constraint="uq_ledger_source_external",
+                    set_={
+                        "status": excluded.status,
+                        "amount": excluded.amount,
+                        "due_at": excluded.due_at,
+                        "settled_at": func.coalesce(LedgerEntry.settled_at, excluded.settled_at),
+                        "source_updated_at": excluded.source_updated_at,
+                        "updated_at": func.now(),
+                    },
+                    # Stripe doesn't guarantee delivery order; never let an older event overwrite a newer one
+                    where=LedgerEntry.source_updated_at <= excluded.source_updated_at,
+                )
+            )
+
+        now = datetime.now(timezone.utc)
+        for integration_id, event_ids in by_integration.items():
+            await self.db.execute(
+                update(StripeEvent)
+                .where(StripeEvent.id.in_(event_ids))
+                .values(processed_at=now, integration_id=integration_id)
+            )
+        await self.db.commit()
+        return len(events), {entry["business_id"] for entry in entries.values()}
@@ -1,13 +1,14 @@
 from uuid import UUID
 from fastapi import APIRouter, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.shared.serialization import FastJSONRoute
 from app.shared.database import get_db
 from app.shared.deps import get_current_user
 from app.shared.models import User
 from app.users.schemas import UserUpdate, BusinessCreate, BusinessUpdate, BusinessResponse
 from app.users.service import UsersService
 
-router = APIRouter(prefix="/users", tags=["users"])
+router = APIRouter(prefix="/users", tags=["users"], route_class=FastJSONRoute)
 
 
 @router.get("/me")
@@ -1,8 +1,26 @@
+import asyncio
+import time
+from collections import OrderedDict
 from uuid import UUID
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update, func
 from fastapi import HTTPException
+from redis.exceptions import RedisError
 from app.shared.models import User, Business, UserBusinessMembership
+from app.jobs.pipeline import enqueue_stage, get_job_pool
+from app.config import settings
+
+# business_id -> monotonic time this process last queued an activity write, least recent first
+_activity_recorded: OrderedDict[UUID, float] = OrderedDict()
+ACTIVITY_CACHE_SIZE = 10_000
+_activity_tasks: set[asyncio.Task] = set()
+
+
+async def _enqueue_activity(business_id: UUID) -> None:
+    try:
+        await enqueue_stage(get_job_pool(), "activity", business_id, rerun_if_running=False)
+    except (RedisError, OSError):
+        pass  # activity only tunes the sync schedule; the next request tries again
 
 
 class UsersService:
@@ -64,6 +82,8 @@ class UsersService:
                 setattr(business, key, value)
         await self.db.commit()
         await self.db.refresh(business)
+        from app.agent.service import AgentService
+        await AgentService(self.db).invalidate_context(business_id)
         return business
 
     async def get_user_businesses(self, user_id: UUID) -> list[dict]:
@@ -83,3 +103,25 @@ class UsersService:
         )
         if not result.scalar_one_or_none():
             raise HTTPException(status_code=403, detail={"error": {"code": "FORBIDDEN", "message": "Access denied"}})
+
+    def record_activity(self, business_id: UUID) -> None:
+        """Note that the business is in use, without touching the database on the request path.
+
+        At most once per ACTIVITY_RECORD_SECONDS per process, a record_business_activity job
+        is queued in the background; the worker stamps the business and pulls its next sync in.
+        """
+        now = time.monotonic()
+        last = _activity_recorded.get(business_id)
+        if last is not None and now - last < settings.ACTIVITY_RECORD_SECONDS:
+            return
+        _activity_recorded[business_id] = now
+        _activity_recorded.move_to_end(business_id)
+        if len(_activity_recorded) > ACTIVITY_CACHE_SIZE:
+            _activity_recorded.popitem(last=False)
+        task = asyncio.create_task(_enqueue_activity(business_id))
+        _activity_tasks.add(task)
+        task.add_done_callback(_activity_tasks.discard)
+
+    async def mark_active(self, business_id: UUID) -> None:
+        await self.db.execute(update(Business).where(Business.id == business_id).values(last_active_at=func.now()))
+        await self.db.commit()
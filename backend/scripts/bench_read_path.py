@@ -0,0 +1,162 @@
+"""Compare the ORM + response_model read path with the column-select + row-schema path.
+
+Seeds a throwaway business with N metric snapshots, readiness scores and recommendations,
+times both paths end to end (query, hydration, serialization to JSON bytes) and reports
+per-request latency and peak allocations, then deletes the seeded rows.
+
+Usage: python scripts/bench_read_path.py [rows] [iterations]
+"""
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import date, timedelta
+from statistics import median
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from pydantic import TypeAdapter  # noqa: E402
+from sqlalchemy import select, delete  # noqa: E402
+from app.shared.database import AsyncSessionLocal  # type: ignore  # noqa: E402
+from app.shared.models import Business, FinancialMetricSnapshot, ReadinessScore, Recommendation  # type: ignore  # noqa: E402
+from app.metrics.schemas import (  # type: ignore  # noqa: E402
+    MetricsHistoryResponse,
+    ReadinessHistoryResponse,
+    metrics_history_adapter,
+    readiness_history_adapter,
+)
+from app.metrics.service import MetricsService  # type: ignore  # noqa: E402
+from app.recommendations.schemas import RecommendationsListResponse, recommendations_list_adapter  # type: ignore  # noqa: E402
+from app.recommendations.service import RecommendationsService  # type: ignore  # noqa: E402
+
+
+async def seed(business_id: uuid.UUID, rows: int) -> None:
+    async with AsyncSessionLocal() as db:
+        db.add(Business(id=business_id, name="Read path benchmark"))
+        await db.flush()
+        start = date.today() - timedelta(days=rows)
+        db.add_all(
+            FinancialMetricSnapshot(
+                business_id=business_id,
+                period_start=start + timedelta(days=i),
+                period_end=start + timedelta(days=i + 1),
+                revenue_total=1000 + i,
+                revenue_volatility=0.1,
+                chargeback_ratio=0.004,
+                payout_reliability=0.95,
+                transaction_count=100,
+                mrr=500,
+                metrics_json={"daily": [i] * 50},
+            )
+            for i in range(rows)
+        )
+        db.add_all(
+            ReadinessScore(business_id=business_id, score=60, tier="improving", components={"risk_signals": 0.9})
+            for _ in range(rows)
+        )
+        db.add_all(
+            Recommendation(business_id=business_id, title=f"Recommendation {i}", description="x" * 200, priority="medium")
+            for i in range(rows)
+        )
+        await db.commit()
+
+
+async def cleanup(business_id: uuid.UUID) -> None:
+    async with AsyncSessionLocal() as db:
+        for model in (FinancialMetricSnapshot, ReadinessScore, Recommendation):
+            await db.execute(delete(model).where(model.business_id == business_id))
+        await db.execute(delete(Business).where(Business.id == business_id))
+        await db.commit()
+
+
+def orm_paths(business_id: uuid.UUID, rows: int) -> dict:
+    """The previous implementation: full entities, then response_model validation from attributes."""
+    metrics_adapter = TypeAdapter(MetricsHistoryResponse)
+    readiness_adapter = TypeAdapter(ReadinessHistoryResponse)
+    recs_adapter = TypeAdapter(RecommendationsListResponse)
+
+    async def metrics_history(db):
+        result = await db.execute(
+            select(FinancialMetricSnapshot)
+            .where(FinancialMetricSnapshot.business_id == business_id)
+            .order_by(FinancialMetricSnapshot.period_end.desc())
+        )
+        return metrics_adapter.dump_json(MetricsHistoryResponse.model_validate({"metrics": result.scalars().all()}))
+
+    async def readiness_history(db):
+        result = await db.execute(
+            select(ReadinessScore)
+            .where(ReadinessScore.business_id == business_id)
+            .order_by(ReadinessScore.created_at.desc())
+            .limit(rows)
+        )
+        return readiness_adapter.dump_json(ReadinessHistoryResponse.model_validate({"scores": result.scalars().all()}))
+
+    async def recommendations(db):
+        result = await db.execute(
+            select(Recommendation)
+            .where(Recommendation.business_id == business_id)
+            .order_by(Recommendation.priority_rank.desc(), Recommendation.created_at.desc())
+        )
+        return recs_adapter.dump_json(RecommendationsListResponse.model_validate({"recommendations": result.scalars().all()}))
+
+    return {"/metrics/history": metrics_history, "/readiness/history": readiness_history, "/recommendations": recommendations}
+
+
+def row_paths(business_id: uuid.UUID, rows: int) -> dict:
+    async def metrics_history(db):
+        metrics = await MetricsService(db).get_metric_history(business_id, None, None)
+        return metrics_history_adapter.dump_json({"metrics": metrics})
+
+    async def readiness_history(db):
+        scores = await MetricsService(db).get_readiness_history(business_id, rows)
+        return readiness_history_adapter.dump_json({"scores": scores})
+
+    async def recommendations(db):
+        recs = await RecommendationsService(db).get_recommendations(business_id)
+        return recommendations_list_adapter.dump_json({"recommendations": recs})
+
+    return {"/metrics/history": metrics_history, "/readiness/history": readiness_history, "/recommendations": recommendations}
+
+
+async def measure(path, iterations: int) -> tuple[float, int, bytes]:
+    timings = []
+    for _ in range(iterations):
+        async with AsyncSessionLocal() as db:  # fresh session, as per request
+            started = time.perf_counter()
+            body = await path(db)
+            timings.append(time.perf_counter() - started)
+    async with AsyncSessionLocal() as db:
+        tracemalloc.start()
+        await path(db)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return median(timings) * 1000, peak, body
+
+
+async def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    business_id = uuid.uuid4()
+    await seed(business_id, rows)
+    try:
+        old, new = orm_paths(business_id, rows), row_paths(business_id, rows)
+        print(f"{rows} rows, median of {iterations} requests")
+        print(f"{'endpoint':<22}{'orm ms':>10}{'rows ms':>10}{'speedup':>9}{'orm peak KiB':>15}{'rows peak KiB':>15}  same JSON")
+        for name in old:
+            old_ms, old_peak, old_body = await measure(old[name], iterations)
+            new_ms, new_peak, new_body = await measure(new[name], iterations)
+            print(
+                f"{name:<22}{old_ms:>10.2f}{new_ms:>10.2f}{old_ms / new_ms:>8.1f}x"
+                f"{old_peak / 1024:>15.0f}{new_peak / 1024:>15.0f}  {old_body == new_body}"
+            )
+    finally:
+        await cleanup(business_id)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,26 @@
+import asyncio
+import json
+import os
+import sys
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from app.agent.ingest import KnowledgeIngestor  # type: ignore  # noqa: E402
+from app.agent.providers import registry  # type: ignore  # noqa: E402
+
+DEFAULT_DOCS_DIR = os.path.abspath(os.path.join(ROOT_DIR, "..", "docs"))
+
+
+async def main() -> None:
+    roots = sys.argv[1:] or [DEFAULT_DOCS_DIR]
+    try:
+        report = await KnowledgeIngestor().ingest(roots)
+    finally:
+        await registry.shutdown()
+    print(json.dumps(report.as_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+import asyncio
+import json
+import numpy as np
+import pytest
+from app.agent import ingest as ingest_module
+from app.agent.ingest import KnowledgeIngestor, content_hash
+from app.agent.knowledge import LocalVectorIndex
+
+SHARED = "Lenders look at twelve months of revenue history."
+
+
+class FakeEmbedder:
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        return [[float(len(text)), float(sum(map(ord, text)) % 97), 1.0] for text in texts]
+
+
+@pytest.fixture
+def ingestor(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_module.registry, "get", lambda name: FakeEmbedder())
+    index = LocalVectorIndex(str(tmp_path / "index"))
+    return KnowledgeIngestor(index=index, state_path=str(tmp_path / "index" / "ingest_state.json")), index
+
+
+def write_docs(root, **files: str) -> None:
+    root.mkdir(exist_ok=True)
+    for name, text in files.items():
+        (root / name).write_text(text)
+
+
+def live_sources(index: LocalVectorIndex) -> list[str]:
+    return sorted(chunk["source"] for row, chunk in enumerate(index.chunks) if row not in index.deleted_rows)
+
+
+def test_same_passage_in_two_files_is_two_chunks(tmp_path, ingestor):
+    knowledge, index = ingestor
+    docs = tmp_path / "docs"
+    write_docs(docs, **{"a.md": SHARED, "b.md": SHARED})
+    asyncio.run(knowledge.ingest([str(docs)]))
+    assert live_sources(index) == ["docs/a.md", "docs/b.md"]
+
+    (docs / "a.md").unlink()
+    report = asyncio.run(knowledge.ingest([str(docs)]))
+    assert report.chunks_removed == 1
+    assert live_sources(index) == ["docs/b.md"]
+
+
+def test_state_from_text_only_ids_is_rechunked(tmp_path, ingestor):
+    knowledge, index = ingestor
+    docs = tmp_path / "docs"
+    write_docs(docs, **{"a.md": SHARED})
+    asyncio.run(knowledge.ingest([str(docs)]))
+    new_id = index.chunks[0]["id"]
+
+    # An index written when chunk ids hashed the text alone
+    old_id = content_hash(SHARED)
+    index.remove({new_id})
+    index.append([ingest_module.KnowledgeChunk(id=old_id, text=SHARED, source="docs/a.md")], np.ones((1, 3), dtype=np.float32))
+    with open(knowledge.state_path) as f:
+        state = json.load(f)
+    del state["version"]
+    state["files"][str(docs / "a.md")]["chunks"] = [old_id]
+    with open(knowledge.state_path, "w") as f:
+        json.dump(state, f)
+
+    report = asyncio.run(knowledge.ingest([str(docs)]))
+    assert report.chunks_removed == 1
+    assert old_id not in index._row_by_id
+    assert new_id in index._row_by_id
@@ -0,0 +1,60 @@
+import asyncio
+import time
+import pytest
+from app.agent import scheduler as scheduler_module
+from app.agent.providers import LLMResponse
+from app.agent.scheduler import LLMScheduler, ProviderLane
+from app.config import settings
+
+
+class SlowProvider:
+    def __init__(self, delays: list[float]):
+        self.delays = delays
+
+    async def generate(self, messages: list[dict]) -> LLMResponse:
+        delay = self.delays.pop(0)
+        await asyncio.sleep(delay)
+        return LLMResponse(content=f"after {delay}", provider="fake", latency_ms=delay * 1000)
+
+
+@pytest.fixture
+def lane(monkeypatch):
+    def make(*delays: float) -> tuple[LLMScheduler, ProviderLane]:
+        provider = SlowProvider(list(delays))
+        monkeypatch.setattr(scheduler_module.registry, "get", lambda name: provider)
+        monkeypatch.setattr(settings, "LLM_HEDGE_AFTER_SECONDS", 0.05)
+        scheduler = LLMScheduler()
+        lane = ProviderLane("fake", concurrency=2, max_queue=10)
+        scheduler._lanes["fake"] = lane
+        return scheduler, lane
+    return make
+
+
+def test_slow_attempt_is_hedged_and_loser_cancelled(lane):
+    scheduler, fake = lane(5.0, 0.01)
+
+    async def scenario():
+        response = await scheduler._hedged("fake", [], time.monotonic() + 10)
+        await asyncio.sleep(0.01)  # let the cancelled attempt unwind
+        return response
+
+    assert asyncio.run(scenario()).content == "after 0.01"
+    assert scheduler.hedged == 1
+    assert fake.in_flight == 0
+
+
+def test_cancelled_caller_releases_its_attempt(lane):
+    scheduler, fake = lane(5.0)
+
+    async def scenario():
+        call = asyncio.create_task(scheduler._hedged("fake", [], time.monotonic() + 10))
+        await asyncio.sleep(0.01)  # the attempt is running, and the hedge is not due yet
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        await asyncio.sleep(0.01)  # an orphaned attempt would still be running here
+        return fake.in_flight, fake.semaphore._value
+
+    in_flight, free_slots = asyncio.run(scenario())
+    assert in_flight == 0
+    assert free_slots == 2
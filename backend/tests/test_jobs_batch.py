@@ -0,0 +1,88 @@
+import asyncio
+import httpx
+import pytest
+from fastapi import HTTPException
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy.exc import IntegrityError, OperationalError
+from app.jobs import batch
+from app.jobs.batch import is_transient, run_batch
+from app.shared.locks import LeaseNotAcquired
+from app.config import settings
+
+
+def http_error(status: int, code: str) -> HTTPException:
+    return HTTPException(status_code=status, detail={"error": {"code": code, "message": code}})
+
+
+class FakeSession:
+    opened = 0
+
+    async def __aenter__(self):
+        FakeSession.opened += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+@pytest.fixture(autouse=True)
+def no_database(monkeypatch):
+    FakeSession.opened = 0
+    monkeypatch.setattr(batch, "AsyncSessionLocal", FakeSession)
+    monkeypatch.setattr(settings, "WORKER_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(settings, "WORKER_RETRY_BASE_SECONDS", 0.0)
+
+
+@pytest.mark.parametrize("exc, transient", [
+    (http_error(502, "QUICKBOOKS_UNAVAILABLE"), True),
+    (http_error(429, "QUICKBOOKS_RATE_LIMITED"), True),
+    (http_error(400, "NOT_CONNECTED"), False),
+    (HTTPException(status_code=500, detail="plain"), False),
+    (OperationalError("SELECT 1", {}, Exception("connection reset")), True),
+    (IntegrityError("INSERT", {}, Exception("duplicate key")), False),
+    (RedisConnectionError(), True),
+    (httpx.ConnectError("refused"), True),
+    (asyncio.TimeoutError(), True),
+    (ValueError("bad data"), False),
+])
+def test_is_transient(exc, transient):
+    assert is_transient(exc) is transient
+
+
+def run_with(script: dict[str, list[BaseException | None]]):
+    """Run a batch where each item raises the next scripted error, or succeeds on None."""
+    async def handler(db, item):
+        error = script[item].pop(0)
+        if error is not None:
+            raise error
+
+    return asyncio.run(run_batch("test", list(script), handler))
+
+
+def test_outcomes_are_classified_per_item():
+    report = run_with({
+        "ok": [None],
+        "recovers": [RedisConnectionError(), None],
+        "broken": [ValueError("bad data"), None],
+        "down": [http_error(502, "QUICKBOOKS_UNAVAILABLE")] * 3,
+        "leased": [LeaseNotAcquired()],
+        "syncing": [http_error(409, "SYNC_IN_PROGRESS")],
+    })
+    outcomes = {outcome.key: outcome for outcome in report.outcomes}
+
+    assert (outcomes["ok"].status, outcomes["ok"].attempts) == ("ok", 1)
+    assert (outcomes["recovers"].status, outcomes["recovers"].attempts) == ("ok", 2)
+    assert (outcomes["broken"].status, outcomes["broken"].attempts) == ("failed", 1)
+    assert outcomes["broken"].error == "ValueError: bad data"
+    assert (outcomes["down"].status, outcomes["down"].attempts) == ("failed", 3)
+    assert outcomes["leased"].status == "skipped"
+    assert outcomes["syncing"].status == "skipped"
+    # Every attempt gets a fresh session
+    assert FakeSession.opened == 1 + 2 + 1 + 3 + 1 + 1
+
+
+def test_summary_counts_and_failed_accounts():
+    summary = run_with({"a": [None], "b": [ValueError("bad data")], "c": [LeaseNotAcquired()]}).summary()
+    assert (summary["ok"], summary["skipped"], summary["failed"]) == (1, 1, 1)
+    assert summary["failed_accounts"] == {"b": "ValueError: bad data"}
+    assert summary["job"] == "test"
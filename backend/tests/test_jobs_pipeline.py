@@ -0,0 +1,76 @@
+import asyncio
+import uuid
+from app.jobs.pipeline import begin_stage, dirty_key, enqueue_stage, finish_stage, job_id
+
+BUSINESS = uuid.UUID("11111111-1111-1111-1111-111111111111")
+BASE = job_id("metrics", BUSINESS)
+
+
+class FakeArqRedis:
+    """arq's enqueue contract: a job ID is refused while a job holding it is queued or running."""
+
+    def __init__(self):
+        self.jobs: list[str] = []
+        self.keys: dict[str, object] = {}
+
+    async def enqueue_job(self, function: str, *args, _job_id: str, _defer_by=None):
+        if _job_id in self.jobs:
+            return None
+        self.jobs.append(_job_id)
+        return object()
+
+    def finish(self, job: str) -> None:
+        self.jobs.remove(job)
+
+    async def set(self, key: str, value, ex=None) -> None:
+        self.keys[key] = value
+
+    async def delete(self, key: str) -> int:
+        return 1 if self.keys.pop(key, None) is not None else 0
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_enqueue_while_queued_marks_the_stage_dirty():
+    redis = FakeArqRedis()
+    assert run(enqueue_stage(redis, "metrics", BUSINESS)) is True
+    assert run(enqueue_stage(redis, "metrics", BUSINESS)) is False
+    assert redis.jobs == [BASE]
+    assert dirty_key("metrics", BUSINESS) in redis.keys
+
+
+def test_enqueue_without_rerun_leaves_no_flag():
+    redis = FakeArqRedis()
+    run(enqueue_stage(redis, "activity", BUSINESS, rerun_if_running=False))
+    run(enqueue_stage(redis, "activity", BUSINESS, rerun_if_running=False))
+    assert redis.keys == {}
+
+
+def test_change_during_run_queues_one_follow_up():
+    redis = FakeArqRedis()
+    run(enqueue_stage(redis, "metrics", BUSINESS))
+    run(begin_stage(redis, "metrics", BUSINESS))
+    # A change lands while the run holds its job ID
+    run(enqueue_stage(redis, "metrics", BUSINESS))
+    run(finish_stage(redis, "metrics", BUSINESS, BASE))
+    assert redis.jobs == [BASE, f"{BASE}:again"]
+    assert redis.keys == {}
+
+
+def test_follow_up_alternates_back_to_the_stage_id():
+    redis = FakeArqRedis()
+    redis.jobs.append(f"{BASE}:again")  # a follow-up is running and holds the second ID
+    redis.keys[dirty_key("metrics", BUSINESS)] = 1
+    run(finish_stage(redis, "metrics", BUSINESS, f"{BASE}:again"))
+    assert redis.jobs == [f"{BASE}:again", BASE]
+
+
+def test_changes_before_the_run_starts_need_no_follow_up():
+    redis = FakeArqRedis()
+    run(enqueue_stage(redis, "metrics", BUSINESS))
+    run(enqueue_stage(redis, "metrics", BUSINESS))  # still queued: the run will see this change
+    run(begin_stage(redis, "metrics", BUSINESS))
+    run(finish_stage(redis, "metrics", BUSINESS, BASE))
+    assert redis.jobs == [BASE]
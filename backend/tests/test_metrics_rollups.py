@@ -0,0 +1,90 @@
+from datetime import date
+import numpy as np
+import pytest
+from app.metrics.rollups import COUNTERS, DailyAggregates, bucket_end, bucket_start, derive, rollup_start
+
+
+@pytest.mark.parametrize("day, granularity, start, end", [
+    (date(2025, 3, 14), "daily", date(2025, 3, 14), date(2025, 3, 14)),
+    (date(2025, 1, 1), "weekly", date(2024, 12, 30), date(2025, 1, 5)),
+    (date(2024, 12, 31), "monthly", date(2024, 12, 1), date(2024, 12, 31)),
+    (date(2024, 2, 29), "monthly", date(2024, 2, 1), date(2024, 2, 29)),
+    (date(2025, 2, 10), "monthly", date(2025, 2, 1), date(2025, 2, 28)),
+    (date(2025, 3, 31), "quarterly", date(2025, 1, 1), date(2025, 3, 31)),
+    (date(2025, 4, 1), "quarterly", date(2025, 4, 1), date(2025, 6, 30)),
+    (date(2024, 11, 15), "quarterly", date(2024, 10, 1), date(2024, 12, 31)),
+])
+def test_buckets_cover_calendar_periods(day, granularity, start, end):
+    assert bucket_start(day, granularity) == start
+    assert bucket_end(start, granularity) == end
+
+
+def test_unknown_granularity_is_rejected():
+    with pytest.raises(ValueError):
+        bucket_start(date(2025, 1, 1), "yearly")
+
+
+def test_rollup_start_reaches_back_to_whole_quarter_and_week():
+    # 2025-01-01 is a Wednesday, so the first week of the quarter starts on the Monday before
+    assert rollup_start(date(2025, 2, 20)) == date(2024, 12, 30)
+
+
+def counters(*rows: list[float]) -> np.ndarray:
+    return np.array(rows, dtype=np.float64)
+
+
+def test_rollup_sums_each_bucket():
+    daily = DailyAggregates(
+        days=[date(2025, 1, 30), date(2025, 1, 31), date(2025, 2, 1)],
+        counters=counters([1, 10, 0, 0, 1, 1], [2, 20, 1, 0, 0, 0], [4, 40, 0, 1, 2, 1]),
+    )
+    buckets = daily.rollup("monthly", since=date(2025, 1, 1))
+    assert [(start, end) for start, end, _ in buckets] == [
+        (date(2025, 1, 1), date(2025, 1, 31)),
+        (date(2025, 2, 1), date(2025, 2, 28)),
+    ]
+    assert buckets[0][2].tolist() == [3, 30, 1, 0, 1, 1]
+    assert buckets[1][2].tolist() == [4, 40, 0, 1, 2, 1]
+
+
+def test_rollup_drops_buckets_starting_before_since():
+    daily = DailyAggregates(
+        days=[date(2024, 12, 31), date(2025, 1, 2), date(2025, 4, 1)],
+        counters=counters([1, 1, 0, 0, 0, 0], [1, 1, 0, 0, 0, 0], [1, 1, 0, 0, 0, 0]),
+    )
+    # 2025-01-02 falls in the week starting 2024-12-30, which was only partly aggregated
+    assert [start for start, _, _ in daily.rollup("weekly", since=date(2025, 1, 1))] == [date(2025, 3, 31)]
+    assert [start for start, _, _ in daily.rollup("quarterly", since=date(2025, 1, 1))] == [
+        date(2025, 1, 1), date(2025, 4, 1),
+    ]
+
+
+def test_rollup_without_days_is_empty():
+    assert DailyAggregates(days=[], counters=np.zeros((0, len(COUNTERS)))).rollup("daily", date(2025, 1, 1)) == []
+
+
+def test_window_sums_inclusive_range():
+    daily = DailyAggregates(
+        days=[date(2025, 1, 1), date(2025, 1, 15), date(2025, 1, 31)],
+        counters=counters([1, 0, 0, 0, 0, 0], [2, 0, 0, 0, 0, 0], [4, 0, 0, 0, 0, 0]),
+    )
+    assert daily.window(date(2025, 1, 1), date(2025, 1, 15))[0] == 3
+    assert daily.window(date(2025, 2, 1), date(2025, 2, 28)).tolist() == [0] * len(COUNTERS)
+
+
+def test_derive_computes_ratios_from_summed_counters():
+    figures = derive(np.array([4, 200, 1, 2, 5, 4], dtype=np.float64))
+    assert figures == {
+        "transaction_count": 4,
+        "average_transaction_size": 50.0,
+        "chargeback_count": 2,
+        "chargeback_ratio": 0.5,
+        "refund_count": 1,
+        "refund_ratio": 0.25,
+        "payout_reliability": 0.8,
+    }
+
+
+def test_derive_without_activity_is_none():
+    assert derive(np.zeros(len(COUNTERS))) is None
+    assert derive(np.array([0, 0, 0, 0, 2, 2], dtype=np.float64))["average_transaction_size"] is None
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.shared.database import Base
+from app.shared.models import Business, FinancialMetricSnapshot, IntegrationAccount
+from app.shared.serialization import dumps_str, loads
+from app.quickbooks.backfill import QuickBooksBackfillService
+from app.quickbooks.service import QuickBooksService
+from app.config import settings
+
+# These run against a real Postgres: the races are in jsonb updates, which only the database can show.
+# The schema in TEST_DATABASE_URL is dropped and recreated.
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+MONTHS = 3
+
+
+async def connected_business(sessions) -> uuid.UUID:
+    async with sessions() as db:
+        business = Business(name="Acme")
+        db.add(business)
+        await db.flush()
+        db.add(IntegrationAccount(
+            business_id=business.id,
+            provider="quickbooks",
+            external_id="realm-1",
+            access_token_encrypted="token",
+            token_expires_at=datetime.now(timezone.utc) + timedelta(hours=1),
+            status="active",
+            metadata_={"refresh_token": "refresh", "environment": settings.QUICKBOOKS_ENVIRONMENT, "fiscal_year_start_month": 1},
+        ))
+        await db.commit()
+        return business.id
+
+
+async def saved_months(sessions, business_id: uuid.UUID, count: int) -> None:
+    """Wait until count months are saved; each save runs after its fetch returns."""
+    for _ in range(100):
+        async with sessions() as db:
+            chunks = (await db.execute(
+                select(IntegrationAccount.metadata_["backfill"]["chunks"]).where(IntegrationAccount.business_id == business_id)
+            )).scalar_one()
+        if len(chunks) >= count:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"{count} months were never saved")
+
+
+def run_backfill(monkeypatch, during_fetch) -> tuple[dict, dict, int, int]:
+    """Backfill MONTHS months; during_fetch(call, sessions, business_id) runs inside each month's fetch."""
+    monkeypatch.setattr(settings, "QUICKBOOKS_BACKFILL_MONTHS", MONTHS)
+    monkeypatch.setattr(settings, "QUICKBOOKS_BACKFILL_CONCURRENCY", 1)
+
+    async def scenario():
+        engine = create_async_engine(TEST_DATABASE_URL, json_serializer=dumps_str, json_deserializer=loads)
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.drop_all)
+                await conn.run_sync(Base.metadata.create_all)
+            business_id = await connected_business(sessions)
+            calls = []
+
+            async def fetch_month(self, access_token, realm_id, start, end):
+                calls.append(start)
+                await during_fetch(len(calls), sessions, business_id)
+                return {"revenue": 1000.0, "invoice_count": 10, "credit_memo_count": 1}
+
+            monkeypatch.setattr(QuickBooksService, "fetch_month", fetch_month)
+            async with sessions() as db:
+                progress = await QuickBooksBackfillService(db).run(business_id)
+            async with sessions() as db:
+                metadata = (await db.execute(
+                    select(IntegrationAccount.metadata_).where(IntegrationAccount.business_id == business_id)
+                )).scalar_one()
+                snapshots = (await db.execute(
+                    select(func.count()).select_from(FinancialMetricSnapshot)
+                    .where(FinancialMetricSnapshot.business_id == business_id, FinancialMetricSnapshot.granularity == "monthly")
+                )).scalar_one()
+            return progress, metadata, snapshots, len(calls)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(scenario())
+
+
+def test_sync_during_backfill_keeps_saved_months(monkeypatch):
+    async def profit_and_loss(self, access_token, realm_id, api_base, fiscal_month=1):
+        return {"total_income": 5000.0, "revenue_volatility": 0.1, "mrr": 400.0}
+
+    async def count(self, entity, access_token, realm_id, api_base, where=None):
+        return 7
+
+    monkeypatch.setattr(QuickBooksService, "_fetch_profit_and_loss", profit_and_loss)
+    monkeypatch.setattr(QuickBooksService, "_fetch_count", count)
+    stale = {}
+
+    async def during_fetch(call, sessions, business_id):
+        if call == 1:
+            # The sync loads its copy before any month is saved...
+            stale["db"] = sessions()
+            stale["integration"] = (await stale["db"].execute(
+                select(IntegrationAccount).where(IntegrationAccount.business_id == business_id)
+            )).scalar_one()
+        if call == MONTHS:
+            # ...and writes its figures back after the backfill saved the others
+            await saved_months(sessions, business_id, MONTHS - 1)
+            try:
+                await QuickBooksService(stale["db"])._sync(stale["integration"])
+            finally:
+                await stale["db"].close()
+
+    progress, metadata, snapshots, calls = run_backfill(monkeypatch, during_fetch)
+
+    assert progress == {"status": "complete", "done": MONTHS, "total": MONTHS}
+    assert calls == MONTHS
+    assert len(metadata["backfill"]["chunks"]) == MONTHS
+    assert metadata["financials"]["revenue_total"] == 5000.0
+    assert snapshots == MONTHS
+
+
+def test_missing_months_are_fetched_again(monkeypatch):
+    async def during_fetch(call, sessions, business_id):
+        if call == MONTHS:
+            # A month saved earlier in the run disappears before the backfill finishes
+            await saved_months(sessions, business_id, MONTHS - 1)
+            async with sessions() as db:
+                await db.execute(
+                    text("UPDATE integration_accounts SET metadata = metadata #- "
+                         "ARRAY['backfill', 'chunks', (SELECT min(key) FROM jsonb_object_keys(metadata->'backfill'->'chunks') AS key)] "
+                         "WHERE business_id = :business_id"),
+                    {"business_id": business_id},
+                )
+                await db.commit()
+
+    progress, metadata, snapshots, calls = run_backfill(monkeypatch, during_fetch)
+
+    assert progress == {"status": "complete", "done": MONTHS, "total": MONTHS}
+    assert calls == MONTHS + 1
+    assert len(metadata["backfill"]["chunks"]) == MONTHS
+    assert snapshots == MONTHS
@@ -0,0 +1,133 @@
+import asyncio
+import os
+from datetime import timedelta
+import pytest
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.shared.database import Base
+from app.shared.models import QuickBooksNotification
+from app.shared.serialization import dumps_str, loads
+from app.quickbooks.webhooks import QuickBooksWebhookService
+from app.config import settings
+
+# These run against a real Postgres: claiming relies on FOR UPDATE SKIP LOCKED and server-side time.
+# The schema in TEST_DATABASE_URL is dropped and recreated.
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+BODY = (
+    b'{"eventNotifications": ['
+    b'{"realmId": "1", "dataChangeEvent": {"entities": [{"name": "Invoice"}]}},'
+    b'{"realmId": "1", "dataChangeEvent": {"entities": [{"name": "Payment"}]}},'
+    b'{"realmId": "2", "dataChangeEvent": {"entities": [{"name": "Bill"}]}}]}'
+)
+
+
+@pytest.fixture(autouse=True)
+def retry_settings(monkeypatch):
+    monkeypatch.setattr(settings, "QUICKBOOKS_WEBHOOK_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(settings, "QUICKBOOKS_WEBHOOK_CLAIM_SECONDS", 900)
+    monkeypatch.setattr(settings, "QUICKBOOKS_WEBHOOK_RETRY_BASE_SECONDS", 60)
+    monkeypatch.setattr(settings, "QUICKBOOKS_WEBHOOK_RETRY_MAX_SECONDS", 100)
+
+
+def run(scenario):
+    """Run scenario(sessions) against a freshly created schema."""
+    async def main():
+        engine = create_async_engine(TEST_DATABASE_URL, json_serializer=dumps_str, json_deserializer=loads)
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.drop_all)
+                await conn.run_sync(Base.metadata.create_all)
+            async with sessions() as db:
+                await QuickBooksWebhookService(db).enqueue(BODY)
+            return await scenario(sessions)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+async def make_due(sessions) -> None:
+    async with sessions() as db:
+        await db.execute(update(QuickBooksNotification).values(next_attempt_at=None))
+        await db.commit()
+
+
+def test_claim_coalesces_per_realm_and_leases_the_rows():
+    async def scenario(sessions):
+        async with sessions() as db:
+            first = await QuickBooksWebhookService(db).claim_batch()
+        async with sessions() as db:
+            second = await QuickBooksWebhookService(db).claim_batch()
+        return first, second
+
+    first, second = run(scenario)
+    assert {realm: (entities, len(ids)) for realm, (entities, ids) in first.items()} == {
+        "1": ({"Invoice", "Payment"}, 2),
+        "2": ({"Bill"}, 1),
+    }
+    assert second == {}
+
+
+def test_rows_locked_by_another_drain_are_skipped():
+    async def scenario(sessions):
+        async with sessions() as holder:
+            locked = (await holder.execute(
+                select(QuickBooksNotification.id).where(QuickBooksNotification.realm_id == "1").with_for_update()
+            )).scalars().all()
+            async with sessions() as db:
+                claimed = await QuickBooksWebhookService(db).claim_batch()
+            await holder.rollback()
+        return locked, claimed
+
+    locked, claimed = run(scenario)
+    assert len(locked) == 2
+    assert list(claimed) == ["2"]
+
+
+def test_release_backs_off_exponentially_up_to_the_cap():
+    async def scenario(sessions):
+        waits = []
+        for _ in range(3):
+            await make_due(sessions)
+            async with sessions() as db:
+                service = QuickBooksWebhookService(db)
+                claimed = await service.claim_batch()
+                await service.release([i for _, ids in claimed.values() for i in ids])
+            async with sessions() as db:
+                attempts, wait = (await db.execute(
+                    select(QuickBooksNotification.attempts, QuickBooksNotification.next_attempt_at - func.now())
+                    .where(QuickBooksNotification.realm_id == "2")
+                )).one()
+            waits.append((attempts, wait))
+        return waits
+
+    waits = run(scenario)
+    assert [attempts for attempts, _ in waits] == [1, 2, 3]
+    for (_, wait), expected in zip(waits, [60, 100, 100]):
+        assert timedelta(seconds=expected - 5) < wait <= timedelta(seconds=expected)
+
+
+def test_rows_out_of_attempts_are_no_longer_claimed():
+    async def scenario(sessions):
+        async with sessions() as db:
+            await db.execute(update(QuickBooksNotification).where(QuickBooksNotification.realm_id == "1").values(attempts=3))
+            await db.commit()
+            return await QuickBooksWebhookService(db).claim_batch()
+
+    assert list(run(scenario)) == ["2"]
+
+
+def test_completed_rows_are_not_claimed_again():
+    async def scenario(sessions):
+        async with sessions() as db:
+            service = QuickBooksWebhookService(db)
+            claimed = await service.claim_batch()
+            await service.complete(claimed["1"][1])
+        await make_due(sessions)
+        async with sessions() as db:
+            return await QuickBooksWebhookService(db).claim_batch()
+
+    assert list(run(scenario)) == ["2"]
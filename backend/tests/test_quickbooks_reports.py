@@ -0,0 +1,124 @@
+from datetime import date
+import numpy as np
+import pytest
+from app.quickbooks.reports import fiscal_year_start, fiscal_year_start_month, parse_profit_and_loss, revenue_figures, revenue_volatility
+
+
+def month_column(start: str, end: str) -> dict:
+    return {"ColType": "Money", "MetaData": [{"Name": "StartDate", "Value": start}, {"Name": "EndDate", "Value": end}]}
+
+
+COLUMNS = {"Column": [
+    {"ColType": "Account", "ColTitle": ""},
+    month_column("2025-01-01", "2025-01-31"),
+    month_column("2025-02-01", "2025-02-28"),
+    month_column("2025-03-01", "2025-03-31"),
+    {"ColType": "Money", "ColTitle": "Total"},
+]}
+
+
+def cells(label: str, *values: str) -> list[dict]:
+    return [{"value": label}, *({"value": value} for value in values)]
+
+
+def report(income_summary: list[dict] | None = None) -> dict:
+    income = {
+        "group": "Income",
+        "Header": {"ColData": cells("Income")},
+        "Rows": {"Row": [
+            {"ColData": [{"value": "Sales", "id": "1"}, {"value": "100"}, {"value": "200"}, {"value": "300"}, {"value": "600"}]},
+            {
+                "Header": {"ColData": cells("Services")},
+                "Rows": {"Row": [{"ColData": cells("Consulting", "10", "", "30", "40")}]},
+                "Summary": {"ColData": cells("Total Services", "10", "0", "30", "40")},
+            },
+        ]},
+    }
+    if income_summary is not None:
+        income["Summary"] = {"ColData": income_summary}
+    expenses = {
+        "group": "Expenses",
+        "Rows": {"Row": [{"ColData": cells("Rent", "50", "50", "50", "150")}]},
+        "Summary": {"ColData": cells("Total Expenses", "50", "50", "50", "150")},
+    }
+    return {"Columns": COLUMNS, "Rows": {"Row": [income, expenses]}}
+
+
+def test_parses_month_columns_and_skips_total():
+    parsed = parse_profit_and_loss(report(cells("Total Income", "110", "200", "330", "640")))
+    assert parsed.months == [
+        (date(2025, 1, 1), date(2025, 1, 31)),
+        (date(2025, 2, 1), date(2025, 2, 28)),
+        (date(2025, 3, 1), date(2025, 3, 31)),
+    ]
+    assert parsed.accounts == ["Sales", "Consulting", "Rent"]
+    assert parsed.account_ids == ["1", None, None]
+    assert parsed.groups == ["Income", "Income", "Expenses"]
+    np.testing.assert_array_equal(parsed.values, [[100, 200, 300], [10, 0, 30], [50, 50, 50]])
+    np.testing.assert_array_equal(parsed.revenue_series, [110, 200, 330])
+
+
+def test_short_summary_row_is_padded_per_month():
+    parsed = parse_profit_and_loss(report(cells("Total Income", "110")))
+    np.testing.assert_array_equal(parsed.group_totals["Income"], [110, 0, 0])
+
+
+def test_missing_summary_falls_back_to_account_sum():
+    parsed = parse_profit_and_loss(report())
+    assert "Income" not in parsed.group_totals
+    np.testing.assert_array_equal(parsed.revenue_series, [110, 200, 330])
+    np.testing.assert_array_equal(parsed.group_series("Other Income"), [0, 0, 0])
+
+
+def test_empty_report():
+    parsed = parse_profit_and_loss({})
+    assert parsed.months == []
+    assert parsed.values.shape == (0, 0)
+    assert revenue_figures(parsed, date(2025, 3, 15)) == {
+        "total_income": None, "trailing_income": None, "revenue_volatility": None, "mrr": None,
+    }
+
+
+def test_revenue_volatility_is_coefficient_of_variation():
+    assert revenue_volatility(np.array([100.0, 200.0, 300.0])) == pytest.approx(np.std([100, 200, 300]) / 200)
+    assert revenue_volatility(np.array([100.0, 200.0])) is None
+    assert revenue_volatility(np.array([0.0, 0.0, 0.0])) is None
+
+
+def test_revenue_figures_exclude_month_in_progress():
+    parsed = parse_profit_and_loss(report(cells("Total Income", "100", "200", "300", "600")))
+    figures = revenue_figures(parsed, date(2025, 3, 15))
+    assert figures["total_income"] == 600
+    assert figures["trailing_income"] == 600
+    assert figures["mrr"] == 200
+    assert figures["revenue_volatility"] is None  # two complete months
+
+
+def test_revenue_figures_on_last_day_of_month():
+    parsed = parse_profit_and_loss(report(cells("Total Income", "100", "200", "300", "600")))
+    figures = revenue_figures(parsed, date(2025, 3, 31))
+    assert figures["mrr"] == 300
+    assert figures["revenue_volatility"] == pytest.approx(np.std([100, 200, 300]) / 200)
+
+
+def test_total_income_is_fiscal_year_to_date():
+    parsed = parse_profit_and_loss(report(cells("Total Income", "100", "200", "300", "600")))
+    figures = revenue_figures(parsed, date(2025, 3, 15), fiscal_month=2)
+    assert figures["total_income"] == 500  # February and March
+    assert figures["trailing_income"] == 600
+    assert figures["mrr"] == 200
+
+
+@pytest.mark.parametrize("today, start_month, start", [
+    (date(2025, 3, 15), 1, date(2025, 1, 1)),
+    (date(2025, 3, 15), 3, date(2025, 3, 1)),
+    (date(2025, 3, 15), 4, date(2024, 4, 1)),
+])
+def test_fiscal_year_start(today, start_month, start):
+    assert fiscal_year_start(today, start_month) == start
+
+
+def test_fiscal_year_start_month_from_company_info():
+    assert fiscal_year_start_month({"FiscalYearStartMonth": "April"}) == 4
+    assert fiscal_year_start_month({"FiscalYearStartMonth": "Apr"}) is None
+    assert fiscal_year_start_month({}) is None
@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from app.quickbooks.schedule import CHANGE_RATE_WEIGHT, is_active, sync_interval, update_change_rate
+from app.config import settings
+
+NOW = datetime(2025, 3, 15, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture(autouse=True)
+def intervals(monkeypatch):
+    monkeypatch.setattr(settings, "QUICKBOOKS_SYNC_MIN_INTERVAL_MINUTES", 15)
+    monkeypatch.setattr(settings, "QUICKBOOKS_SYNC_MAX_INTERVAL_MINUTES", 1440)
+    monkeypatch.setattr(settings, "QUICKBOOKS_ACTIVE_WINDOW_HOURS", 24)
+
+
+def test_new_integrations_start_as_always_changing():
+    assert update_change_rate(None, True) == pytest.approx(1.0)
+    assert update_change_rate(None, False) == pytest.approx(1 - CHANGE_RATE_WEIGHT)
+
+
+def test_change_rate_decays_towards_zero_without_changes():
+    rate = None
+    for _ in range(20):
+        rate = update_change_rate(rate, False)
+    assert rate < 0.001
+    assert update_change_rate(rate, True) == pytest.approx(CHANGE_RATE_WEIGHT + (1 - CHANGE_RATE_WEIGHT) * rate)
+
+
+@pytest.mark.parametrize("change_rate, minutes", [
+    (1.0, 15),
+    (0.0, 1440),
+    (0.5, (15 * 1440) ** 0.5),  # geometric midpoint
+])
+def test_interval_is_geometric_in_change_rate(change_rate, minutes):
+    interval = sync_interval(change_rate, None, NOW)
+    assert interval.total_seconds() / 60 == pytest.approx(minutes)
+
+
+def test_recently_viewed_businesses_get_the_minimum():
+    assert sync_interval(0.0, NOW - timedelta(hours=2), NOW) == timedelta(minutes=15)
+    assert sync_interval(0.0, NOW - timedelta(hours=25), NOW) == timedelta(minutes=1440)
+
+
+def test_is_active_window():
+    assert is_active(NOW - timedelta(hours=23), NOW)
+    assert not is_active(NOW - timedelta(hours=24), NOW)
+    assert not is_active(None, NOW)
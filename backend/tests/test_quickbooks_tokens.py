@@ -0,0 +1,98 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.shared.database import Base
+from app.shared.models import Business, IntegrationAccount
+from app.shared.serialization import dumps_str, loads
+from app.quickbooks import tokens
+from app.quickbooks.service import QuickBooksService
+from app.quickbooks.tokens import TokenManager
+
+# These run against a real Postgres: waiters re-read the row a refresh commits.
+# The schema in TEST_DATABASE_URL is dropped and recreated.
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+
+class FakeRedis:
+    """SET NX and the owner-checked release script; expiry is not needed here."""
+
+    def __init__(self):
+        self.values: dict[str, str] = {}
+
+    async def set(self, key: str, value: str, nx: bool = False, px: int | None = None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    def register_script(self, script: str):
+        async def release(keys: list[str], args: list[str]):
+            if self.values.get(keys[0]) == args[0]:
+                del self.values[keys[0]]
+        return release
+
+
+def refresh_concurrently(monkeypatch, managers: list[TokenManager], callers: int) -> tuple[list[str], int]:
+    """Ask every manager for a refresh of one expired integration, callers times each; return tokens and endpoint calls."""
+    redis = FakeRedis()
+    monkeypatch.setattr(tokens, "get_redis", lambda: redis)
+    calls = 0
+
+    async def refresh_access_token(self, integration):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)  # the token endpoint round trip
+        integration.access_token_encrypted = f"token-{calls}"
+        integration.token_expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
+        await self.db.commit()
+        return integration.access_token_encrypted
+
+    monkeypatch.setattr(QuickBooksService, "refresh_access_token", refresh_access_token)
+
+    async def scenario():
+        engine = create_async_engine(TEST_DATABASE_URL, json_serializer=dumps_str, json_deserializer=loads)
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+        monkeypatch.setattr(tokens, "AsyncSessionLocal", sessions)
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.drop_all)
+                await conn.run_sync(Base.metadata.create_all)
+            async with sessions() as db:
+                business = Business(name="Acme")
+                db.add(business)
+                await db.flush()
+                integration = IntegrationAccount(
+                    business_id=business.id,
+                    provider="quickbooks",
+                    external_id="realm-1",
+                    access_token_encrypted="stale",
+                    token_expires_at=datetime.now(timezone.utc) - timedelta(minutes=1),
+                    status="active",
+                    metadata_={"refresh_token": "refresh"},
+                )
+                db.add(integration)
+                await db.commit()
+            return await asyncio.gather(*(
+                manager.refresh(integration.id) for manager in managers for _ in range(callers)
+            ))
+        finally:
+            await engine.dispose()
+
+    results = asyncio.run(scenario())
+    assert redis.values == {}
+    return results, calls
+
+
+def test_concurrent_callers_in_one_process_share_one_refresh(monkeypatch):
+    results, calls = refresh_concurrently(monkeypatch, [TokenManager()], callers=5)
+    assert calls == 1
+    assert results == ["token-1"] * 5
+
+
+def test_workers_share_one_refresh_through_redis(monkeypatch):
+    results, calls = refresh_concurrently(monkeypatch, [TokenManager(), TokenManager()], callers=2)
+    assert calls == 1
+    assert results == ["token-1"] * 4
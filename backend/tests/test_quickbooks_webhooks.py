@@ -0,0 +1,68 @@
+import base64
+import hashlib
+import hmac
+import pytest
+from fastapi import HTTPException
+from app.quickbooks.webhooks import changed_entities, parse_notifications, verify_signature
+from app.config import settings
+
+TOKEN = "verifier-token"
+BODY = b'{"eventNotifications": []}'
+
+
+def signature(body: bytes, token: str = TOKEN) -> str:
+    return base64.b64encode(hmac.new(token.encode(), body, hashlib.sha256).digest()).decode()
+
+
+@pytest.fixture(autouse=True)
+def verifier_token(monkeypatch):
+    monkeypatch.setattr(settings, "QUICKBOOKS_WEBHOOK_VERIFIER_TOKEN", TOKEN)
+
+
+def test_valid_signature_passes():
+    verify_signature(BODY, signature(BODY))
+
+
+@pytest.mark.parametrize("header", [None, "", signature(BODY, "other-token"), signature(BODY + b" ")])
+def test_invalid_signatures_are_rejected(header):
+    with pytest.raises(HTTPException) as raised:
+        verify_signature(BODY, header)
+    assert raised.value.status_code == 401
+
+
+def test_missing_verifier_token_rejects_everything(monkeypatch):
+    monkeypatch.setattr(settings, "QUICKBOOKS_WEBHOOK_VERIFIER_TOKEN", "")
+    with pytest.raises(HTTPException):
+        verify_signature(BODY, signature(BODY, ""))
+
+
+def test_legacy_envelope_is_split_per_realm():
+    body = (
+        b'{"eventNotifications": [{"realmId": "1", "dataChangeEvent": {"entities": [{"name": "Invoice"}, {"name": "Customer"}]}},'
+        b' {"realmId": 2, "dataChangeEvent": {"entities": []}}, {"dataChangeEvent": {}}]}'
+    )
+    notifications = parse_notifications(body)
+    assert [realm for realm, _ in notifications] == ["1", "2"]
+    assert changed_entities(notifications[0][1]) == {"Invoice", "Customer"}
+
+
+def test_cloudevents_array_names_entities_canonically():
+    notifications = parse_notifications(b'[{"intuitaccountid": "9", "type": "qbo.creditmemo.updated.v1"}]')
+    assert notifications[0][0] == "9"
+    assert changed_entities(notifications[0][1]) == {"CreditMemo"}
+
+
+@pytest.mark.parametrize("body", [b"not json", b'"text"', b'{"eventNotifications": {}}', b"[1, 2]"])
+def test_malformed_bodies_are_rejected(body):
+    with pytest.raises(HTTPException) as raised:
+        parse_notifications(body)
+    assert raised.value.status_code == 400
+
+
+@pytest.mark.parametrize("notification", [
+    {"dataChangeEvent": "invoice"},
+    {"dataChangeEvent": {"entities": "Invoice"}},
+    {"dataChangeEvent": {"entities": ["Invoice"]}},
+])
+def test_malformed_notifications_change_nothing(notification):
+    assert changed_entities(notification) == set()
@@ -0,0 +1,126 @@
+import asyncio
+import os
+from datetime import date, timedelta
+from decimal import Decimal
+import pytest
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.shared.database import Base
+from app.shared.models import Business, FinancialMetricSnapshot, Recommendation
+from app.shared.serialization import dumps_str, loads
+from app.recommendations.service import RecommendationsService
+from app.config import settings
+
+# These run against a real Postgres: the upsert is an ON CONFLICT on the fingerprint.
+# The schema in TEST_DATABASE_URL is dropped and recreated.
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+
+def run(scenario):
+    """Run scenario(sessions, business_id) for a business whose chargeback ratio fires one rule."""
+    async def main():
+        engine = create_async_engine(TEST_DATABASE_URL, json_serializer=dumps_str, json_deserializer=loads)
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.drop_all)
+                await conn.run_sync(Base.metadata.create_all)
+            async with sessions() as db:
+                business = Business(name="Acme")
+                db.add(business)
+                await db.flush()
+                db.add(FinancialMetricSnapshot(
+                    business_id=business.id,
+                    period_start=date(2025, 1, 1),
+                    period_end=date(2025, 12, 31),
+                    chargeback_ratio=Decimal("0.05"),
+                ))
+                await db.commit()
+            return await scenario(sessions, business.id)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+async def generate(sessions, business_id) -> bool:
+    async with sessions() as db:
+        return business_id in await RecommendationsService(db).generate_recommendations(business_id)
+
+
+async def rows(sessions) -> list[tuple[str, str]]:
+    async with sessions() as db:
+        return (await db.execute(select(Recommendation.rule_key, Recommendation.status))).all()
+
+
+async def set_chargeback_ratio(sessions, ratio: str) -> None:
+    async with sessions() as db:
+        await db.execute(update(FinancialMetricSnapshot).values(chargeback_ratio=Decimal(ratio)))
+        await db.commit()
+
+
+async def set_status(sessions, status: str, age: timedelta = timedelta()) -> None:
+    async with sessions() as db:
+        await db.execute(update(Recommendation).values(status=status, updated_at=func.now() - age))
+        await db.commit()
+
+
+def test_rerun_updates_in_place_and_reports_no_change():
+    async def scenario(sessions, business_id):
+        first = await generate(sessions, business_id)
+        second = await generate(sessions, business_id)
+        return first, second, await rows(sessions)
+
+    first, second, recs = run(scenario)
+    assert (first, second) == (True, False)
+    assert recs == [("high_chargebacks", "pending")]
+
+
+def test_cleared_condition_expires_and_reopens_when_it_recurs():
+    async def scenario(sessions, business_id):
+        await generate(sessions, business_id)
+        await set_chargeback_ratio(sessions, "0.01")
+        expired = await generate(sessions, business_id), await rows(sessions)
+        await set_chargeback_ratio(sessions, "0.05")
+        reopened = await generate(sessions, business_id), await rows(sessions)
+        return expired, reopened
+
+    expired, reopened = run(scenario)
+    assert expired == (True, [("high_chargebacks", "expired")])
+    assert reopened == (True, [("high_chargebacks", "pending")])
+
+
+def test_dismissed_rows_stay_dismissed_until_the_window_passes():
+    async def scenario(sessions, business_id):
+        await generate(sessions, business_id)
+        await set_status(sessions, "dismissed")
+        recent = await generate(sessions, business_id), await rows(sessions)
+        await set_status(sessions, "dismissed", timedelta(days=settings.RECOMMENDATION_DISMISS_DAYS + 1))
+        old = await generate(sessions, business_id), await rows(sessions)
+        return recent, old
+
+    recent, old = run(scenario)
+    assert recent == (False, [("high_chargebacks", "dismissed")])
+    assert old == (True, [("high_chargebacks", "pending")])
+
+
+def test_accepted_rows_keep_their_status():
+    async def scenario(sessions, business_id):
+        await generate(sessions, business_id)
+        await set_status(sessions, "accepted")
+        await set_chargeback_ratio(sessions, "0.055")  # same band, new description value
+        return await generate(sessions, business_id), await rows(sessions)
+
+    assert run(scenario) == (False, [("high_chargebacks", "accepted")])
+
+
+def test_a_new_band_is_a_new_recommendation():
+    async def scenario(sessions, business_id):
+        await generate(sessions, business_id)
+        await set_status(sessions, "accepted")
+        await set_chargeback_ratio(sessions, "0.09")
+        await generate(sessions, business_id)
+        return sorted(await rows(sessions), key=lambda row: row[1])
+
+    assert run(scenario) == [("high_chargebacks", "accepted"), ("high_chargebacks", "pending")]
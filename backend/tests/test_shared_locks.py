@@ -0,0 +1,100 @@
+import asyncio
+import time
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+from app.shared.locks import RELEASE_LOCK_SCRIPT, RENEW_LOCK_SCRIPT, Lease, LeaseLost, LeaseNotAcquired
+
+TTL = 0.09
+
+
+class FakeRedis:
+    """SET NX PX and the two owner-checked scripts, with expiry on the monotonic clock."""
+
+    def __init__(self):
+        self.values: dict[str, tuple[str, float]] = {}
+        self.down = False
+
+    def get(self, key: str) -> str | None:
+        value = self.values.get(key)
+        if value is None or value[1] <= time.monotonic():
+            self.values.pop(key, None)
+            return None
+        return value[0]
+
+    async def set(self, key: str, value: str, nx: bool = False, px: int | None = None):
+        if nx and self.get(key) is not None:
+            return None
+        self.values[key] = (value, time.monotonic() + px / 1000)
+        return True
+
+    async def eval(self, script: str, numkeys: int, key: str, owner: str, *args):
+        if self.down:
+            raise RedisConnectionError()
+        if self.get(key) != owner:
+            return 0
+        if script == RELEASE_LOCK_SCRIPT:
+            del self.values[key]
+        elif script == RENEW_LOCK_SCRIPT:
+            self.values[key] = (owner, time.monotonic() + int(args[0]) / 1000)
+        return 1
+
+
+def test_held_lease_excludes_others_and_is_released():
+    redis = FakeRedis()
+
+    async def scenario():
+        async with Lease("sync:1", ttl=TTL, redis=redis):
+            with pytest.raises(LeaseNotAcquired):
+                async with Lease("sync:1", ttl=TTL, redis=redis):
+                    pass
+        async with Lease("sync:1", ttl=TTL, redis=redis):
+            pass
+
+    asyncio.run(scenario())
+    assert redis.values == {}
+
+
+def test_renewal_keeps_a_long_holder_leased():
+    redis = FakeRedis()
+
+    async def scenario():
+        async with Lease("sync:1", ttl=TTL, redis=redis):
+            await asyncio.sleep(TTL * 3)
+            return redis.get("lease:sync:1") is not None
+
+    assert asyncio.run(scenario())
+
+
+def test_lost_lease_cancels_the_holder():
+    redis = FakeRedis()
+    reached_end = False
+
+    async def scenario():
+        nonlocal reached_end
+        async with Lease("sync:1", ttl=TTL, redis=redis):
+            redis.values["lease:sync:1"] = ("someone-else", time.monotonic() + 10)
+            await asyncio.sleep(TTL * 3)
+            reached_end = True
+
+    with pytest.raises(LeaseLost):
+        asyncio.run(scenario())
+    assert not reached_end
+    assert redis.get("lease:sync:1") == "someone-else"  # the successor's lock survives
+
+
+def test_redis_outage_is_tolerated_until_the_lease_would_lapse():
+    redis = FakeRedis()
+    progress = []
+
+    async def scenario():
+        async with Lease("sync:1", ttl=TTL, redis=redis):
+            redis.down = True
+            for _ in range(10):
+                await asyncio.sleep(TTL / 4)
+                progress.append(time.monotonic())
+
+    started = time.monotonic()
+    with pytest.raises(LeaseLost):
+        asyncio.run(scenario())
+    # The failed renewals at a third and two thirds of the TTL let the holder carry on
+    assert progress[-1] - started >= TTL * 2 / 3
@@ -0,0 +1,127 @@
+import hashlib
+import hmac
+import time
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+import pytest
+from fastapi import HTTPException
+from app.stripe.service import ledger_entry, verify_signature
+from app.config import settings
+
+SECRET = "whsec_test"
+BODY = b'{"id": "evt_1", "type": "charge.succeeded"}'
+INTEGRATION = uuid.UUID("22222222-2222-2222-2222-222222222222")
+BUSINESS = uuid.UUID("33333333-3333-3333-3333-333333333333")
+CREATED = 1_740_000_000
+
+
+def at(seconds: int) -> datetime:
+    return datetime.fromtimestamp(seconds, tz=timezone.utc)
+
+
+def signature(body: bytes, timestamp: int, secret: str = SECRET) -> str:
+    return hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+
+
+@pytest.fixture(autouse=True)
+def webhook_secret(monkeypatch):
+    monkeypatch.setattr(settings, "STRIPE_WEBHOOK_SECRET", SECRET)
+    monkeypatch.setattr(settings, "STRIPE_WEBHOOK_TOLERANCE_SECONDS", 300)
+
+
+def test_valid_signature_passes():
+    now = int(time.time())
+    verify_signature(BODY, f"t={now},v1={signature(BODY, now)}")
+
+
+def test_any_matching_v1_passes_during_secret_rotation():
+    now = int(time.time())
+    verify_signature(BODY, f"t={now},v1={signature(BODY, now, 'whsec_old')},v1={signature(BODY, now)}")
+
+
+@pytest.mark.parametrize("header", [
+    None,
+    "",
+    "v1=abc",
+    "t=notanumber,v1=abc",
+    "t={now}",
+    "t={now},v1={wrong_secret}",
+    "t={now},v1={tampered}",
+    "t={stale},v1={stale_signature}",
+])
+def test_invalid_signatures_are_rejected(header):
+    now = int(time.time())
+    stale = now - 301
+    if header:
+        header = header.format(
+            now=now,
+            wrong_secret=signature(BODY, now, "whsec_other"),
+            tampered=signature(BODY + b" ", now),
+            stale=stale,
+            stale_signature=signature(BODY, stale),
+        )
+    with pytest.raises(HTTPException) as raised:
+        verify_signature(BODY, header)
+    assert raised.value.status_code == 401
+
+
+def test_missing_secret_rejects_everything(monkeypatch):
+    monkeypatch.setattr(settings, "STRIPE_WEBHOOK_SECRET", "")
+    now = int(time.time())
+    with pytest.raises(HTTPException):
+        verify_signature(BODY, f"t={now},v1={signature(BODY, now, '')}")
+
+
+def payload(obj: dict, created: int | None = CREATED) -> dict:
+    return {"account": "acct_1", "created": created, "object": obj}
+
+
+def test_charge_amount_is_in_major_units():
+    entry = ledger_entry(
+        payload({"id": "ch_1", "object": "charge", "amount": 1999, "currency": "usd", "status": "succeeded", "created": CREATED - 60}),
+        INTEGRATION, BUSINESS,
+    )
+    assert entry["entry_type"] == "charge"
+    assert entry["external_id"] == "ch_1"
+    assert entry["amount"] == Decimal("19.99")
+    assert entry["occurred_at"] == at(CREATED - 60)
+    assert entry["source_updated_at"] == at(CREATED)
+    assert entry["settled_at"] is None
+    assert (entry["business_id"], entry["integration_id"]) == (BUSINESS, INTEGRATION)
+
+
+def test_zero_decimal_currencies_are_not_divided():
+    entry = ledger_entry(payload({"id": "ch_2", "object": "charge", "amount": 500, "currency": "JPY"}), INTEGRATION, BUSINESS)
+    assert entry["amount"] == Decimal(500)
+
+
+def test_paid_payout_is_settled_at_the_event_time():
+    entry = ledger_entry(
+        payload({"id": "po_1", "object": "payout", "amount": 100, "currency": "usd", "status": "paid", "arrival_date": CREATED + 86400}),
+        INTEGRATION, BUSINESS,
+    )
+    assert entry["entry_type"] == "payout"
+    assert entry["due_at"] == at(CREATED + 86400)
+    assert entry["settled_at"] == at(CREATED)
+
+
+def test_pending_payout_is_not_settled():
+    entry = ledger_entry(payload({"id": "po_2", "object": "payout", "status": "in_transit"}), INTEGRATION, BUSINESS)
+    assert entry["settled_at"] is None
+
+
+@pytest.mark.parametrize("obj", [
+    {"id": "cus_1", "object": "customer"},
+    {"object": "charge", "amount": 100},
+    {},
+])
+def test_untracked_or_incomplete_objects_have_no_entry(obj):
+    assert ledger_entry(payload(obj), INTEGRATION, BUSINESS) is None
+
+
+def test_missing_timestamps_fall_back_to_now():
+    before = datetime.now(timezone.utc)
+    entry = ledger_entry(payload({"id": "re_1", "object": "refund", "amount": 50}, created=None), INTEGRATION, BUSINESS)
+    assert entry["occurred_at"] >= before
+    assert entry["occurred_at"] == entry["source_updated_at"]
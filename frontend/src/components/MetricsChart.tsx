@@ -62,7 +62,7 @@ export default function MetricsChart({ businessId, type = 'revenue', metrics: ex
           return;
         }
 
-        const data: any = await getMetricHistory(bid);
+        const data: any = await getMetricHistory(bid, undefined, undefined, 'monthly');
         setInternalMetrics(data.metrics || []);
       } catch {
         setError('Failed to load metrics');
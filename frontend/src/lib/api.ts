@@ -105,10 +105,18 @@ export async function getLatestMetrics(businessId: string) {
   return apiRequest(`/metrics?business_id=${businessId}`);
 }
 
-export async function getMetricHistory(businessId: string, startDate?: string, endDate?: string) {
+export type MetricGranularity = 'trailing' | 'daily' | 'weekly' | 'monthly' | 'quarterly';
+
+export async function getMetricHistory(
+  businessId: string,
+  startDate?: string,
+  endDate?: string,
+  granularity: MetricGranularity = 'trailing',
+) {
   let url = `/metrics/history?business_id=${businessId}`;
   if (startDate) url += `&start_date=${startDate}`;
   if (endDate) url += `&end_date=${endDate}`;
+  url += `&granularity=${granularity}`;
   return apiRequest(url);
 }
 